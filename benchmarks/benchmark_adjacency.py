@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""Compare neighbor lookups, enrichment and memory of the adjacency index with the ones of the database and the ORM.
+
+Run with ``python benchmarks/benchmark_adjacency.py [count]``.
+"""
+
+import gc
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pybel import BELGraph
+from pybel.dsl import Abundance
+from sqlalchemy.orm import selectinload
+from synthetic import iter_synthetic_records
+
+from bio2bel_hmdb.adjacency import RELATIONS
+from bio2bel_hmdb.enrich import enrich_metabolites_diseases, enrich_metabolites_proteins
+from bio2bel_hmdb.loader import get_loader
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Metabolite, Protein
+
+#: The number of keys that are looked up
+KEYS = 1000
+#: The number of metabolites in the enriched graph
+GRAPH_SIZE = 100
+
+
+def measure_orm_memory(manager):
+    """Measure the memory of the metabolites with the relations of the adjacency index loaded with the ORM."""
+    manager.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+
+    options = [
+        selectinload(relation).joinedload(node_type)
+        for relation, (_, node_type, _) in RELATIONS.items()
+    ]
+    metabolites = manager.session.query(Metabolite).options(*options).all()
+    memory, _ = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+    del metabolites
+    manager.session.expunge_all()
+    return memory
+
+
+def time_per_key(function, keys):
+    """Get the average time in microseconds of calling the function with each key."""
+    t = time.perf_counter()
+    for key in keys:
+        function(key)
+    return (time.perf_counter() - t) / len(keys) * 1e6
+
+
+def time_enrichment(manager, accessions):
+    """Time enriching a graph of metabolites with their proteins and diseases."""
+    graph = BELGraph()
+    for accession in accessions:
+        graph.add_node_from_data(Abundance('HMDB', accession))
+
+    manager.session.expunge_all()
+    t = time.perf_counter()
+    enrich_metabolites_proteins(graph, manager)
+    enrich_metabolites_diseases(graph, manager)
+    return time.perf_counter() - t, graph.number_of_edges()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    logging.disable(logging.WARNING)
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    index_path = path + '.adjacency'
+    manager = Manager('sqlite:///' + path)
+
+    try:
+        loader = get_loader(manager.session)
+        for record in iter_synthetic_records(count):
+            loader.add(record)
+        loader.commit()
+
+        rng = random.Random(0)
+        accessions = rng.sample([accession for accession, in manager.session.query(Metabolite.accession)], KEYS)
+        uniprot_ids = rng.sample([uniprot_id for uniprot_id, in manager.session.query(Protein.uniprot_id)], KEYS)
+
+        orm_memory = measure_orm_memory(manager)
+
+        def query_metabolite(key):
+            manager.session.expunge_all()
+            manager.query_metabolite_associated_proteins(key)
+
+        def query_protein(key):
+            manager.session.expunge_all()
+            manager.query_protein_associated_metabolites(key)
+
+        database_times = [
+            time_per_key(query_metabolite, accessions),
+            time_per_key(query_protein, uniprot_ids),
+        ]
+        database_enrichment = time_enrichment(manager, accessions[:GRAPH_SIZE])
+
+        t = time.time()
+        index = manager.build_adjacency_index(index_path)
+        print('built the index of {} metabolites in {:.2f} seconds'.format(count, time.time() - t))
+
+        index = manager.load_adjacency_index(index_path)
+        index_times = [
+            time_per_key(lambda key: index.get_neighbors('proteins', key), accessions),
+            time_per_key(lambda key: index.get_neighbors('proteins', key, reverse=True), uniprot_ids),
+        ]
+        index_enrichment = time_enrichment(manager, accessions[:GRAPH_SIZE])
+        assert index_enrichment[1] == database_enrichment[1]
+
+        print('{:<36} {:>14} {:>14}'.format('', 'database', 'index'))
+        for name, database_time, index_time in zip(
+                ('proteins of a metabolite', 'metabolites of a protein'), database_times, index_times):
+            print('{:<36} {:>12.1f}us {:>12.1f}us'.format(name, database_time, index_time))
+        print('{:<36} {:>13.3f}s {:>13.3f}s'.format(
+            'enrich {} metabolites'.format(GRAPH_SIZE), database_enrichment[0], index_enrichment[0]))
+        print('{:<36} {:>12.1f}MB {:>12.1f}MB'.format(
+            'memory (ORM / arrays)', orm_memory / 1024 / 1024, index.nbytes / 1024 / 1024))
+        print('{:<36} {:>14} {:>12.1f}MB'.format('file', '', os.path.getsize(index_path) / 1024 / 1024))
+
+    finally:
+        manager.session.close()
+        os.remove(path)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""Compare the latency of the lookups in a database without the indexes on the relation tables and with them.
+
+Run with ``python benchmarks/benchmark_indexes.py [count] [connection]``. The default count is about the number of
+metabolites in the full HMDB. The database is loaded without the indexes, like one created by an older version, and
+they are added in place with :meth:`bio2bel_hmdb.manager.Manager.create_indexes` between the two rounds of lookups.
+The tables of the connection are dropped afterwards.
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from synthetic import iter_synthetic_records
+
+from bio2bel_hmdb.loader import get_loader
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Base, Disease, Metabolite, Protein
+
+#: The number of keys in each lookup
+KEYS = 20
+#: The number of times each lookup is repeated
+REPEATS = 5
+
+
+def load_without_indexes(manager, count):
+    """Load synthetic records into a database that has none of the indexes of the models."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(manager.engine)
+
+    loader = get_loader(manager.session)
+    for record in iter_synthetic_records(count):
+        loader.add(record)
+    loader.commit()
+
+
+def get_lookups(manager):
+    """Get the lookups to time, each with a random sample of the keys it looks up."""
+    rng = random.Random(0)
+
+    def sample(column):
+        return rng.sample([value for value, in manager.session.query(column).distinct()], KEYS)
+
+    accessions = sample(Metabolite.accession)
+    uniprot_ids = sample(Protein.uniprot_id)
+    disease_names = sample(Disease.name)
+
+    return [
+        ('metabolites', lambda: manager.get_metabolites_by_accessions(accessions)),
+        ('metabolites -> proteins', lambda: manager.query_metabolites_associated_proteins(accessions)),
+        ('proteins -> metabolites', lambda: manager.query_proteins_associated_metabolites(uniprot_ids)),
+        ('diseases -> metabolites', lambda: manager.query_diseases_associated_metabolites(disease_names)),
+        ('protein.metabolites', lambda: [
+            protein.metabolites
+            for protein in manager.session.query(Protein).filter(Protein.uniprot_id.in_(uniprot_ids))
+        ]),
+    ]
+
+
+def time_lookup(manager, lookup):
+    """Get the median time of a lookup, starting each time with an empty identity map."""
+    times = []
+    for _ in range(REPEATS):
+        manager.session.expunge_all()
+        t = time.time()
+        lookup()
+        times.append(time.time() - t)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 220_000
+    connection = sys.argv[2] if len(sys.argv) > 2 else None
+    logging.disable(logging.WARNING)
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    manager = Manager(connection or 'sqlite:///' + path)
+    manager.drop_all()
+    manager.create_all()
+
+    try:
+        t = time.time()
+        load_without_indexes(manager, count)
+        print('loaded {} metabolites in {:.2f} seconds'.format(manager.count_metabolites(), time.time() - t))
+
+        lookups = get_lookups(manager)
+        before = [time_lookup(manager, lookup) for _, lookup in lookups]
+
+        t = time.time()
+        names = manager.create_indexes()
+        print('created {} indexes in {:.2f} seconds'.format(len(names), time.time() - t))
+
+        after = [time_lookup(manager, lookup) for _, lookup in lookups]
+
+        print('{:<24} {:>10} {:>10} {:>8}'.format('lookup of {} keys'.format(KEYS), 'before', 'after', 'speedup'))
+        for (name, _), before_time, after_time in zip(lookups, before, after):
+            print('{:<24} {:>9.1f}ms {:>9.1f}ms {:>7.0f}x'.format(
+                name, 1000 * before_time, 1000 * after_time, before_time / after_time,
+            ))
+
+    finally:
+        manager.session.close()
+        manager.drop_all()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""Compare parsing metabolite elements with the chain of tag comparisons to parsing them with the dispatch table.
+
+The metabolites of the test data are replicated to build the elements. Run with
+``python benchmarks/benchmark_parser.py [copies]``.
+"""
+
+import logging
+import sys
+import time
+
+from synthetic import TEST_DATA_PATH
+
+from bio2bel_hmdb.parser import _get_dicts, _get_tag, _get_texts, iter_metabolites, log, parse_metabolite
+
+
+def _parse_disease_chain(element):
+    """Convert a disease element like the parser used to."""
+    disease = {}
+    for sub_element in element:
+        tag = _get_tag(sub_element.tag)
+        if tag == "references":
+            disease[tag] = _get_dicts(sub_element)
+        else:
+            disease[tag] = sub_element.text
+    return disease
+
+
+def parse_metabolite_chain(element):
+    """Convert a metabolite element by stripping the namespace of each tag and comparing it, like the parser used to."""
+    metabolite = {}
+    record = {'metabolite': metabolite}
+
+    for sub_element in element:
+        tag = _get_tag(sub_element.tag)
+
+        if tag == "wikipidia":
+            log.warning("HMDB fixed the 'wikipidia' tag to 'wikipedia'. Change code.")
+            tag = "wikipedia"
+
+        if tag == "secondary_accessions":
+            record['secondary_accessions'] = _get_texts(sub_element)
+        elif tag == "synonyms":
+            record['synonyms'] = list(dict.fromkeys(_get_texts(sub_element)))
+        elif tag == "taxonomy":
+            continue
+        elif tag == "ontology":
+            continue
+        elif tag == "cellular_locations":
+            record['cellular_locations'] = _get_texts(sub_element)
+        elif tag == "experimental_properties":
+            continue
+        elif tag == "predicted_properties":
+            continue
+        elif tag == "spectra":
+            continue
+        elif tag == "biospecimen_locations":
+            record['biofluids'] = _get_texts(sub_element)
+        elif tag == "tissue_locations":
+            record['tissues'] = _get_texts(sub_element)
+        elif tag == "pathways":
+            record['pathways'] = _get_dicts(sub_element)
+        elif tag == "normal_concentrations":
+            continue
+        elif tag == "abnormal_concentrations":
+            continue
+        elif tag == "diseases":
+            record['diseases'] = [_parse_disease_chain(disease_element) for disease_element in sub_element]
+        elif tag == "general_references":
+            record['references'] = _get_dicts(sub_element)
+        elif tag == "protein_associations":
+            record['proteins'] = _get_dicts(sub_element)
+        else:
+            metabolite[tag] = sub_element.text
+
+    return record
+
+
+def get_elements(copies):
+    """Get the metabolite elements of the test data, each repeated the given number of times."""
+    elements = []
+    for element in iter_metabolites(TEST_DATA_PATH):
+        # iter_metabolites clears the element when the next one is requested, so keep a copy of the children
+        copy = element.makeelement(element.tag, element.attrib)
+        copy.extend(list(element))
+        elements.append(copy)
+    return elements * copies
+
+
+def benchmark(parse, elements):
+    """Time parsing the elements."""
+    t = time.time()
+    for element in elements:
+        parse(element)
+    return time.time() - t
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logging.disable(logging.WARNING)  # the test data has the wikipidia typo
+    elements = get_elements(copies)
+
+    assert all(parse_metabolite(element) == parse_metabolite_chain(element) for element in elements[:3])
+
+    for name, parse in (('chain', parse_metabolite_chain), ('table', parse_metabolite)):
+        elapsed = benchmark(parse, elements)
+        print('{:5} {:8d} metabolites in {:6.2f} seconds ({:9.0f} metabolites/second)'.format(
+            name, len(elements), elapsed, len(elements) / elapsed,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""Compare writing metabolite records with the ORM's unit of work to writing them with the bulk insert loader.
+
+Run with ``python benchmarks/benchmark_populate.py [count]``.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import iter_synthetic_records
+
+from bio2bel_hmdb.loader import Loader, VOCABULARIES
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import (
+    Disease, Metabolite, MetaboliteDiseaseReference, MetaboliteSynonym, Reference, SecondaryAccession,
+)
+
+
+def populate_orm(manager, records):
+    """Write the records by adding one ORM object per row to the session, like populate used to."""
+    session = manager.session
+    vocabularies = {model: {} for _, model, _, _, _ in VOCABULARIES + [(None, Disease, None, None, None)]}
+
+    def get_instance(model, key, **values):
+        instance = vocabularies[model].get(key)
+        if instance is None:
+            instance = vocabularies[model][key] = model(**values)
+            session.add(instance)
+        return instance
+
+    for record in records:
+        metabolite = Metabolite(**{
+            column: value
+            for column, value in record['metabolite'].items()
+            if hasattr(Metabolite, column)
+        })
+        session.add(metabolite)
+
+        for value in record.get('secondary_accessions', []):
+            session.add(SecondaryAccession(metabolite=metabolite, secondary_accession=value))
+        for value in record.get('synonyms', []):
+            session.add(MetaboliteSynonym(metabolite=metabolite, synonym=value))
+
+        for key, model, column, relation_model, relation_column in VOCABULARIES:
+            for value in record.get(key, []):
+                values = value if isinstance(value, dict) else {column: value}
+                instance = get_instance(model, values[column], **values)
+                session.add(relation_model(metabolite=metabolite, **{relation_column[:-len('_id')]: instance}))
+
+        for disease in record.get('diseases', []):
+            disease_instance = get_instance(Disease, disease['name'], name=disease['name'])
+            for reference in disease.get('references', []):
+                session.add(MetaboliteDiseaseReference(
+                    metabolite=metabolite,
+                    disease=disease_instance,
+                    reference=get_instance(Reference, reference['reference_text'], **reference),
+                ))
+
+    session.commit()
+
+
+def populate_bulk(manager, records):
+    """Write the records with the bulk insert loader."""
+    loader = Loader(manager.session)
+    for record in records:
+        loader.add(record)
+    loader.flush()
+    manager.session.commit()
+
+
+def count_rows(manager):
+    """Count the rows in all tables."""
+    return sum(
+        manager.session.query(table).count()
+        for table in manager._metadata.sorted_tables
+    )
+
+
+def benchmark(populate, count):
+    """Time writing the given number of synthetic records into a new SQLite database."""
+    records = list(iter_synthetic_records(count))
+
+    fd, path = tempfile.mkstemp()
+    manager = Manager('sqlite:///' + path)
+    manager.create_all()
+
+    t = time.time()
+    populate(manager, records)
+    elapsed = time.time() - t
+
+    rows = count_rows(manager)
+    manager.session.close()
+    os.close(fd)
+    os.remove(path)
+
+    return rows, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+    for name, populate in (('orm', populate_orm), ('bulk', populate_bulk)):
+        rows, elapsed = benchmark(populate, count)
+        print('{:5} {:8d} rows in {:6.2f} seconds ({:9.0f} rows/second)'.format(name, rows, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
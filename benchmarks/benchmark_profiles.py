@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""Compare populating a database with each of the ingest profiles.
+
+Run with ``python benchmarks/benchmark_profiles.py [count]``.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_xml
+
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.parser import PROFILES
+
+
+def count_rows(manager):
+    """Count the rows in all tables."""
+    return sum(
+        manager.session.query(table).count()
+        for table in manager._metadata.sorted_tables
+    )
+
+
+def benchmark(source, profile):
+    """Time populating a new SQLite database from the source with the given profile."""
+    fd, path = tempfile.mkstemp()
+    manager = Manager('sqlite:///' + path)
+    manager.create_all()
+
+    t = time.time()
+    manager.populate(source, map_dis=False, profile=profile)
+    elapsed = time.time() - t
+
+    rows = count_rows(manager)
+    manager.session.close()
+    os.close(fd)
+    os.remove(path)
+
+    return rows, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    logging.disable(logging.WARNING)
+
+    fd, source = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    write_synthetic_xml(source, count)
+
+    try:
+        for profile in PROFILES:
+            rows, elapsed = benchmark(source, profile)
+            print('{:8} {:8d} rows in {:6.2f} seconds'.format(profile, rows, elapsed))
+    finally:
+        os.remove(source)
+
+
+if __name__ == '__main__':
+    main()
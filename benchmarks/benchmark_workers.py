@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""Compare populating one database with a growing number of worker processes.
+
+Run with ``python benchmarks/benchmark_workers.py [connection] [count]``. The connection should be an empty
+PostgreSQL database, since SQLite serializes the transactions of the workers. Its tables are dropped afterwards.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import write_synthetic_xml
+
+from bio2bel_hmdb.manager import Manager
+
+
+def benchmark(connection, source, workers):
+    """Time populating the database from the source with the given number of workers."""
+    manager = Manager(connection)
+    manager.drop_all()
+    manager.create_all()
+
+    t = time.time()
+    if workers:
+        manager.populate_distributed(source, workers=workers, map_dis=False, shard_size=1 << 20)
+    else:
+        manager.populate(source, map_dis=False)
+    elapsed = time.time() - t
+
+    count = manager.count_metabolites()
+    manager.session.close()
+    manager.drop_all()
+
+    return count, elapsed
+
+
+def main():
+    connection = sys.argv[1] if len(sys.argv) > 1 else None
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 6000
+    logging.disable(logging.WARNING)
+
+    fd, source = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    write_synthetic_xml(source, count)
+
+    database_fd, database_path = tempfile.mkstemp()
+    os.close(database_fd)
+    connection = connection or 'sqlite:///' + database_path
+
+    try:
+        for workers in [0] + sorted({1, 2, 4, os.cpu_count()}):
+            count, elapsed = benchmark(connection, source, workers)
+            print('{:>8} {:8d} metabolites in {:6.2f} seconds'.format(workers or 'populate', count, elapsed))
+    finally:
+        os.remove(source)
+        os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
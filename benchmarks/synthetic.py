@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""Utilities for generating synthetic HMDB data of arbitrary size from the test data."""
+
+import copy
+import itertools
+import os
+import re
+
+from bio2bel_hmdb.parser import iter_records
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+TEST_DATA_PATH = os.path.join(HERE, os.pardir, 'tests', 'test_data.xml')
+
+
+def _suffix_values(instances, suffix, *columns):
+    """Append the suffix to the given columns of the instances of a shared table."""
+    for instance in instances:
+        for column in columns:
+            if instance.get(column) is not None:
+                instance[column] += suffix
+
+
+def iter_synthetic_records(count, vocabulary_size=1000):
+    """Iterate over metabolite records made by renaming copies of the records in the test data.
+
+    :param int count: The number of records
+    :param int vocabulary_size: The number of distinct copies of the values of the shared tables, like the proteins
+    :rtype: iter[dict]
+    """
+    templates = list(iter_records(TEST_DATA_PATH))
+
+    for i in range(count):
+        record = copy.deepcopy(templates[i % len(templates)])
+        suffix = '-{}'.format(i)
+        vocabulary_suffix = '-{}'.format(i % vocabulary_size)
+
+        record['metabolite']['accession'] = 'HMDB{:07d}'.format(i)
+        record['secondary_accessions'] = [value + suffix for value in record.get('secondary_accessions', [])]
+        record['synonyms'] = [value + suffix for value in record.get('synonyms', [])]
+
+        for key in ('cellular_locations', 'biofluids', 'tissues'):
+            record[key] = [value + vocabulary_suffix for value in record.get(key, [])]
+
+        _suffix_values(record.get('pathways', []), vocabulary_suffix, 'name')
+        _suffix_values(record.get('proteins', []), vocabulary_suffix, 'protein_accession', 'uniprot_id')
+        _suffix_values(record.get('references', []), vocabulary_suffix, 'reference_text', 'pubmed_id')
+        _suffix_values(record.get('diseases', []), vocabulary_suffix, 'name')
+        for disease in record.get('diseases', []):
+            _suffix_values(disease.get('references', []), vocabulary_suffix, 'reference_text', 'pubmed_id')
+
+        yield record
+
+
+def write_synthetic_xml(path, count):
+    """Write an HMDB .xml file with copies of the metabolites in the test data, renaming their unique values.
+
+    :param str path: The path of the new file
+    :param int count: The number of metabolites
+    """
+    with open(TEST_DATA_PATH) as file:
+        content = file.read()
+
+    start = content.index('<metabolite>')
+    end = content.rindex('</metabolite>') + len('</metabolite>')
+    templates = re.findall(r'<metabolite>.*?</metabolite>', content[start:end], flags=re.DOTALL)
+
+    with open(path, 'w') as file:
+        file.write(content[:start])
+
+        for i, template in zip(range(count), itertools.cycle(templates)):
+            suffix = '-{}'.format(i)
+            metabolite = re.sub(r'(</update_date>\s*<accession>)[^<]+', r'\g<1>HMDB{:07d}'.format(i), template)
+            metabolite = re.sub(r'(<secondary_accessions>\s*<accession>)([^<]+)', r'\1\2' + suffix, metabolite)
+            metabolite = re.sub(r'<synonym>([^<]+)', r'<synonym>\1' + suffix, metabolite)
+            file.write(metabolite)
+            file.write('\n')
+
+        file.write(content[end:])
@@ -14,6 +14,7 @@ INSTALL_REQUIRES = [
     'pybel>=0.13.1',
     'bio2bel>=0.2.0',
     'pandas',
+    'numpy',
     'click',
     'sqlalchemy',
     'requests',
@@ -21,6 +22,7 @@ INSTALL_REQUIRES = [
 ]
 EXTRAS_REQUIRE = {
     'web': ['flask', 'flask_admin'],
+    'lxml': ['lxml'],
 }
 ENTRY_POINTS = {
     'bio2bel': [
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+
+"""The adjacency index holds the relations of the metabolites to the proteins, diseases, pathways, tissues and biofluids
+in compressed sparse row (CSR) arrays, so the neighbors of a node are found without the database or the ORM.
+
+Each kind of node is a table of arrays, sorted by the column with which its nodes are looked up, like the accession of
+the metabolites. A node is identified by its position in this order. The strings of each column are stored as one
+array of UTF-8 bytes and an array of the offsets of the strings. Each relation is stored twice, once from the
+metabolites to the other nodes and once in reverse. Both directions list the neighbors of each node in the order of
+the primary keys of the relation rows, like the relationships of the models, so a node with several relation rows to
+the same neighbor lists it once for each of them.
+
+An index is saved as one file, which starts with :data:`ADJACENCY_MAGIC`, followed by the length of a JSON header as
+an 8 byte unsigned integer, the header with the data type, shape and position of each array, and the arrays. The arrays
+are aligned so they can be used directly from a memory-mapped file.
+"""
+
+import json
+import logging
+import struct
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from .lookup_cache import Snapshot
+from .models import (
+    Biofluid, Disease, Metabolite, MetaboliteBiofluid, MetaboliteDiseaseReference, MetabolitePathway,
+    MetaboliteProtein, MetaboliteTissue, Pathway, Protein, Reference, Tissue,
+)
+
+__all__ = [
+    'AdjacencyIndex',
+]
+
+log = logging.getLogger(__name__)
+
+#: The start of each adjacency index file, which changes with its layout
+ADJACENCY_MAGIC = b'HMDBADJ1'
+#: The length of the JSON header after the magic
+HEADER_LENGTH = struct.Struct('>Q')
+#: The alignment of the arrays in an adjacency index file
+ALIGNMENT = 64
+
+#: The models of the nodes, with the column by which they are sorted and looked up and their other columns
+NODES = {
+    'metabolite': (Metabolite, 'accession', ['name']),
+    'protein': (Protein, 'uniprot_id', ['protein_accession', 'name', 'protein_type']),
+    'disease': (Disease, 'name', ['omim_id']),
+    'pathway': (Pathway, 'name', ['smpdb_id', 'kegg_map_id']),
+    'tissue': (Tissue, 'tissue', []),
+    'biofluid': (Biofluid, 'biofluid', []),
+    'reference': (Reference, 'pubmed_id', []),
+}
+
+#: The relations of the metabolites by the name of their relationship, with their model, the kind of the other nodes
+#: and the kinds of nodes that are stored with each edge
+RELATIONS = {
+    'proteins': (MetaboliteProtein, 'protein', []),
+    'diseases': (MetaboliteDiseaseReference, 'disease', ['reference']),
+    'pathways': (MetabolitePathway, 'pathway', []),
+    'tissues': (MetaboliteTissue, 'tissue', []),
+    'biofluids': (MetaboliteBiofluid, 'biofluid', []),
+}
+
+
+def _encode_strings(values):
+    """Encode strings as their concatenated UTF-8 bytes, the offsets of the strings and a mask of the missing ones.
+
+    :param list[Optional[str]] values: Strings or None
+    :rtype: tuple[numpy.ndarray,numpy.ndarray,numpy.ndarray]
+    """
+    encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    nulls = np.array([value is None for value in values], dtype=bool)
+
+    return data, offsets, nulls
+
+
+def _get_csr(rows, columns, size):
+    """Get the pointers of the rows and the order of the edges of a CSR structure, keeping the order of the edges within
+    each row.
+
+    :param numpy.ndarray rows: The row of each edge
+    :param numpy.ndarray columns: The column of each edge
+    :param int size: The number of rows
+    :return: The position of the first edge of each row, followed by the number of edges, the columns of the edges in
+             the order of the rows and the position of each of these edges in the given arrays
+    :rtype: tuple[numpy.ndarray,numpy.ndarray,numpy.ndarray]
+    """
+    order = np.argsort(rows, kind='stable').astype(np.int64)
+
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+
+    return indptr, columns[order].astype(np.int32), order
+
+
+class _Strings(object):
+    """A read-only sequence of the strings in an array of UTF-8 bytes."""
+
+    def __init__(self, data, offsets, nulls):
+        # indexing and slicing memoryviews is much faster than indexing and slicing arrays
+        self.data = memoryview(data)
+        self.offsets = memoryview(offsets)
+        self.nulls = memoryview(nulls)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_bytes(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+    def __getitem__(self, index):
+        if self.nulls[index]:
+            return None
+        return self.get_bytes(index).decode('utf-8')
+
+
+class _Keys(object):
+    """The sorted UTF-8 keys of a table, which are compared as bytes by :mod:`bisect`."""
+
+    def __init__(self, strings):
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, index):
+        return self.strings.get_bytes(index)
+
+
+class AdjacencyIndex(object):
+    """The relations of the metabolites in CSR arrays, with the nodes in sorted arrays of their columns."""
+
+    def __init__(self, arrays: Mapping[str, np.ndarray]):
+        """
+        :param arrays: The arrays of the index by their name, like the ones read by :meth:`load`
+        """
+        self.arrays = arrays
+
+        self.columns = {
+            node_type: {
+                column: _Strings(
+                    arrays['{}.{}.data'.format(node_type, column)],
+                    arrays['{}.{}.offsets'.format(node_type, column)],
+                    arrays['{}.{}.nulls'.format(node_type, column)],
+                )
+                for column in [key] + columns
+            }
+            for node_type, (_, key, columns) in NODES.items()
+        }
+
+        #: The range of the positions of the nodes with a key. The nodes without one are sorted first.
+        self.key_ranges = {
+            node_type: (
+                int(np.count_nonzero(arrays['{}.{}.nulls'.format(node_type, key)])),
+                len(arrays['{}.id'.format(node_type)]),
+            )
+            for node_type, (_, key, _) in NODES.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes of the arrays."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @classmethod
+    def from_session(cls, session) -> 'AdjacencyIndex':
+        """Read the nodes and the relations from the database of a session, reading each table once.
+
+        :param sqlalchemy.orm.Session session: A session of a populated database
+        """
+        arrays = {}
+        id_to_position = {}
+
+        for node_type, (model, key, columns) in NODES.items():
+            table = model.__table__
+            rows = session.execute(select([table.c.id, table.c[key]] + [table.c[column] for column in columns]))
+            rows = sorted(rows, key=lambda row: (row[1] is not None, (row[1] or '').encode('utf-8'), row[0]))
+
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            arrays['{}.id'.format(node_type)] = ids
+            for i, column in enumerate([key] + columns, start=1):
+                data, offsets, nulls = _encode_strings([row[i] for row in rows])
+                arrays['{}.{}.data'.format(node_type, column)] = data
+                arrays['{}.{}.offsets'.format(node_type, column)] = offsets
+                arrays['{}.{}.nulls'.format(node_type, column)] = nulls
+
+            # position 0 stands for a missing foreign key, since the primary keys start at 1
+            id_to_position[node_type] = np.full(int(ids.max(initial=0)) + 1, -1, dtype=np.int32)
+            id_to_position[node_type][ids] = np.arange(len(ids), dtype=np.int32)
+
+        metabolite_count = len(arrays['metabolite.id'])
+
+        for relation, (model, node_type, edge_types) in RELATIONS.items():
+            table = model.__table__
+            foreign_keys = [table.c['{}_id'.format(edge_type)] for edge_type in edge_types]
+
+            query = select(
+                [table.c.id, table.c.metabolite_id, table.c['{}_id'.format(node_type)]] +
+                [func.coalesce(column, 0) for column in foreign_keys]
+            ).where(
+                table.c.metabolite_id.isnot(None) & table.c['{}_id'.format(node_type)].isnot(None)
+            ).order_by(table.c.id)
+            edges = np.array(session.execute(query).fetchall(), dtype=np.int64).reshape(-1, 3 + len(edge_types))
+
+            rows = id_to_position['metabolite'][edges[:, 1]]
+            columns = id_to_position[node_type][edges[:, 2]]
+
+            indptr, indices, order = _get_csr(rows, columns, metabolite_count)
+            arrays['{}.indptr'.format(relation)] = indptr
+            arrays['{}.indices'.format(relation)] = indices
+            arrays['{}.id'.format(relation)] = edges[order, 0]
+            for i, edge_type in enumerate(edge_types, start=3):
+                arrays['{}.{}'.format(relation, edge_type)] = id_to_position[edge_type][edges[order, i]]
+
+            # the reverse edges are in the order of the relation rows too, and point to the position of the same edge
+            # in the forward arrays
+            reverse_indptr, reverse_indices, reverse_order = _get_csr(
+                columns, rows, len(arrays['{}.id'.format(node_type)]),
+            )
+            forward_positions = np.empty_like(order)
+            forward_positions[order] = np.arange(len(order), dtype=np.int64)
+            arrays['{}.reverse_indptr'.format(relation)] = reverse_indptr
+            arrays['{}.reverse_indices'.format(relation)] = reverse_indices
+            arrays['{}.reverse_edges'.format(relation)] = forward_positions[reverse_order]
+
+        index = cls(arrays)
+        log.info('built adjacency index of %.1f MB', index.nbytes / 1024 / 1024)
+        return index
+
+    def save(self, path: str) -> None:
+        """Save the index to a file, which can be memory-mapped by :meth:`load`.
+
+        :param path: The path of the file
+        """
+        header = {}
+        offset = 0
+        for name, array in sorted(self.arrays.items()):
+            header[name] = [array.dtype.str, list(array.shape), offset]
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        encoded_header = json.dumps(header).encode('utf-8')
+        start = len(ADJACENCY_MAGIC) + HEADER_LENGTH.size + len(encoded_header)
+        start += -start % ALIGNMENT
+
+        with open(path, 'wb') as file:
+            file.write(ADJACENCY_MAGIC)
+            file.write(HEADER_LENGTH.pack(len(encoded_header)))
+            file.write(encoded_header)
+            for name, (_, _, array_offset) in header.items():
+                file.seek(start + array_offset)
+                file.write(np.ascontiguousarray(self.arrays[name]).tobytes())
+
+            file.truncate(start + offset)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'AdjacencyIndex':
+        """Load an index from a file written by :meth:`save`.
+
+        :param path: The path of the file
+        :param mmap: Should the file be memory-mapped instead of read into memory? Then the pages of the arrays are
+                     read on demand and shared between the processes that load the same file.
+        :raises ValueError: If the file is not an adjacency index
+        """
+        with open(path, 'rb') as file:
+            if file.read(len(ADJACENCY_MAGIC)) != ADJACENCY_MAGIC:
+                raise ValueError('{} is not an adjacency index'.format(path))
+            header_length, = HEADER_LENGTH.unpack(file.read(HEADER_LENGTH.size))
+            header = json.loads(file.read(header_length).decode('utf-8'))
+
+        start = len(ADJACENCY_MAGIC) + HEADER_LENGTH.size + header_length
+        start += -start % ALIGNMENT
+
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            buffer = np.fromfile(path, dtype=np.uint8)
+
+        arrays = {}
+        for name, (dtype, shape, offset) in header.items():
+            dtype = np.dtype(dtype)
+            size = dtype.itemsize * int(np.prod(shape))
+            # plain arrays on the same memory, since indexing a memmap is slow
+            arrays[name] = buffer[start + offset:start + offset + size].view(np.ndarray).view(dtype).reshape(shape)
+
+        return cls(arrays)
+
+    def get_positions(self, node_type: str, key: str) -> range:
+        """Get the positions of the nodes with a key, which is empty if there are none.
+
+        :param node_type: A kind of node from :data:`NODES`, like ``metabolite``
+        :param key: The value of the key column of the nodes, like the accession of a metabolite
+        """
+        keys = _Keys(self.columns[node_type][NODES[node_type][1]])
+        low, high = self.key_ranges[node_type]
+        encoded = key.encode('utf-8')
+        start = stop = bisect_left(keys, encoded, low, high)
+        while stop < high and keys[stop] == encoded:
+            stop += 1
+        return range(start, stop)
+
+    def get_value(self, node_type: str, column: str, position: int) -> Optional[str]:
+        """Get the value of a column of a node.
+
+        :param node_type: A kind of node from :data:`NODES`
+        :param column: The key column or one of the other columns of the nodes
+        :param position: The position of the node
+        """
+        return self.columns[node_type][column][position]
+
+    def get_id(self, node_type: str, position: int) -> int:
+        """Get the primary key of a node in the database.
+
+        :param node_type: A kind of node from :data:`NODES`
+        :param position: The position of the node
+        """
+        return int(self.arrays['{}.id'.format(node_type)][position])
+
+    def get_edges(self, relation: str, position: int, reverse: bool = False) -> np.ndarray:
+        """Get the positions of the edges of a node in the arrays of the edges of a relation.
+
+        :param relation: A relation from :data:`RELATIONS`
+        :param position: The position of a metabolite, or of a node of the other kind if reverse
+        :param reverse: Should the edges of a node of the other kind be found?
+        """
+        if reverse:
+            indptr = self.arrays['{}.reverse_indptr'.format(relation)]
+            return self.arrays['{}.reverse_edges'.format(relation)][indptr[position]:indptr[position + 1]]
+
+        indptr = self.arrays['{}.indptr'.format(relation)]
+        return np.arange(indptr[position], indptr[position + 1])
+
+    def get_neighbor_positions(self, relation: str, position: int, reverse: bool = False) -> np.ndarray:
+        """Get the positions of the neighbors of a node.
+
+        :param relation: A relation from :data:`RELATIONS`
+        :param position: The position of a metabolite, or of a node of the other kind if reverse
+        :param reverse: Should the metabolites of a node of the other kind be found?
+        """
+        prefix = 'reverse_' if reverse else ''
+        indptr = self.arrays['{}.{}indptr'.format(relation, prefix)]
+        return self.arrays['{}.{}indices'.format(relation, prefix)][indptr[position]:indptr[position + 1]]
+
+    def get_neighbors(self, relation: str, key: str, reverse: bool = False) -> Optional[List[str]]:
+        """Get the keys of the neighbors of the nodes with a key.
+
+        :param relation: A relation from :data:`RELATIONS`, like ``proteins``
+        :param key: The accession of a metabolite, or the key of a node of the other kind if reverse
+        :param reverse: Should the metabolites of a node of the other kind be found?
+        :return: The keys of the neighbors, in the order of the relation rows, or None if there is no such node
+
+        Example:
+
+        >>> index.get_neighbors('proteins', 'HMDB00008')
+        >>> index.get_neighbors('proteins', 'P50440', reverse=True)
+        """
+        node_type = RELATIONS[relation][1]
+        source_type, target_type = (node_type, 'metabolite') if reverse else ('metabolite', node_type)
+
+        positions = self.get_positions(source_type, key)
+        if not positions:
+            return None
+
+        neighbors = self.columns[target_type][NODES[target_type][1]]
+        return [
+            neighbors[neighbor]
+            for position in positions
+            for neighbor in self.get_neighbor_positions(relation, position, reverse=reverse)
+        ]
+
+    def get_node(self, node_type: str, position: int) -> Snapshot:
+        """Get a node as a snapshot of its model with the columns of the index.
+
+        :param node_type: A kind of node from :data:`NODES`
+        :param position: The position of the node
+        """
+        model = NODES[node_type][0]
+        values = {
+            column: strings[position]
+            for column, strings in self.columns[node_type].items()
+        }
+        values['id'] = self.get_id(node_type, position)
+        return Snapshot(model, values)
+
+    def _query(self, relation: str, keys: Iterable[str], reverse: bool = False) -> Dict[str, Optional[List[Snapshot]]]:
+        """Get the relations of the nodes with many keys as snapshots, like the query methods of the manager.
+
+        :param relation: A relation from :data:`RELATIONS`
+        :param keys: The accessions of metabolites, or the keys of the nodes of the other kind if reverse
+        :param reverse: Should the relations of the nodes of the other kind be found?
+        """
+        model, node_type, edge_types = RELATIONS[relation]
+        source_type, target_type = (node_type, 'metabolite') if reverse else ('metabolite', node_type)
+        edge_ids = self.arrays['{}.id'.format(relation)]
+
+        results = {}
+        for key in keys:
+            if key in results:
+                continue
+
+            positions = self.get_positions(source_type, key)
+            if not positions:
+                results[key] = None
+                continue
+
+            associations = results[key] = []
+            for position in positions:
+                source = self.get_node(source_type, position)
+                edges = self.get_edges(relation, position, reverse=reverse)
+                targets = self.get_neighbor_positions(relation, position, reverse=reverse)
+
+                for edge, target in zip(edges, targets):
+                    values = {
+                        'id': int(edge_ids[edge]),
+                        source_type: source,
+                        target_type: self.get_node(target_type, target),
+                    }
+                    for edge_type in edge_types:
+                        edge_position = self.arrays['{}.{}'.format(relation, edge_type)][edge]
+                        values[edge_type] = None if edge_position < 0 else self.get_node(edge_type, edge_position)
+
+                    associations.append(Snapshot(model, values))
+
+        return results
+
+    def query_metabolites_associated_proteins(self, hmdb_metabolite_ids: Iterable[str]):
+        """Get the metabolite-protein relations of many metabolites, like
+        :meth:`bio2bel_hmdb.manager.Manager.query_metabolites_associated_proteins`.
+
+        :param hmdb_metabolite_ids: HMDB metabolite identifiers
+        :rtype: dict[str,Optional[list[Snapshot]]]
+        """
+        return self._query('proteins', hmdb_metabolite_ids)
+
+    def query_proteins_associated_metabolites(self, uniprot_ids: Iterable[str]):
+        """Get the metabolite-protein relations of many proteins, like
+        :meth:`bio2bel_hmdb.manager.Manager.query_proteins_associated_metabolites`.
+
+        :param uniprot_ids: UniProt identifiers
+        :rtype: dict[str,Optional[list[Snapshot]]]
+        """
+        return self._query('proteins', uniprot_ids, reverse=True)
+
+    def query_metabolites_associated_diseases(self, hmdb_metabolite_ids: Iterable[str]):
+        """Get the metabolite-disease relations of many metabolites, like
+        :meth:`bio2bel_hmdb.manager.Manager.query_metabolites_associated_diseases`.
+
+        :param hmdb_metabolite_ids: HMDB metabolite identifiers
+        :rtype: dict[str,Optional[list[Snapshot]]]
+        """
+        return self._query('diseases', hmdb_metabolite_ids)
+
+    def query_diseases_associated_metabolites(self, disease_names: Iterable[str]):
+        """Get the metabolite-disease relations of many diseases, like
+        :meth:`bio2bel_hmdb.manager.Manager.query_diseases_associated_metabolites`.
+
+        :param disease_names: HMDB disease names
+        :rtype: dict[str,Optional[list[Snapshot]]]
+        """
+        return self._query('diseases', disease_names, reverse=True)
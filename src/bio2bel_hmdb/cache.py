@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""The record cache stores the metabolite records from :mod:`bio2bel_hmdb.parser` in a compact binary file, so the
+HMDB .xml file only has to be parsed once for several populations.
+
+The cache of a source is named after the hash of its content. It starts with :data:`RECORD_CACHE_MAGIC` followed by
+one frame per record, which is the length of the pickled record as a 4 byte unsigned integer and the pickled record.
+The hash of a source is only computed once, see :func:`get_source_hash`, so finding the cache does not read the source.
+
+The cache is written by :func:`cache_records` or by :meth:`bio2bel_hmdb.manager.Manager.populate` with ``cache=True``,
+which parse the records while streaming the source. :func:`bio2bel_hmdb.parser.get_data` does not write it, since it
+builds the tree of the whole file that the records are meant to avoid.
+"""
+
+import json
+import logging
+import os
+import pickle
+import struct
+
+from .constants import RECORD_CACHE_DIR
+from .parser import _ensure_data, _read_metadata, get_sha256, iter_records
+
+__all__ = [
+    'get_source_hash',
+    'get_record_cache_path',
+    'iter_cached_records',
+    'write_records',
+    'cache_records',
+]
+
+log = logging.getLogger(__name__)
+
+#: The start of each record cache, which changes with the layout of the file or of the records
+RECORD_CACHE_MAGIC = b'HMDBREC1'
+#: The length of the pickled record before each frame
+FRAME_HEADER = struct.Struct('>I')
+#: The file in the cache directory with the hashes of the sources that were not downloaded
+SOURCE_HASHES_NAME = 'sources.json'
+
+
+def _read_source_hashes(path):
+    """Read the hashes of the sources by their absolute paths, with the size and modification time of each one.
+
+    :param str path: The path of the file with the hashes
+    :rtype: dict[str,dict]
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_source_hashes(path, source_hashes):
+    """Write the hashes of the sources, replacing the previous file at once.
+
+    :param str path: The path of the file with the hashes
+    :param dict[str,dict] source_hashes: The hashes of the sources like from :func:`_read_source_hashes`
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = path + '.part'
+
+    with open(temporary_path, 'w') as file:
+        json.dump(source_hashes, file)
+
+    os.replace(temporary_path, path)
+
+
+def get_source_hash(path, directory=None):
+    """Get the SHA-256 hash of the content of a file, reading it only if the hash is not known yet.
+
+    The hash of a file downloaded by :func:`bio2bel_hmdb.parser.download_data` is the one stored with it. The hashes of
+    other files are stored in the cache directory with their size and modification time, and computed again once
+    either of them changes.
+
+    :param str path: The path to a file
+    :param Optional[str] directory: The directory of the caches. Defaults to :data:`RECORD_CACHE_DIR`.
+    :rtype: str
+    """
+    stat = os.stat(path)
+
+    metadata = _read_metadata(path)
+    if metadata is not None and metadata.get('sha256') and metadata.get('size') == stat.st_size:
+        return metadata['sha256']
+
+    source_hashes_path = os.path.join(directory or RECORD_CACHE_DIR, SOURCE_HASHES_NAME)
+    source_hashes = _read_source_hashes(source_hashes_path)
+
+    key = os.path.abspath(path)
+    entry = source_hashes.get(key)
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+
+    log.info('hashing %s', path)
+    sha256 = get_sha256(path)
+
+    source_hashes[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+    _write_source_hashes(source_hashes_path, source_hashes)
+
+    return sha256
+
+
+def get_record_cache_path(source=None, directory=None, force_download=False):
+    """Get the path of the record cache of a source, which might not exist yet.
+
+    :param Optional[str] source: String representing the filename of a .xml file or of a compressed one. If None the
+                                 full HMDB metabolite .xml will be downloaded.
+    :param Optional[str] directory: The directory of the caches. Defaults to :data:`RECORD_CACHE_DIR`.
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :rtype: str
+    """
+    if not source:
+        source = _ensure_data(force_download=force_download)
+
+    source_hash = get_source_hash(source, directory=directory)
+    return os.path.join(directory or RECORD_CACHE_DIR, 'records-{}.bin'.format(source_hash))
+
+
+def iter_cached_records(path):
+    """Iterate over the records in a record cache.
+
+    :param str path: The path to a record cache
+    :rtype: iter[dict]
+    :raises ValueError: If the file is not a record cache or is truncated
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(RECORD_CACHE_MAGIC)) != RECORD_CACHE_MAGIC:
+            raise ValueError('{} is not a record cache'.format(path))
+
+        for header in iter(lambda: file.read(FRAME_HEADER.size), b''):
+            if len(header) < FRAME_HEADER.size:
+                raise ValueError('{} is truncated'.format(path))
+
+            size, = FRAME_HEADER.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                raise ValueError('{} is truncated'.format(path))
+
+            yield pickle.loads(data)
+
+
+def write_records(records, path):
+    """Write records to a record cache while passing them through.
+
+    The cache is written to a temporary file that is moved to the path once all records were consumed, so an
+    interrupted population never leaves an incomplete cache behind.
+
+    :param iter[dict] records: The records
+    :param str path: The path of the record cache
+    :rtype: iter[dict]
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = path + '.part'
+
+    complete = False
+    try:
+        with open(temporary_path, 'wb') as file:
+            file.write(RECORD_CACHE_MAGIC)
+
+            for record in records:
+                data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                file.write(FRAME_HEADER.pack(len(data)))
+                file.write(data)
+                yield record
+
+        complete = True
+
+    finally:
+        if complete:
+            os.replace(temporary_path, path)
+            log.info('wrote the record cache %s', path)
+        elif os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def cache_records(source=None, directory=None, force_download=False, **kwargs):
+    """Parse a source into its record cache, unless the cache already exists.
+
+    :param Optional[str] source: String representing the filename of a .xml file or of a compressed one. If None the
+                                 full HMDB metabolite .xml will be downloaded.
+    :param Optional[str] directory: The directory of the caches. Defaults to :data:`RECORD_CACHE_DIR`.
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param kwargs: Keyword arguments passed to :func:`bio2bel_hmdb.parser.iter_records`
+    :return: The path of the record cache
+    :rtype: str
+    """
+    if not source:
+        source = _ensure_data(force_download=force_download)
+
+    path = get_record_cache_path(source, directory=directory)
+
+    if not os.path.exists(path):
+        for _ in write_records(iter_records(source, **kwargs), path):
+            pass
+
+    return path
@@ -1,8 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import click
+
 from .manager import Manager
 
 main = Manager.get_cli()
 
+
+@main.command()
+@click.pass_obj
+def index(manager):
+    """Add the missing indexes to an existing database."""
+    for name in manager.create_indexes():
+        click.echo('Created {}'.format(name))
+
+
 if __name__ == '__main__':
     main()
@@ -12,10 +12,34 @@ DEFAULT_CACHE_CONNECTION = get_connection(MODULE_NAME)
 DATA_URL = 'http://www.hmdb.ca/system/downloads/current/hmdb_metabolites.zip'
 DATA_PATH = os.path.join(DATA_DIR, 'hmdb_metabolites.zip')
 DATA_FILE_UNZIPPED = os.path.join(DATA_DIR, 'hmdb_metabolites.xml')
+#: The directory of the caches of the parsed records, see :mod:`bio2bel_hmdb.cache`
+RECORD_CACHE_DIR = os.path.join(DATA_DIR, 'records')
+#: The directory of the caches of the disease ontologies, see :mod:`bio2bel_hmdb.ontologies`
+ONTOLOGY_CACHE_DIR = os.path.join(DATA_DIR, 'ontologies')
+
+#: The namespace of the elements in the HMDB .xml files
+HMDB_NAMESPACE = 'http://www.hmdb.ca'
 
 SWEAT_URL = 'http://www.hmdb.ca/system/downloads/current/sweat_metabolites.zip'
+#: The path to which the sweat dataset is downloaded
+SWEAT_PATH = os.path.join(DATA_DIR, 'sweat_metabolites.zip')
 SWEAT_FILE = 'sweat_metabolites.xml'
 
+#: The name of the dataset of the full HMDB metabolite .xml file
+HMDB_DATASET = 'hmdb_metabolites'
+#: The name of the dataset of the metabolites found in sweat
+SWEAT_DATASET = 'sweat_metabolites'
+#: The URLs of the HMDB datasets that can be given by their names as the sources of a population
+DATASET_URLS = {
+    HMDB_DATASET: DATA_URL,
+    SWEAT_DATASET: SWEAT_URL,
+}
+#: The paths to which the files of the HMDB datasets are downloaded, by their URLs
+DATASET_PATHS = {
+    DATA_URL: DATA_PATH,
+    SWEAT_URL: SWEAT_PATH,
+}
+
 DOID = 'disease-ontology'
 HP = 'hp'
 MESHD = 'mesh-diseases'
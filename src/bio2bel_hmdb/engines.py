@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""The engines wrap the XML libraries used by :mod:`bio2bel_hmdb.parser`.
+
+The :class:`StdlibEngine` uses :mod:`xml.etree.ElementTree` from the standard library. The :class:`LxmlEngine` uses
+:mod:`lxml.etree` if it is installed, which is faster and is chosen automatically then.
+"""
+
+import logging
+import xml.etree.ElementTree as ET
+
+from .constants import HMDB_NAMESPACE
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+__all__ = [
+    'StdlibEngine',
+    'LxmlEngine',
+    'ENGINES',
+    'get_engine',
+]
+
+log = logging.getLogger(__name__)
+
+#: The tags of the metabolite elements, with and without the HMDB namespace
+METABOLITE_TAGS = ('{{{}}}metabolite'.format(HMDB_NAMESPACE), 'metabolite')
+
+
+class StdlibEngine(object):
+    """Parses with :mod:`xml.etree.ElementTree` from the standard library."""
+
+    name = 'stdlib'
+
+    def parse(self, file):
+        """Parse a whole file.
+
+        :param file: A file opened for binary reading
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        return ET.parse(file)
+
+    def fromstring(self, data):
+        """Parse a document.
+
+        :param bytes data: The content of an .xml file
+        :return: The root element
+        """
+        return ET.fromstring(data)
+
+    def iter_metabolite_events(self, file, skip_tags=frozenset()):
+        """Iterate over the start and end events of the metabolite elements, which are the children of the root.
+
+        Each metabolite element is cleared from the tree when the next event is requested after its end event.
+
+        :param file: A file like with a ``read`` method returning bytes
+        :param frozenset[str] skip_tags: The tags of the children of the metabolites that are cleared as soon as they
+                                         are parsed
+        :rtype: iter[tuple[str,xml.etree.ElementTree.Element]]
+        """
+        context = ET.iterparse(file, events=('start', 'end'))
+        _, root = next(context)  # the first event is the start of the root element
+
+        depth = 0
+        for event, element in context:
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    yield event, element
+                continue
+
+            depth -= 1
+            if depth == 0:  # only the direct children of the root are metabolites
+                yield event, element
+                root.clear()
+            elif depth == 1 and element.tag in skip_tags:
+                element.clear()
+
+
+class LxmlEngine(object):
+    """Parses with :mod:`lxml.etree`, letting libxml2 filter the events of the metabolite elements."""
+
+    name = 'lxml'
+
+    def __init__(self):
+        if etree is None:
+            raise ImportError('the lxml engine needs lxml to be installed')
+
+    @staticmethod
+    def _get_parser():
+        """Get a parser that drops comments and processing instructions, which would be iterated like elements."""
+        return etree.XMLParser(huge_tree=True, remove_comments=True, remove_pis=True)
+
+    def parse(self, file):
+        """Parse a whole file.
+
+        :param file: A file opened for binary reading
+        :rtype: lxml.etree._ElementTree
+        """
+        return etree.parse(file, parser=self._get_parser())
+
+    def fromstring(self, data):
+        """Parse a document.
+
+        :param bytes data: The content of an .xml file
+        :return: The root element
+        """
+        return etree.fromstring(data, parser=self._get_parser())
+
+    def iter_metabolite_events(self, file, skip_tags=frozenset()):
+        """Iterate over the start and end events of the metabolite elements, which are the children of the root.
+
+        Each metabolite element is cleared, and deleted with its preceding siblings, when the next event is requested
+        after its end event.
+
+        :param file: A file like with a ``read`` method returning bytes
+        :param frozenset[str] skip_tags: Ignored, since lxml only creates Python objects for the elements that are
+                                         accessed. Subscribing to the events of the skipped elements to clear them
+                                         would cost more time than it saves.
+        :rtype: iter[tuple[str,lxml.etree._Element]]
+        """
+        context = etree.iterparse(
+            file,
+            events=('start', 'end'),
+            tag=METABOLITE_TAGS,
+            huge_tree=True,
+            remove_comments=True,
+            remove_pis=True,
+        )
+
+        for event, element in context:
+            yield event, element
+
+            if event == 'end':
+                element.clear()
+                parent = element.getparent()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+#: The engines by their names
+ENGINES = {
+    engine.name: engine
+    for engine in (StdlibEngine, LxmlEngine)
+}
+
+
+def get_engine(engine=None):
+    """Get a parser engine.
+
+    :param engine: The name of an engine in :data:`ENGINES`, an engine, or None for the lxml engine if lxml is
+                   installed and the standard library engine otherwise
+    :rtype: StdlibEngine or LxmlEngine
+    :raises ValueError: If there is no engine with the given name
+    """
+    if engine is None:
+        engine = 'stdlib' if etree is None else 'lxml'
+
+    if not isinstance(engine, str):
+        return engine
+
+    engine_cls = ENGINES.get(engine)
+    if engine_cls is None:
+        raise ValueError('unknown parser engine {}. Use one of: {}'.format(engine, ', '.join(ENGINES)))
+
+    return engine_cls()
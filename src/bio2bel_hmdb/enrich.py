@@ -75,6 +75,13 @@ def _check_namespaces(data, bel_function, bel_namespace):
         return False
 
 
+def _get_associations(manager):
+    """Get the adjacency index of the manager if it has one, which answers the queries without the database."""
+    if manager.adjacency_index is not None:
+        return manager.adjacency_index
+    return manager
+
+
 # enrich proteins and metabolites
 @in_place_transformation
 def enrich_metabolites_proteins(graph: BELGraph, manager: Optional[Manager] = None):
@@ -82,11 +89,11 @@ def enrich_metabolites_proteins(graph: BELGraph, manager: Optional[Manager] = No
     if manager is None:
         manager = Manager()
 
-    for node in list(graph):
-        if _check_namespaces(node, ABUNDANCE, 'HMDB'):
-            metabolite_protein_interactions = manager.query_metabolite_associated_proteins(node[NAME])
-        else:
-            continue
+    nodes = [node for node in list(graph) if _check_namespaces(node, ABUNDANCE, 'HMDB')]
+    interactions = _get_associations(manager).query_metabolites_associated_proteins(node[NAME] for node in nodes)
+
+    for node in nodes:
+        metabolite_protein_interactions = interactions[node[NAME]]
 
         if not metabolite_protein_interactions:
             log.warning("Unable to find node: %s", node)
@@ -117,11 +124,11 @@ def enrich_proteins_metabolites(graph: BELGraph, manager: Optional[Manager] = No
     if manager is None:
         manager = Manager()
 
-    for node in list(graph):
-        if _check_namespaces(node, PROTEIN, 'UP'):
-            protein_metabolite_interactions = manager.query_protein_associated_metabolites(node[NAME])
-        else:
-            continue
+    nodes = [node for node in list(graph) if _check_namespaces(node, PROTEIN, 'UP')]
+    interactions = _get_associations(manager).query_proteins_associated_metabolites(node[NAME] for node in nodes)
+
+    for node in nodes:
+        protein_metabolite_interactions = interactions[node[NAME]]
 
         if protein_metabolite_interactions is None:
             log.warning("Unable to find node: %s", node)
@@ -152,11 +159,11 @@ def enrich_metabolites_diseases(graph: BELGraph, manager: Optional[Manager] = No
     if manager is None:
         manager = Manager()
 
-    for data in list(graph):
-        if _check_namespaces(data, ABUNDANCE, 'HMDB'):
-            metabolite_disease_interactions = manager.query_metabolite_associated_diseases(data[NAME])
-        else:
-            continue
+    nodes = [data for data in list(graph) if _check_namespaces(data, ABUNDANCE, 'HMDB')]
+    interactions = _get_associations(manager).query_metabolites_associated_diseases(data[NAME] for data in nodes)
+
+    for data in nodes:
+        metabolite_disease_interactions = interactions[data[NAME]]
 
         if metabolite_disease_interactions is None:
             log.warning("Unable to find node: %s", data)
@@ -202,11 +209,11 @@ def enrich_diseases_metabolites(graph: BELGraph, manager: Optional[Manager] = No
     if manager is None:
         manager = Manager()
 
-    for data in list(graph):
-        if _check_namespaces(data, PATHOLOGY, 'HMDB_D'):
-            disease_metabolite_interactions = manager.query_disease_associated_metabolites(data[NAME])
-        else:
-            continue
+    nodes = [data for data in list(graph) if _check_namespaces(data, PATHOLOGY, 'HMDB_D')]
+    interactions = _get_associations(manager).query_diseases_associated_metabolites(data[NAME] for data in nodes)
+
+    for data in nodes:
+        disease_metabolite_interactions = interactions[data[NAME]]
 
         if not disease_metabolite_interactions:
             log.warning("Unable to find node: %s", data)
@@ -0,0 +1,936 @@
+# -*- coding: utf-8 -*-
+
+"""The loader converts the metabolite records from :mod:`bio2bel_hmdb.parser` into plain row tuples with pre-assigned
+primary keys and writes them table by table with bulk inserts, avoiding the overhead of the ORM's unit of work.
+
+The :class:`UpsertLoader` lets the database assign the primary keys instead, so several processes can load parts of
+the data into the same database at the same time.
+"""
+
+import io
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import Index, MetaData, UniqueConstraint, func, inspect, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from .models import (
+    Base, Biofluid, CellularLocation, Checkpoint, Dataset, Disease, Metabolite, MetaboliteBiofluid,
+    MetaboliteCellularLocation, MetaboliteDataset, MetaboliteDiseaseReference, MetabolitePathway, MetaboliteProtein,
+    MetaboliteReference, MetaboliteSynonym, MetaboliteTissue, Pathway, Protein, Reference, SecondaryAccession, Tissue,
+)
+
+__all__ = [
+    'Loader',
+    'PostgresLoader',
+    'UpsertLoader',
+    'create_missing_indexes',
+    'get_loader',
+    'get_missing_indexes',
+    'sqlite_fast_load',
+]
+
+log = logging.getLogger(__name__)
+
+#: The default number of buffered rows after which they are written to the database
+DEFAULT_BATCH_SIZE = 50_000
+#: The default number of records after which the transaction is committed
+DEFAULT_GROUP_SIZE = 500_000
+#: The default amount of data in megabytes after which the transaction is committed
+DEFAULT_GROUP_MEGABYTES = 256
+#: The estimated size in bytes of a row tuple without the size of its strings
+ROW_OVERHEAD = 64
+#: The maximum number of identifiers in the ``IN`` clause of a delete, below SQLite's limit of bound parameters
+DELETE_CHUNK_SIZE = 500
+#: The maximum number of values in the ``IN`` clause of a select
+SELECT_CHUNK_SIZE = 500
+#: The default number of records that an :class:`UpsertLoader` writes in each transaction
+DEFAULT_UPSERT_BATCH_SIZE = 1000
+#: The maximum number of rows in a single ``INSERT ... RETURNING`` statement on PostgreSQL
+RETURNING_CHUNK_SIZE = 1000
+
+#: The prefixes that make an ``INSERT`` skip the rows that violate a unique constraint, for the dialects without
+#: PostgreSQL's ``ON CONFLICT DO NOTHING``
+INSERT_IGNORE_PREFIXES = {
+    'sqlite': 'OR IGNORE',
+    'mysql': 'IGNORE',
+}
+
+#: The pragmas used for bulk loading into SQLite. The journal is kept in memory so a failed load can be rolled back.
+SQLITE_FAST_LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',  # 256 MB
+}
+
+#: The translation table for escaping values in the text format of PostgreSQL's COPY
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+#: The representation of NULL in the text format of PostgreSQL's COPY
+COPY_NULL = '\\N'
+
+#: The tables with values that are shared between metabolites. Each entry has the key of the values in the record, the
+#: model, the column that identifies a value, the relation table and the column of the relation table for the value.
+VOCABULARIES = [
+    ('cellular_locations', CellularLocation, 'cellular_location', MetaboliteCellularLocation, 'cellular_location_id'),
+    ('biofluids', Biofluid, 'biofluid', MetaboliteBiofluid, 'biofluid_id'),
+    ('tissues', Tissue, 'tissue', MetaboliteTissue, 'tissue_id'),
+    ('pathways', Pathway, 'name', MetabolitePathway, 'pathway_id'),
+    ('references', Reference, 'reference_text', MetaboliteReference, 'reference_id'),
+    ('proteins', Protein, 'protein_accession', MetaboliteProtein, 'protein_id'),
+    ('datasets', Dataset, 'name', MetaboliteDataset, 'dataset_id'),
+]
+
+#: The entry of the datasets from which the metabolites were read
+DATASET_VOCABULARY = VOCABULARIES[-1]
+
+#: The columns that identify the rows of the shared tables
+KEY_COLUMNS = {
+    model.__table__: column
+    for _, model, column, _, _ in VOCABULARIES
+}
+KEY_COLUMNS[Disease.__table__] = 'name'
+
+#: The tables of which the loader writes rows
+TABLES = [
+    Metabolite.__table__,
+    SecondaryAccession.__table__,
+    MetaboliteSynonym.__table__,
+    Disease.__table__,
+    MetaboliteDiseaseReference.__table__,
+] + [
+    table.__table__
+    for _, vocabulary_table, _, relation_table, _ in VOCABULARIES
+    for table in (vocabulary_table, relation_table)
+]
+
+
+def _get_columns(table):
+    """Get the names of the columns of a table, starting with the primary key.
+
+    :param sqlalchemy.Table table: A table
+    :rtype: list[str]
+    """
+    return [column.name for column in table.columns]
+
+
+class Loader(object):
+    """Builds rows from metabolite records and bulk inserts them.
+
+    The primary keys are assigned by the loader, continuing from the highest identifier in each table, so the rows can
+    reference each other before they are written. The deduplication of the shared tables only keeps the mappings from
+    their unique values to these identifiers in memory. No ORM objects are created, so the session's identity map stays
+    empty.
+
+    The buffered rows are written when there are ``batch_size`` of them and the transaction is committed after
+    ``group_size`` records or ``group_megabytes`` of data, whichever comes first.
+    """
+
+    def __init__(
+            self,
+            session,
+            batch_size=DEFAULT_BATCH_SIZE,
+            group_size=DEFAULT_GROUP_SIZE,
+            group_megabytes=DEFAULT_GROUP_MEGABYTES,
+            checkpoint_source=None,
+    ):
+        """
+        :param sqlalchemy.orm.Session session: The session in which transaction the rows are written
+        :param int batch_size: The number of buffered rows after which they are written
+        :param int group_size: The number of records after which the transaction is committed
+        :param float group_megabytes: The estimated amount of data after which the transaction is committed
+        :param Optional[str] checkpoint_source: If given, a :class:`bio2bel_hmdb.models.Checkpoint` for this source is
+                                                written in the transaction of each commit
+        """
+        self.session = session
+        self.checkpoint_source = checkpoint_source
+        self.batch_size = batch_size
+        self.group_size = group_size
+        self.group_bytes = group_megabytes * 1024 * 1024
+
+        #: The names of the columns of each table, in the order of the values in the row tuples
+        self.columns = {
+            table: _get_columns(table)
+            for table in TABLES
+        }
+
+        #: The next free primary key of each table
+        self.next_ids = {
+            table: (session.query(func.max(table.c.id)).scalar() or 0) + 1
+            for table in TABLES
+        }
+
+        #: Mappings from the unique values of the shared tables to their primary keys
+        self.ids = {
+            table: {}
+            for table in TABLES
+        }
+
+        #: The row tuples of each table that have not been written yet
+        self.rows = defaultdict(list)
+        self.row_count = 0
+
+        #: The records and the estimated amount of data since the last commit
+        self.uncommitted_records = 0
+        self.uncommitted_bytes = 0
+
+        #: The last record that was added
+        self.last_accession = None
+        self.last_offset = None
+
+        #: Statistics about the commits
+        self.record_count = 0
+        self.commit_count = 0
+        self.start_time = time.time()
+
+    def _add_row(self, table, values):
+        """Buffer a row with a new primary key.
+
+        :param sqlalchemy.Table table: The table of the row
+        :param tuple values: The values of the row without the primary key
+        :return: The primary key of the new row
+        :rtype: int
+        """
+        row_id = self.next_ids[table]
+        self.next_ids[table] += 1
+
+        self.rows[table].append((row_id,) + values)
+        self.row_count += 1
+        self.uncommitted_bytes += ROW_OVERHEAD + sum(len(value) for value in values if isinstance(value, str))
+
+        return row_id
+
+    def _get_id(self, table, key, values):
+        """Get the primary key of a value in a shared table, buffering a new row if it is not present yet.
+
+        :param sqlalchemy.Table table: The shared table
+        :param str key: The unique value
+        :param tuple values: The values of the row without the primary key, used if the value is new
+        :rtype: int
+        """
+        ids = self.ids[table]
+
+        row_id = ids.get(key)
+        if row_id is None:
+            row_id = ids[key] = self._add_row(table, values)
+
+        return row_id
+
+    def _get_disease_values(self, disease):
+        """Get the values of a disease row. Its names in the disease ontologies are filled in by
+        :meth:`bio2bel_hmdb.manager.Manager.map_diseases`.
+
+        :param dict disease: A disease from a metabolite record
+        :rtype: tuple
+        """
+        disease_row = {
+            'name': disease['name'],
+            'omim_id': disease.get('omim_id'),
+        }
+
+        return tuple(
+            disease_row.get(column)
+            for column in self.columns[Disease.__table__][1:]
+        )
+
+    def _get_vocabulary_values(self, table, column, value):
+        """Get the unique value and the values of the row of a value of a shared table.
+
+        :param sqlalchemy.Table table: The shared table
+        :param str column: The column that identifies the values
+        :param value: The value from the record, either the unique value or a dictionary with all columns
+        :type value: Union[str,dict]
+        :rtype: tuple[str,tuple]
+        """
+        if isinstance(value, dict):
+            return value[column], tuple(value.get(name) for name in self.columns[table][1:])
+
+        return value, (value,)
+
+    def _add_relations(self, metabolite_id, vocabulary, values):
+        """Buffer the rows relating a metabolite to values of a shared table.
+
+        :param int metabolite_id: The primary key of the metabolite
+        :param tuple vocabulary: An entry of :data:`VOCABULARIES`
+        :param list values: The values from the record, either the unique values or dictionaries with all columns
+        """
+        _, model, column, relation_model, _ = vocabulary
+        table = model.__table__
+        relation_table = relation_model.__table__
+
+        for value in values:
+            key, row_values = self._get_vocabulary_values(table, column, value)
+            self._add_row(relation_table, (metabolite_id, self._get_id(table, key, row_values)))
+
+    def add_datasets(self, metabolite_id, datasets):
+        """Relate a metabolite that was already added to more datasets, like when it is found in several sources.
+
+        :param int metabolite_id: The primary key of the metabolite
+        :param list[dict[str,str]] datasets: The datasets from :func:`bio2bel_hmdb.parser.get_dataset`
+        """
+        self._add_relations(metabolite_id, DATASET_VOCABULARY, datasets)
+
+    def add(self, record):
+        """Build the rows for a metabolite record, then write them or commit if the thresholds are reached.
+
+        :param dict record: A record from :func:`bio2bel_hmdb.parser.parse_metabolite`
+        :return: The primary key of the metabolite
+        :rtype: int
+        """
+        metabolite = record['metabolite']
+        metabolite_id = self._add_row(Metabolite.__table__, tuple(
+            metabolite.get(column)
+            for column in self.columns[Metabolite.__table__][1:]
+        ))
+
+        for secondary_accession in record.get('secondary_accessions', []):
+            self._add_row(SecondaryAccession.__table__, (secondary_accession, metabolite_id))
+
+        for synonym in record.get('synonyms', []):
+            self._add_row(MetaboliteSynonym.__table__, (synonym, metabolite_id))
+
+        for vocabulary in VOCABULARIES:
+            self._add_relations(metabolite_id, vocabulary, record.get(vocabulary[0], []))
+
+        for disease in record.get('diseases', []):
+            if 'references' not in disease:
+                continue
+
+            disease_id = self._get_id(Disease.__table__, disease['name'], self._get_disease_values(disease))
+
+            for reference in disease['references']:
+                reference_id = self._get_id(
+                    Reference.__table__,
+                    reference['reference_text'],
+                    tuple(reference.get(name) for name in self.columns[Reference.__table__][1:]),
+                )
+                self._add_row(MetaboliteDiseaseReference.__table__, (metabolite_id, disease_id, reference_id))
+
+        self.last_accession = metabolite.get('accession')
+        self.last_offset = record.get('offset')
+        self.record_count += 1
+        self.uncommitted_records += 1
+
+        if self.uncommitted_records >= self.group_size or self.uncommitted_bytes >= self.group_bytes:
+            self.commit()
+        elif self.row_count >= self.batch_size:
+            self.flush()
+
+        return metabolite_id
+
+    def _write(self, table, rows):
+        """Write rows to a table with a bulk insert.
+
+        :param sqlalchemy.Table table: A table
+        :param list[tuple] rows: Row tuples with the values in the order of :attr:`columns`
+        """
+        columns = self.columns[table]
+        self.session.execute(table.insert(), [
+            dict(zip(columns, row))
+            for row in rows
+        ])
+
+    def flush(self):
+        """Write the buffered rows table by table, in the order of their foreign keys."""
+        for table in Base.metadata.sorted_tables:
+            rows = self.rows.pop(table, None)
+            if rows:
+                self._write(table, rows)
+
+        self.row_count = 0
+
+    def load_ids(self):
+        """Load the identifiers of the values in the shared tables from the database, so rows that are added to a
+        populated database reuse them.
+        """
+        for table, column in KEY_COLUMNS.items():
+            self.ids[table] = dict(self.session.execute(select([table.c[column], table.c.id])).fetchall())
+
+    def resume(self, checkpoint):
+        """Continue after a checkpoint by loading the identifiers of the shared tables from the database.
+
+        :param bio2bel_hmdb.models.Checkpoint checkpoint: The checkpoint of a previous population
+        """
+        high_water_marks = json.loads(checkpoint.high_water_marks)
+        for table in TABLES:
+            self.next_ids[table] = max(self.next_ids[table], high_water_marks.get(table.name, 1))
+
+        self.load_ids()
+
+        self.record_count = checkpoint.record_count
+        self.last_accession = checkpoint.accession
+        self.last_offset = checkpoint.offset
+
+    def delete_metabolites(self, metabolite_ids):
+        """Delete metabolites with their synonyms, secondary accessions and the rows of their relation tables.
+
+        The values of the shared tables are kept, even if no other metabolite refers to them.
+
+        :param list[int] metabolite_ids: The primary keys of the metabolites
+        """
+        tables = [
+            table
+            for table in reversed(Base.metadata.sorted_tables)
+            if 'metabolite_id' in table.c
+        ]
+        tables.append(Metabolite.__table__)
+
+        for start in range(0, len(metabolite_ids), DELETE_CHUNK_SIZE):
+            chunk = metabolite_ids[start:start + DELETE_CHUNK_SIZE]
+            for table in tables:
+                column = table.c.id if table is Metabolite.__table__ else table.c.metabolite_id
+                self.session.execute(table.delete().where(column.in_(chunk)))
+
+    def _write_checkpoint(self):
+        """Replace the checkpoint of the source with the last added record."""
+        if self.checkpoint_source is None or self.last_accession is None:
+            return
+
+        table = Checkpoint.__table__
+        self.session.execute(table.delete().where(table.c.source == self.checkpoint_source))
+        self.session.execute(table.insert(), {
+            'source': self.checkpoint_source,
+            'accession': self.last_accession,
+            'offset': self.last_offset or 0,
+            'record_count': self.record_count,
+            'high_water_marks': json.dumps({
+                table.name: next_id
+                for table, next_id in self.next_ids.items()
+            }),
+        })
+
+    def commit(self):
+        """Write the buffered rows and the checkpoint, then commit the transaction."""
+        self.flush()
+        self._write_checkpoint()
+        self.session.commit()
+
+        self.commit_count += 1
+        log.info(
+            'committed %d records (%.1f MB) after %d records in total (%.2f commits/second)',
+            self.uncommitted_records,
+            self.uncommitted_bytes / 1024 / 1024,
+            self.record_count,
+            self.commits_per_second,
+        )
+
+        self.uncommitted_records = 0
+        self.uncommitted_bytes = 0
+
+    @property
+    def commits_per_second(self):
+        """The number of commits per second since the loader was created.
+
+        :rtype: float
+        """
+        return self.commit_count / max(time.time() - self.start_time, 1e-9)
+
+
+def format_copy_rows(rows):
+    """Format rows as lines in the text format of PostgreSQL's COPY.
+
+    :param iter[tuple] rows: Row tuples
+    :rtype: iter[str]
+    """
+    for row in rows:
+        yield '\t'.join(
+            COPY_NULL if value is None else str(value).translate(COPY_ESCAPES)
+            for value in row
+        ) + '\n'
+
+
+def copy_from(session, table, columns, file):
+    """Copy the content of a file in the text format of PostgreSQL's COPY to columns of a table.
+
+    :param sqlalchemy.orm.Session session: The session in which transaction the rows are written
+    :param sqlalchemy.Table table: A table
+    :param list[str] columns: The names of the columns in the order of the values in the file
+    :param file: A file like containing the rows
+    """
+    preparer = session.get_bind().dialect.identifier_preparer
+    statement = 'COPY {} ({}) FROM STDIN'.format(
+        preparer.format_table(table),
+        ', '.join(preparer.quote(column) for column in columns),
+    )
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, file)
+    finally:
+        cursor.close()
+
+
+class PostgresLoader(Loader):
+    """Streams the rows into PostgreSQL with ``COPY FROM STDIN`` instead of inserting them.
+
+    Since the primary keys are assigned by the loader, the sequences of the tables are moved past them after each
+    flush.
+    """
+
+    def _write(self, table, rows):
+        """Write rows to a table with COPY.
+
+        :param sqlalchemy.Table table: A table
+        :param list[tuple] rows: Row tuples with the values in the order of :attr:`columns`
+        """
+        file = io.StringIO()
+        file.writelines(format_copy_rows(rows))
+        file.seek(0)
+        self._copy(table, file)
+
+    def _copy(self, table, file):
+        """Copy the content of a file in the text format of COPY to a table.
+
+        :param sqlalchemy.Table table: A table
+        :param file: A file like containing the rows
+        """
+        copy_from(self.session, table, self.columns[table], file)
+
+    def _reset_sequences(self):
+        """Move the sequences of the primary keys past the identifiers assigned by the loader."""
+        preparer = self.session.get_bind().dialect.identifier_preparer
+        for table, next_id in self.next_ids.items():
+            if next_id == 1:
+                continue
+
+            self.session.execute(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), :value)",
+                {'table': preparer.format_table(table), 'value': next_id - 1},
+            )
+
+    def flush(self):
+        """Write the buffered rows table by table, in the order of their foreign keys, and update the sequences."""
+        super().flush()
+        self._reset_sequences()
+
+
+def _iter_chunks(values, size):
+    """Iterate over consecutive parts of a list.
+
+    :param list values: A list
+    :param int size: The maximum length of each part
+    :rtype: iter[list]
+    """
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class UpsertLoader(Loader):
+    """Writes records next to other loaders that write into the same database at the same time.
+
+    The primary keys are assigned by the database instead of the loader. The values of the shared tables that were not
+    seen yet are inserted with ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` on PostgreSQL, or with ``INSERT OR
+    IGNORE`` on SQLite, and the identifiers of the ones another loader inserted first are selected afterwards. They are
+    committed in a short transaction of their own, in the order of the tables and of their unique values, so concurrent
+    loaders never wait on each other in a cycle. The mappings to the identifiers are kept for the next batches, like in
+    :class:`Loader`.
+
+    The records are buffered and written in one transaction every ``batch_size`` records. The identifiers of the
+    metabolites are selected by their accessions after they were inserted. On PostgreSQL with psycopg2, the rows of the
+    metabolites and their relations are streamed with ``COPY``.
+    """
+
+    def __init__(self, session, batch_size=DEFAULT_UPSERT_BATCH_SIZE):
+        """
+        :param sqlalchemy.orm.Session session: The session in which transactions the rows are written
+        :param int batch_size: The number of buffered records after which they are written and committed
+        :raises ValueError: If the database can not skip the rows that conflict with a unique constraint
+        """
+        dialect = session.get_bind().dialect
+        if dialect.name != 'postgresql' and dialect.name not in INSERT_IGNORE_PREFIXES:
+            raise ValueError('concurrent loading is not supported for {}'.format(dialect.name))
+
+        super().__init__(session, batch_size=batch_size)
+
+        self.dialect = dialect
+        self.use_copy = dialect.name == 'postgresql' and dialect.driver == 'psycopg2'
+
+        #: The records that have not been written yet
+        self.records = []
+
+    def add(self, record):
+        """Buffer a metabolite record, then write the buffered records if there are ``batch_size`` of them.
+
+        :param dict record: A record from :func:`bio2bel_hmdb.parser.parse_metabolite`
+        """
+        self.records.append(record)
+        self.record_count += 1
+        self.uncommitted_records += 1
+
+        if len(self.records) >= self.batch_size:
+            self.commit()
+
+    def _select_ids(self, table, column, values):
+        """Get the primary keys of rows by their unique values.
+
+        :param sqlalchemy.Table table: A table
+        :param str column: A column with unique values
+        :param list values: The unique values
+        :rtype: dict
+        """
+        ids = {}
+        for chunk in _iter_chunks(values, SELECT_CHUNK_SIZE):
+            ids.update(self.session.execute(
+                select([table.c[column], table.c.id]).where(table.c[column].in_(chunk))
+            ).fetchall())
+        return ids
+
+    def _upsert(self, table, rows):
+        """Insert the rows of a shared table that are not present yet and get the primary keys of all of them.
+
+        :param sqlalchemy.Table table: The shared table
+        :param list[tuple] rows: The values of the rows without the primary key, sorted by their unique values
+        """
+        columns = self.columns[table][1:]
+        column = KEY_COLUMNS[table]
+        rows = [dict(zip(columns, row)) for row in rows]
+        ids = self.ids[table]
+
+        if self.dialect.name == 'postgresql':
+            for chunk in _iter_chunks(rows, RETURNING_CHUNK_SIZE):
+                statement = postgresql.insert(table).values(chunk).on_conflict_do_nothing()
+                ids.update(self.session.execute(statement.returning(table.c[column], table.c.id)).fetchall())
+        else:
+            self.session.execute(table.insert().prefix_with(INSERT_IGNORE_PREFIXES[self.dialect.name]), rows)
+
+        # the values that another loader inserted first
+        ids.update(self._select_ids(table, column, [row[column] for row in rows if row[column] not in ids]))
+
+    def _resolve_ids(self, records):
+        """Insert the values of the shared tables that are used by records and get their primary keys.
+
+        :param list[dict] records: Records from :func:`bio2bel_hmdb.parser.parse_metabolite`
+        """
+        values = defaultdict(dict)
+
+        for record in records:
+            for key, model, column, _, _ in VOCABULARIES:
+                table = model.__table__
+                for value in record.get(key, []):
+                    unique_value, row_values = self._get_vocabulary_values(table, column, value)
+                    values[table].setdefault(unique_value, row_values)
+
+            for disease in record.get('diseases', []):
+                if 'references' not in disease:
+                    continue
+
+                values[Disease.__table__].setdefault(disease['name'], self._get_disease_values(disease))
+                for reference in disease['references']:
+                    unique_value, row_values = self._get_vocabulary_values(
+                        Reference.__table__, 'reference_text', reference,
+                    )
+                    values[Reference.__table__].setdefault(unique_value, row_values)
+
+        for table in Base.metadata.sorted_tables:
+            if table not in values:
+                continue
+
+            table_values = values[table]
+            new_values = sorted(value for value in table_values if value not in self.ids[table])
+
+            if new_values:
+                self._upsert(table, [table_values[value] for value in new_values])
+
+    def _insert(self, table, rows):
+        """Write rows without their primary keys to a table.
+
+        :param sqlalchemy.Table table: A table
+        :param list[tuple] rows: Row tuples with the values in the order of :attr:`columns` without the primary key
+        """
+        columns = self.columns[table][1:]
+
+        if self.use_copy:
+            file = io.StringIO()
+            file.writelines(format_copy_rows(rows))
+            file.seek(0)
+            copy_from(self.session, table, columns, file)
+        else:
+            self.session.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+    def _write_records(self, records):
+        """Write the metabolites of records and the rows that relate them to the shared tables.
+
+        :param list[dict] records: Records of which the values of the shared tables have primary keys
+        """
+        table = Metabolite.__table__
+        self._insert(table, [
+            tuple(record['metabolite'].get(column) for column in self.columns[table][1:])
+            for record in records
+        ])
+        metabolite_ids = self._select_ids(table, 'accession', [record['metabolite']['accession'] for record in records])
+
+        rows = defaultdict(list)
+        for record in records:
+            metabolite_id = metabolite_ids[record['metabolite']['accession']]
+
+            for secondary_accession in record.get('secondary_accessions', []):
+                rows[SecondaryAccession.__table__].append((secondary_accession, metabolite_id))
+
+            for synonym in record.get('synonyms', []):
+                rows[MetaboliteSynonym.__table__].append((synonym, metabolite_id))
+
+            for key, model, column, relation_model, _ in VOCABULARIES:
+                table = model.__table__
+                for value in record.get(key, []):
+                    unique_value, _ = self._get_vocabulary_values(table, column, value)
+                    rows[relation_model.__table__].append((metabolite_id, self.ids[table][unique_value]))
+
+            for disease in record.get('diseases', []):
+                if 'references' not in disease:
+                    continue
+
+                disease_id = self.ids[Disease.__table__][disease['name']]
+                for reference in disease['references']:
+                    reference_id = self.ids[Reference.__table__][reference['reference_text']]
+                    rows[MetaboliteDiseaseReference.__table__].append((metabolite_id, disease_id, reference_id))
+
+        for table in Base.metadata.sorted_tables:
+            if rows.get(table):
+                self._insert(table, rows[table])
+
+    def commit(self):
+        """Commit the values of the shared tables used by the buffered records, then write the records and commit."""
+        records, self.records = self.records, []
+
+        if records:
+            self._resolve_ids(records)
+            self.session.commit()
+
+            self._write_records(records)
+            self.session.commit()
+
+        self.commit_count += 1
+        log.info(
+            'committed %d records after %d records in total (%.2f commits/second)',
+            self.uncommitted_records,
+            self.record_count,
+            self.commits_per_second,
+        )
+
+        self.uncommitted_records = 0
+
+
+def get_loader(session, **kwargs):
+    """Get the fastest loader for the database of a session.
+
+    This is a :class:`PostgresLoader` for PostgreSQL with psycopg2 and a :class:`Loader` for all other databases.
+
+    :param sqlalchemy.orm.Session session: The session in which transaction the rows are written
+    :param kwargs: Keyword arguments passed to the loader
+    :rtype: Loader
+    """
+    dialect = session.get_bind().dialect
+
+    if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        log.info('using COPY to load into PostgreSQL')
+        return PostgresLoader(session, **kwargs)
+
+    return Loader(session, **kwargs)
+
+
+def _is_empty(connection, table):
+    """Check if a table has no rows.
+
+    :param sqlalchemy.engine.Connection connection: A database connection
+    :param sqlalchemy.Table table: A table
+    :rtype: bool
+    """
+    return connection.execute(select([table.c.id]).limit(1)).first() is None
+
+
+def _get_unique_indexes(table, target_table):
+    """Get the unique indexes that replace the unique constraints of a table.
+
+    :param sqlalchemy.Table table: A table of the models
+    :param sqlalchemy.Table target_table: A copy of the table, to which the unique indexes are attached so the models
+                                          are not modified
+    :rtype: list[sqlalchemy.Index]
+    """
+    return [
+        Index(
+            'uq_{}_{}'.format(table.name, '_'.join(column.name for column in constraint.columns)),
+            *[target_table.c[column.name] for column in constraint.columns],
+            unique=True
+        )
+        for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    ]
+
+
+def _get_deferred_indexes(table, stripped_table):
+    """Get the indexes that are built after a fast load, including the ones that replace the unique constraints.
+
+    :param sqlalchemy.Table table: A table
+    :param sqlalchemy.Table stripped_table: The copy of the table without unique constraints
+    :rtype: list[sqlalchemy.Index]
+    """
+    return _get_unique_indexes(table, stripped_table) + list(table.indexes)
+
+
+def get_missing_indexes(connection):
+    """Get the indexes of the models that are missing from the tables of a database, like one created by an older
+    version of this package.
+
+    This includes the unique indexes that replace the unique constraints which are not enforced by the database, like
+    the ones of the tables that were recreated without them by :func:`sqlite_fast_load`.
+
+    :param connection: A database engine or connection
+    :type connection: sqlalchemy.engine.Engine or sqlalchemy.engine.Connection
+    :rtype: list[sqlalchemy.Index]
+    """
+    inspector = inspect(connection)
+    table_names = set(inspector.get_table_names())
+    metadata = MetaData()
+
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+
+        indexes = inspector.get_indexes(table.name)
+        unique_columns = {
+            tuple(sorted(constraint['column_names']))
+            for constraint in inspector.get_unique_constraints(table.name)
+        }
+        unique_columns.update(
+            tuple(sorted(index['column_names']))
+            for index in indexes
+            if index['unique']
+        )
+        missing.extend(
+            index
+            for index in _get_unique_indexes(table, table.tometadata(metadata))
+            if tuple(sorted(column.name for column in index.columns)) not in unique_columns
+        )
+
+        index_names = {index['name'] for index in indexes}
+        missing.extend(
+            index
+            for index in sorted(table.indexes, key=lambda index: index.name)
+            if index.name not in index_names
+        )
+
+    return missing
+
+
+def create_missing_indexes(connection):
+    """Create the indexes of the models that are missing from the tables of a database in place, including the unique
+    indexes of the unique constraints that are not enforced.
+
+    Databases created by an older version of this package keep their data, since :meth:`sqlalchemy.MetaData.create_all`
+    only creates the missing tables and not the missing indexes of the existing ones.
+
+    :param connection: A database engine or connection
+    :type connection: sqlalchemy.engine.Engine or sqlalchemy.engine.Connection
+    :return: The names of the created indexes
+    :rtype: list[str]
+    """
+    indexes = get_missing_indexes(connection)
+
+    t = time.time()
+    for index in indexes:
+        log.info('creating index %s', index.name)
+        index.create(connection)
+    log.info('created %d indexes after %.2f seconds', len(indexes), time.time() - t)
+
+    return [index.name for index in indexes]
+
+
+def _strip_constraints(metadata):
+    """Remove the unique constraints and the indexes from the tables of a metadata.
+
+    :param sqlalchemy.MetaData metadata: A copy of the metadata of the models
+    """
+    for table in metadata.tables.values():
+        table.constraints = {
+            constraint
+            for constraint in table.constraints
+            if not isinstance(constraint, UniqueConstraint)
+        }
+        table.indexes = set()
+
+
+@contextmanager
+def sqlite_fast_load(engine):
+    """Get a session for bulk loading into an SQLite database, building the indexes once at the end.
+
+    The pragmas in :data:`SQLITE_FAST_LOAD_PRAGMAS` are set on a dedicated connection. If the tables written by the
+    :class:`Loader` are still empty, they are recreated without their unique constraints, which are replaced by unique
+    indexes after the load instead of being maintained row by row. Otherwise, only their other indexes are dropped and
+    rebuilt, which also adds the ones that are missing from an older database. The indexes are built and the previous
+    pragmas are restored afterwards, even if the load fails, so the rows that were committed before the failure are
+    still checked by the unique indexes.
+
+    :param sqlalchemy.engine.Engine engine: An engine for an SQLite database
+    :rtype: sqlalchemy.orm.Session
+    """
+    connection = engine.connect()
+
+    pragmas = {
+        pragma: connection.execute('PRAGMA {}'.format(pragma)).scalar()
+        for pragma in SQLITE_FAST_LOAD_PRAGMAS
+    }
+    for pragma, value in SQLITE_FAST_LOAD_PRAGMAS.items():
+        connection.execute('PRAGMA {} = {}'.format(pragma, value))
+
+    if all(_is_empty(connection, table) for table in TABLES):
+        log.info('recreating the empty tables without their unique constraints')
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            table.tometadata(metadata)
+        _strip_constraints(metadata)
+
+        tables = [metadata.tables[table.name] for table in TABLES]
+        metadata.drop_all(connection, tables=tables)
+        metadata.create_all(connection, tables=tables)
+
+        indexes = [
+            index
+            for table in TABLES
+            for index in _get_deferred_indexes(table, metadata.tables[table.name])
+        ]
+    else:
+        indexes = [
+            index
+            for table in TABLES
+            for index in table.indexes
+        ]
+        missing = get_missing_indexes(connection)
+        for index in indexes:
+            if index not in missing:
+                index.drop(connection)
+
+        # the unique indexes of a previous fast load that failed before building them
+        table_names = {table.name for table in TABLES}
+        indexes.extend([
+            index
+            for index in missing
+            if index.table.name in table_names and index not in indexes
+        ])
+
+    session = Session(bind=connection)
+    try:
+        yield session
+
+    finally:
+        session.close()
+        try:
+            t = time.time()
+            log.info('building %d indexes', len(indexes))
+            for index in indexes:
+                index.create(connection)
+            log.info('built indexes after %.2f seconds', time.time() - t)
+
+        finally:
+            for pragma, value in pragmas.items():
+                connection.execute('PRAGMA {} = {}'.format(pragma, value))
+            connection.close()
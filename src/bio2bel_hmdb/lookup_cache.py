@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""The lookup cache keeps the results of the query methods of the :class:`bio2bel_hmdb.manager.Manager` in memory, so
+repeated lookups of the same keys do not hit the database.
+
+The results are stored as :class:`Snapshot` objects instead of the instances of the models. A snapshot is an immutable
+copy of the columns of an instance and of the relationships that were loaded with it, so it is not bound to a session,
+does not emit queries and can be shared between callers without them changing each other's results.
+"""
+
+import threading
+import time
+import types
+from collections import OrderedDict, defaultdict, namedtuple
+
+from sqlalchemy import inspect
+
+__all__ = [
+    'CacheInfo',
+    'LookupCache',
+    'Snapshot',
+    'make_snapshot',
+]
+
+#: The default number of cached lookups
+DEFAULT_CACHE_SIZE = 10_000
+
+#: The statistics of a :class:`LookupCache`, like the ones of :func:`functools.lru_cache`
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class Snapshot(object):
+    """An immutable copy of the column values of an instance of a model and of some of its relationships.
+
+    The values are read like the attributes of the instance. The methods of the model, like ``serialize_to_bel``, are
+    called with the snapshot in place of the instance. Two snapshots are equal if they copy the same row.
+    """
+
+    __slots__ = ('_model', '_values')
+
+    def __init__(self, model, values):
+        """
+        :param type model: The model of the copied instance
+        :param dict values: The values of the columns and the snapshots of the relationships
+        """
+        object.__setattr__(self, '_model', model)
+        object.__setattr__(self, '_values', types.MappingProxyType(values))
+
+    def __getattr__(self, name):
+        if name in Snapshot.__slots__:  # not set yet, like while copying
+            raise AttributeError(name)
+
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        attribute = getattr(self._model, name, None)
+        if isinstance(attribute, types.FunctionType):
+            return types.MethodType(attribute, self)
+
+        raise AttributeError('{} is not in the snapshot of {}'.format(name, self._model.__name__))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('snapshots are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('snapshots are immutable')
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Snapshot) and
+            self._model is other._model and
+            self._values['id'] == other._values['id']
+        )
+
+    def __hash__(self):
+        return hash((self._model, self._values['id']))
+
+    def __repr__(self):
+        if '__repr__' in vars(self._model):
+            return self._model.__repr__(self)
+        return '<{} snapshot id={}>'.format(self._model.__name__, self.id)
+
+
+def make_snapshot(instance, paths=()):
+    """Copy an instance of a model and the relationships along the paths into a :class:`Snapshot`.
+
+    :param instance: An instance of a model
+    :param paths: Paths of relationship names, like the ones of :func:`bio2bel_hmdb.manager.get_loader_options`. The
+                  relationships should be loaded already, since loading them here would emit a query for each instance.
+    :rtype: Snapshot
+    """
+    mapper = inspect(instance).mapper
+
+    values = {
+        column.key: getattr(instance, column.key)
+        for column in mapper.column_attrs
+    }
+
+    children = defaultdict(list)
+    for first, *rest in paths:
+        if rest:
+            children[first].append(rest)
+        else:
+            children.setdefault(first, [])
+
+    for name, child_paths in children.items():
+        value = getattr(instance, name)
+        if mapper.relationships[name].uselist:
+            values[name] = tuple(make_snapshot(child, child_paths) for child in value)
+        else:
+            values[name] = None if value is None else make_snapshot(value, child_paths)
+
+    return Snapshot(mapper.class_, values)
+
+
+class LookupCache(object):
+    """A cache that evicts its least recently used entry once it is full and entries that are older than a time to
+    live.
+
+    The counters of the hits and misses are kept until they are reset with :meth:`reset_info`, so they are not lost
+    when the cache is cleared.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=None, timer=time.monotonic):
+        """
+        :param int maxsize: The maximum number of entries
+        :param Optional[float] ttl: The number of seconds after which an entry expires. Defaults to never.
+        :param timer: A function that returns the current time in seconds
+        :raises ValueError: If the maximum size is not positive or the time to live is not positive
+        """
+        if maxsize < 1:
+            raise ValueError('the maximum size of the cache must be positive: {}'.format(maxsize))
+        if ttl is not None and ttl <= 0:
+            raise ValueError('the time to live of the cache must be positive: {}'.format(ttl))
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Get the value of a key and mark it as the most recently used, or the default if it is missing or expired.
+
+        :param key: A hashable key
+        :param default: The value returned if the key is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] is not None and entry[0] <= self.timer():
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        """Store the value of a key, evicting the least recently used entry if the cache is full.
+
+        :param key: A hashable key
+        :param value: The value, which should not be changed afterwards since it is shared by all hits
+        """
+        with self.lock:
+            expires = None if self.ttl is None else self.timer() + self.ttl
+            self.entries[key] = expires, value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        """Get the counters of the hits and misses and the size of the cache.
+
+        :rtype: CacheInfo
+        """
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def reset_info(self):
+        """Reset the counters of the hits and misses."""
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
@@ -3,19 +3,36 @@
 """The Manager is a key component of HMDB. This class is used to create, populate and query the local HMDB version."""
 
 import logging
-from typing import List, Mapping, Optional
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, closing
+from functools import wraps
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
 
-from bel_resources import get_bel_resource
 from bio2bel import AbstractManager
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import joinedload, raiseload, selectinload
 from tqdm import tqdm
 
-from .constants import DOID, HP, MESHD, MODULE_NAME, ONTOLOGIES, ONTOLOGY_NAMESPACES
+from .adjacency import AdjacencyIndex
+from .cache import get_record_cache_path, iter_cached_records, write_records
+from .constants import DATA_URL, MODULE_NAME
+from .loader import (
+    DEFAULT_GROUP_MEGABYTES, DEFAULT_GROUP_SIZE, DEFAULT_UPSERT_BATCH_SIZE, DELETE_CHUNK_SIZE, SELECT_CHUNK_SIZE,
+    UpsertLoader, create_missing_indexes, get_loader, sqlite_fast_load,
+)
+from .lookup_cache import CacheInfo, LookupCache, make_snapshot
 from .models import (
-    Base, Biofluid, Biofunction, CellularLocation, Disease, Metabolite, MetaboliteBiofluid, MetaboliteCellularLocation,
-    MetaboliteDiseaseReference, MetabolitePathway, MetaboliteProtein, MetaboliteReference,
-    MetaboliteSynonym, MetaboliteTissue, Pathway, Protein, Reference, SecondaryAccession, Tissue,
+    Base, Biofluid, Biofunction, CellularLocation, Checkpoint, Dataset, Disease, Metabolite, MetaboliteDataset,
+    MetaboliteDiseaseReference, MetaboliteProtein, Pathway, Protein, Reference, Tissue,
+)
+from .ontologies import ONTOLOGY_COLUMNS, load_disease_ontologies, map_disease_names
+from .parser import (
+    DEFAULT_QUEUE_DEPTH, DEFAULT_SHARD_SIZE, PROFILES, _ensure_uncompressed, ensure_source, get_dataset, get_sections,
+    iter_interleaved, iter_pipelined, iter_records, iter_records_parallel, iter_worker_records, select_accessions,
+    select_sections, set_dataset, skip_through,
 )
-from .parser import get_data
 
 __all__ = [
     'Manager',
@@ -23,6 +40,110 @@ __all__ = [
 
 log = logging.getLogger(__name__)
 
+OntologyLocations = Union[None, str, Mapping[str, str]]
+Sources = Union[None, str, Sequence[Optional[str]]]
+Profile = Union[None, str, Iterable[str]]
+
+#: The strategies with which the query methods load the relationships of their results
+LOADER_STRATEGIES = ('selectin', 'joined', 'raise')
+
+#: The relationships that are loaded with the results of the query methods. Each path starts with the name of a
+#: relationship of the queried model and continues with the many-to-one relationships of the relation rows.
+METABOLITE_PROTEIN_PATHS = [
+    ('proteins', 'protein'),
+]
+METABOLITE_DISEASE_PATHS = [
+    ('diseases', 'disease'),
+    ('diseases', 'reference'),
+]
+METABOLITE_PATHS = METABOLITE_PROTEIN_PATHS + METABOLITE_DISEASE_PATHS + [
+    ('references', 'reference'),
+]
+PROTEIN_METABOLITE_PATHS = [
+    ('metabolites', 'metabolite'),
+]
+DISEASE_METABOLITE_PATHS = [
+    ('metabolites', 'metabolite'),
+    ('metabolites', 'reference'),
+]
+METABOLITE_PROTEIN_INTERACTION_PATHS = [
+    ('metabolite',),
+    ('protein',),
+]
+METABOLITE_DISEASE_INTERACTION_PATHS = [
+    ('metabolite',),
+    ('disease',),
+    ('reference',),
+]
+#: The relationships that are copied into the snapshots of the metabolites in the lookup cache. The relation rows also
+#: keep their metabolite, which is already loaded.
+METABOLITE_SNAPSHOT_PATHS = METABOLITE_PATHS + [
+    (relationship, 'metabolite')
+    for relationship in ('proteins', 'diseases', 'references')
+]
+#: The relationships that are copied into the snapshots of the results of each cached lookup
+SNAPSHOT_PATHS = {
+    'metabolites': METABOLITE_SNAPSHOT_PATHS,
+    'metabolite_proteins': METABOLITE_PROTEIN_INTERACTION_PATHS,
+    'metabolite_diseases': METABOLITE_DISEASE_INTERACTION_PATHS,
+    'disease_metabolites': METABOLITE_DISEASE_INTERACTION_PATHS,
+    'protein_metabolites': METABOLITE_PROTEIN_INTERACTION_PATHS,
+}
+
+
+def get_loader_options(paths, strategy: str = 'selectin') -> List:
+    """Get the loader options that load the relationships along paths with a strategy.
+
+    - ``selectin`` loads the first relationship of each path with an additional query for all results at once
+    - ``joined`` joins the first relationship of each path into the query of the results
+    - ``raise`` loads like ``selectin``, but accessing any other relationship that would emit a query raises an
+      :class:`sqlalchemy.exc.InvalidRequestError`, which finds the code that would cause N+1 queries
+
+    The rest of each path is joined into the query of its first relationship.
+
+    :param paths: Paths of relationships, like :data:`METABOLITE_PATHS`
+    :param strategy: A strategy from :data:`LOADER_STRATEGIES`
+    :raises ValueError: If the strategy is unknown
+    """
+    if strategy not in LOADER_STRATEGIES:
+        raise ValueError('unknown loader strategy {}. Use one of: {}'.format(strategy, ', '.join(LOADER_STRATEGIES)))
+
+    load = joinedload if strategy == 'joined' else selectinload
+
+    options = []
+    for first, *rest in paths:
+        option = load(first)
+        if strategy == 'raise' and rest:
+            options.append(load(first).raiseload('*', sql_only=True))
+
+        for relationship in rest:
+            option = option.joinedload(relationship)
+
+        if strategy == 'raise':
+            option = option.raiseload('*', sql_only=True)
+
+        options.append(option)
+
+    if strategy == 'raise':
+        options.append(raiseload('*', sql_only=True))
+
+    return options
+
+
+def _invalidates_caches(f):
+    """Decorate a method of the manager that writes to the database so it clears the lookup cache and drops the
+    adjacency index, even if it fails."""
+
+    @wraps(f)
+    def wrapped(self, *args, **kwargs):
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            self.clear_lookup_cache()
+            self.adjacency_index = None
+
+    return wrapped
+
 
 class Manager(AbstractManager):
     """Metabolite-proteins and metabolite-disease associations."""
@@ -31,364 +152,712 @@ class Manager(AbstractManager):
     flask_admin_models = [Metabolite, Disease, Protein, Pathway, Biofluid]
     _base = Base
 
+    def __init__(
+            self,
+            *args,
+            lookup_cache_size: Optional[int] = None,
+            lookup_cache_ttl: Optional[float] = None,
+            **kwargs,
+    ):
+        """
+        :param lookup_cache_size: If given, keep the results of this many lookups of the query methods in a
+                                  :class:`bio2bel_hmdb.lookup_cache.LookupCache`. The query methods then return
+                                  immutable snapshots of the models instead of their instances.
+        :param lookup_cache_ttl: The number of seconds after which a cached lookup expires. Defaults to never.
+        """
+        super().__init__(*args, **kwargs)
+
+        self.lookup_cache = None
+        if lookup_cache_size is not None:
+            self.lookup_cache = LookupCache(lookup_cache_size, ttl=lookup_cache_ttl)
+
+        #: The adjacency index from :meth:`build_adjacency_index` or :meth:`load_adjacency_index`
+        self.adjacency_index = None
+
+    def clear_lookup_cache(self) -> None:
+        """Remove all lookups from the lookup cache, if there is one.
+
+        This is done by the methods that write to the database, like :meth:`populate` and :meth:`drop_all`. Call it
+        after changing the database in another way.
+        """
+        if self.lookup_cache is not None:
+            self.lookup_cache.clear()
+
+    def get_lookup_cache_info(self) -> Optional[CacheInfo]:
+        """Get the number of hits and misses of the lookup cache and its size, or None if there is no cache."""
+        if self.lookup_cache is not None:
+            return self.lookup_cache.info()
+
+    @_invalidates_caches
+    def drop_all(self, check_first: bool = True):
+        """Drop all tables from the database, clear the lookup cache and drop the adjacency index.
+
+        :param check_first: Only drop the tables that are in the database
+        """
+        super().drop_all(check_first=check_first)
+
     def is_populated(self) -> bool:
         """Check if the database is already populated."""
         return 0 < self.count_metabolites()
 
-    @staticmethod
-    def _get_tag(element_tag) -> str:
-        """Delete the XML namespace prefix when calling element.tag
+    def map_diseases(self, ontology_locations: OntologyLocations = None) -> Mapping[str, int]:
+        """Map the names of all diseases in the database to their names in the disease ontologies.
+
+        This runs after the diseases were loaded, so they can be mapped again to new versions of the ontologies
+        without populating the database again.
 
-        :param element_tag: tag attribute of an XML element
+        :param ontology_locations: The URLs or paths of the namespaces of the disease ontologies, or a directory with
+                                   them. They are read from the cache of :mod:`bio2bel_hmdb.ontologies` if possible.
+        :return: The number of diseases that were found in each ontology
         """
-        return element_tag.split("}")[1]
+        return self._map_diseases(load_disease_ontologies(ontology_locations))
+
+    @_invalidates_caches
+    def _map_diseases(self, disease_ontologies: Mapping[str, Mapping[str, str]]) -> Mapping[str, int]:
+        """Write the names of the diseases in the given ontologies to the disease table.
+
+        The names are normalized once and looked up in all ontologies in one pass over the table. Then one batched
+        ``UPDATE`` per ontology writes the names that changed.
+        """
+        table = Disease.__table__
+        columns = [ONTOLOGY_COLUMNS[ontology] for ontology in disease_ontologies]
+        rows = self.session.execute(select([table.c.id, table.c.name] + [table.c[column] for column in columns]))
+        rows = rows.fetchall()
+
+        mappings = map_disease_names([row.name for row in rows], disease_ontologies)
+
+        counts = {}
+        for ontology, column in zip(disease_ontologies, columns):
+            values = mappings[ontology]
+            counts[ontology] = sum(value is not None for value in values)
+
+            changed = [
+                {'disease_id': row.id, 'value': value}
+                for row, value in zip(rows, values)
+                if row[column] != value
+            ]
+            if changed:
+                self.session.execute(
+                    table.update().where(table.c.id == bindparam('disease_id')).values({column: bindparam('value')}),
+                    changed,
+                )
+
+            log.info('mapped %d of %d diseases to %s (%d changed)', counts[ontology], len(rows), ontology, len(changed))
+
+        self.session.commit()
+        return counts
 
-    def _populate_with_1_layer_elements(
+    def _get_records(
             self,
-            element,
-            metabolite_instance,
-            instance_dict,
-            table,
-            relation_table,
-            column_name: str,
-    ):
-        """Parse and populate database with metabolite elements, which themselfes have one more layer.
-
-        :param element: the current parent XML element. E.g. "pathways" where the children would have the tag "pathway".
-        :param models.Metabolite metabolite_instance: metabolite object which is associated with the instances (e.g. is
-                                                      involved in that "pathway")
-        :param dict instance_dict: dictionary which tracks if the found instance is already present in the table and can
-                                   then refer to it
-        :param class table: sqlalchemy class to which the instances belong. E.g. "Pathways"
-        :param class relation_table: sqlalchemy class which stores the many to many relation between the instances and
-                                     the metabolites
-        :param column_name: Name of the column in the relation tables which does not represent the metabolite.
-                                e.g. reference, pathway etc
-        :rtype: dict
-        """
-        for instance_element in element:
-            instance_dict_key = instance_element.text
-
-            if instance_dict_key not in instance_dict:  # check if instance is already in table
-                new_instance_dict = {column_name: instance_dict_key}
-                instance_dict[instance_dict_key] = table(**new_instance_dict)
-                self.session.add(instance_dict[instance_dict_key])
-
-            # create metabolite-instance relation object
-            new_meta_rel_dict = {"metabolite": metabolite_instance, column_name: instance_dict[instance_dict_key]}
-            self.session.add(relation_table(**new_meta_rel_dict))
-        return instance_dict
-
-    def _populate_with_2_layer_elements(
+            source: str,
+            offset: int = 0,
+            processes: Optional[int] = None,
+            engine: Optional[str] = None,
+            cache: bool = False,
+            cache_directory: Optional[str] = None,
+            sections: Optional[frozenset] = None,
+            accessions: Optional[Iterable[str]] = None,
+            sample: Optional[int] = None,
+    ) -> Iterable[dict]:
+        """Get the records of a source from its record cache, or parse them serially or in several processes.
+
+        The record cache always has all sections and all metabolites, so it is only written while parsing all of them.
+        The subset of the metabolites is selected by the serial parser, and after parsing otherwise.
+        """
+        subset = accessions is not None or sample is not None
+        complete = (sections is None or sections == PROFILES['full']) and not subset
+        cache_path = get_record_cache_path(source, directory=cache_directory) if cache else None
+
+        if cache_path is not None and os.path.exists(cache_path):
+            log.info('reading the records from %s', cache_path)
+            records = iter_cached_records(cache_path)
+            if subset:
+                records = select_accessions(records, accessions=accessions, sample=sample)
+            if sections is not None and sections != PROFILES['full']:
+                records = select_sections(records, sections)
+            return records
+
+        if processes is None:
+            records = iter_records(
+                source,
+                offset=offset,
+                engine=engine,
+                sections=sections,
+                accessions=accessions,
+                sample=sample,
+            )
+        else:
+            records = iter_records_parallel(
+                source,
+                processes=processes,
+                offset=offset,
+                engine=engine,
+                sections=sections,
+            )
+            if subset:
+                records = select_accessions(records, accessions=accessions, sample=sample)
+
+        if cache_path is not None and complete and not offset:  # a resumed population only parses part of the file
+            records = write_records(records, cache_path)
+
+        return records
+
+    @_invalidates_caches
+    def populate(
             self,
-            element,
-            metabolite_instance,
-            instance_dict,
-            table,
-            relation_table,
-            column,
-            instance_dict_key=None,
-            metabolite_column='metabolite',
+            source: Sources = None,
+            map_dis: bool = True,
+            group_size: int = DEFAULT_GROUP_SIZE,
+            group_megabytes: float = DEFAULT_GROUP_MEGABYTES,
+            processes: Optional[int] = None,
+            fast_load: bool = False,
+            queue_depth: Optional[int] = None,
+            resume: bool = False,
+            engine: Optional[str] = None,
+            cache: bool = False,
+            cache_directory: Optional[str] = None,
+            ontology_locations: OntologyLocations = None,
+            profile: Profile = None,
+            accessions: Optional[Iterable[str]] = None,
+            limit: Optional[int] = None,
+            sample: Optional[int] = None,
     ):
-        """Parse and populate database with metabolite elements, which themselves have two more layers.
-
-        :param element: the current parent XML element. E.g. "pathways" where the children would have the tag "pathway".
-        :param models.Metabolite metabolite_instance: metabolite object which is associated with the instances (e.g. is
-        involved in that "pathway")
-        :param dict instance_dict: dictionary which tracks if the found instance is already present in the table and can
-        then refer to it
-        :param type table: sqlalchemy class to which the instances belong. E.g. "Pathways"
-        :param type relation_table: sqlalchemy class which stores the many to many relation between the instances and
-        the metabolites
-        :param str column: column name of the relation table which is not the metabolite
-        :param str instance_dict_key: String which is used as the key for the instance_dict. (to ensure uniqueness in
-        the instance_dict)
-        :param str metabolite_column: column of the relation table which represents the foreignkey to the main table.
-        In our database model the Metabolite table.
-        :rtype: dict
-        """
-        if instance_dict_key is None and len(element) > 0:
-            instance_dict_key = self._get_tag(element[0][0].tag)
-
-        for instance_element in element:
-            # build pathway object dict to create pathway object
-            instance_object_dict = {}
-
-            # create pathway instance
-            for instance_sub_element in instance_element:
-                cutted_pathway_tag = self._get_tag(instance_sub_element.tag)
-                instance_object_dict[cutted_pathway_tag] = instance_sub_element.text
-
-            # add MetabolitePathway relation and continue with next pathway if pathway already present in Pathways
-            if instance_object_dict[instance_dict_key] in instance_dict:
-                new_meta_rel_dict = {
-                    metabolite_column: metabolite_instance,
-                    column: instance_dict[instance_object_dict[instance_dict_key]]
-                }
-                new_meta_rel = relation_table(**new_meta_rel_dict)
-                self.session.add(new_meta_rel)
+        """Populate the database with the HMDB data.
+
+        The rows are bulk inserted by a :class:`bio2bel_hmdb.loader.Loader`. On PostgreSQL, they are streamed with
+        ``COPY`` by a :class:`bio2bel_hmdb.loader.PostgresLoader` instead.
+
+        Each metabolite is related to the :class:`bio2bel_hmdb.models.Dataset` of the source in which it was found. If
+        there are several sources, they are parsed at the same time in separate threads and loaded in one pass. A
+        metabolite that is in several of them is only loaded once and related to each of their datasets.
+
+        :param source: Path to an .xml file, or to a .zip or .gz archive of one, its URL or the name of a dataset from
+                       :data:`bio2bel_hmdb.constants.DATASET_URLS`, or a list of them. If None the whole HMDB will be
+                       downloaded and used for population.
+        :param map_dis: Should diseases be mapped with :meth:`map_diseases` after loading?
+        :param group_size: The number of metabolites after which the transaction is committed
+        :param group_megabytes: The estimated amount of data after which the transaction is committed
+        :param processes: If given, parse the metabolites of each source in this many processes with
+                          :func:`bio2bel_hmdb.parser.iter_records_parallel`. A compressed source is decompressed next to
+                          the original first.
+        :param fast_load: If the database is SQLite, relax the durability pragmas and build the indexes after loading
+                          with :func:`bio2bel_hmdb.loader.sqlite_fast_load`. A crash during the load can corrupt the
+                          database.
+        :param queue_depth: If given, parse in a separate thread that passes batches of metabolites to the writer
+                            through a queue of this size with :func:`bio2bel_hmdb.parser.iter_pipelined`, so parsing
+                            and writing to the database overlap. Several sources are always parsed in separate threads.
+        :param resume: If a previous population with the same single source was interrupted, continue after the last
+                       metabolite it committed. The caches of the shared tables are loaded from the database and the
+                       file is read from the position stored in the :class:`bio2bel_hmdb.models.Checkpoint`.
+        :param engine: The name of the XML parser engine from :data:`bio2bel_hmdb.engines.ENGINES`. Defaults to lxml if
+                       it is installed.
+        :param cache: Read the records from the cache of the source made by :mod:`bio2bel_hmdb.cache` instead of
+                      parsing the .xml file if it exists, or write the cache while parsing otherwise
+        :param cache_directory: The directory of the record caches. Defaults to
+                                :data:`bio2bel_hmdb.constants.RECORD_CACHE_DIR`.
+        :param ontology_locations: The URLs or paths of the namespaces of the disease ontologies, or a directory with
+                                   them. They are read from the cache of :mod:`bio2bel_hmdb.ontologies` if possible.
+        :param profile: The name of an ingest profile from :data:`bio2bel_hmdb.parser.PROFILES`, like ``bel-core``, or
+                        the sections from :data:`bio2bel_hmdb.parser.SECTIONS` to load. The other sections are skipped
+                        by the parser. Defaults to all sections.
+        :param accessions: If given, only load the metabolites with these accessions. The parser drops the other
+                           metabolites as soon as their accession is read and stops once all of them were found.
+        :param limit: If given, stop after loading this many metabolites
+        :param sample: If given, only load every n-th metabolite of each source, like for a development database
+        :raises ValueError: If a population from several sources should be resumed, or the profile is unknown
+        """
+        sources = [source] if source is None or isinstance(source, str) else list(source)
+        if resume and len(sources) > 1:
+            raise ValueError('only a population from a single source can be resumed')
+
+        sections = get_sections(profile)
+        if accessions is not None:
+            accessions = frozenset(accessions)  # read once for each source
+
+        # load the disease ontologies first, so a missing one fails before the long part
+        disease_ontologies = load_disease_ontologies(ontology_locations) if map_dis and 'diseases' in sections else None
+
+        # a population from several sources has no single position in a file to resume from
+        checkpoint_source = (sources[0] or DATA_URL) if len(sources) == 1 else None
+        checkpoint = self.get_checkpoint(checkpoint_source) if resume else None
+        offset = 0 if checkpoint is None else checkpoint.offset
+
+        source_records = []
+        for source in sources:
+            records = self._get_records(
+                ensure_source(source),
+                offset=offset,
+                processes=processes,
+                engine=engine,
+                cache=cache,
+                cache_directory=cache_directory,
+                sections=sections,
+                accessions=accessions,
+                sample=sample,
+            )
+
+            if checkpoint is not None:
+                log.info('resuming after %s (%d metabolites)', checkpoint.accession, checkpoint.record_count)
+                records = skip_through(records, checkpoint.accession)
+
+            source_records.append(set_dataset(records, get_dataset(source)))
+
+        if len(source_records) == 1:
+            records = source_records[0]
+            if queue_depth is not None:
+                records = iter_pipelined(records, queue_depth=queue_depth)
+        else:
+            records = iter_interleaved(
+                iter_pipelined(records, queue_depth=queue_depth or DEFAULT_QUEUE_DEPTH)
+                for records in source_records
+            )
+
+        with ExitStack() as stack:
+            records = stack.enter_context(closing(records))  # stops the parsers if the limit is reached
+            session = self.session
+
+            if fast_load and self.engine.dialect.name == 'sqlite':
+                session = stack.enter_context(sqlite_fast_load(self.engine))
+            elif fast_load:
+                log.warning('fast loading is only supported for SQLite, not %s', self.engine.dialect.name)
+
+            loader = get_loader(
+                session,
+                group_size=group_size,
+                group_megabytes=group_megabytes,
+                checkpoint_source=checkpoint_source,
+            )
+
+            if checkpoint is not None:
+                loader.resume(checkpoint)
+
+            # the metabolites of each accession, only needed to deduplicate several sources
+            metabolite_ids = {} if len(sources) > 1 else None
+            added = 0
+
+            for record in tqdm(records, desc='HMDB Metabolite', total=limit):
+                if metabolite_ids is None:
+                    loader.add(record)
+                else:
+                    accession = record['metabolite']['accession']
+                    metabolite_id = metabolite_ids.get(accession)
+
+                    if metabolite_id is not None:
+                        loader.add_datasets(metabolite_id, record['datasets'])
+                        continue
+
+                    metabolite_ids[accession] = loader.add(record)
+
+                added += 1
+                if added == limit:
+                    log.info('reached the limit of %d metabolites', limit)
+                    break
+
+            loader.commit()
+
+        if disease_ontologies is not None:
+            self._map_diseases(disease_ontologies)
+
+    @_invalidates_caches
+    def update(
+            self,
+            source: Optional[str] = None,
+            map_dis: bool = True,
+            delete_retired: bool = False,
+            group_size: int = DEFAULT_GROUP_SIZE,
+            group_megabytes: float = DEFAULT_GROUP_MEGABYTES,
+            processes: Optional[int] = None,
+            engine: Optional[str] = None,
+            ontology_locations: OntologyLocations = None,
+            profile: Profile = None,
+    ) -> Mapping[str, int]:
+        """Update a populated database with a new release of HMDB.
+
+        The update date and the version of each metabolite are compared to the stored ones. Metabolites that did not
+        change are skipped. The rows of changed metabolites are deleted and written again from the new record, and new
+        metabolites are added. The values of the shared tables are reused.
+
+        The metabolites keep the datasets they were related to before, like the other sources of a population from
+        several ones, and all metabolites of the source are related to its dataset.
+
+        :param source: Path to an .xml file, or to a .zip or .gz archive of one, its URL or the name of a dataset from
+                       :data:`bio2bel_hmdb.constants.DATASET_URLS`. If None the whole HMDB will be downloaded and used.
+        :param map_dis: Should the diseases be mapped again?
+        :param delete_retired: Should metabolites that are missing from the new release be deleted?
+        :param group_size: The number of metabolites after which the transaction is committed
+        :param group_megabytes: The estimated amount of data after which the transaction is committed
+        :param processes: If given, parse the metabolites in this many processes with
+                          :func:`bio2bel_hmdb.parser.iter_records_parallel`
+        :param engine: The name of the XML parser engine from :data:`bio2bel_hmdb.engines.ENGINES`. Defaults to lxml if
+                       it is installed.
+        :param ontology_locations: The URLs or paths of the namespaces of the disease ontologies, or a directory with
+                                   them. They are read from the cache of :mod:`bio2bel_hmdb.ontologies` if possible.
+        :param profile: The name of an ingest profile from :data:`bio2bel_hmdb.parser.PROFILES` or the sections to
+                        load for the new and changed metabolites. Defaults to all sections.
+        :return: The number of inserted, updated, unchanged and retired metabolites
+        """
+        sections = get_sections(profile)
+        disease_ontologies = load_disease_ontologies(ontology_locations) if map_dis and 'diseases' in sections else None
+
+        stored = {
+            accession: (metabolite_id, (update_date, version))
+            for metabolite_id, accession, update_date, version in self.session.query(
+                Metabolite.id, Metabolite.accession, Metabolite.update_date, Metabolite.version,
+            )
+        }
+
+        # the datasets of the stored metabolites, which are written again with the changed ones
+        stored_datasets = defaultdict(list)
+        for metabolite_id, name, dataset_source in self.session.query(
+                MetaboliteDataset.metabolite_id, Dataset.name, Dataset.source,
+        ).join(Dataset):
+            stored_datasets[metabolite_id].append({'name': name, 'source': dataset_source})
+
+        dataset = get_dataset(source)
+        records = set_dataset(
+            self._get_records(ensure_source(source), processes=processes, engine=engine, sections=sections),
+            dataset,
+        )
+
+        loader = get_loader(
+            self.session,
+            group_size=group_size,
+            group_megabytes=group_megabytes,
+        )
+        loader.load_ids()
+
+        counts = dict.fromkeys(('inserted', 'updated', 'unchanged', 'retired'), 0)
+        seen = set()
+        changed = []
+
+        def replace_changed():
+            """Delete the previous rows of the changed metabolites, then add them again."""
+            loader.delete_metabolites([metabolite_id for metabolite_id, _ in changed])
+            for _, changed_record in changed:
+                loader.add(changed_record)
+            counts['updated'] += len(changed)
+            changed.clear()
+
+        for record in tqdm(records, desc='HMDB Metabolite'):
+            metabolite = record['metabolite']
+            accession = metabolite['accession']
+            seen.add(accession)
+
+            if accession not in stored:
+                loader.add(record)
+                counts['inserted'] += 1
                 continue
 
-            instance_dict[instance_object_dict[instance_dict_key]] = table(**instance_object_dict)
-            self.session.add(instance_dict[instance_object_dict[instance_dict_key]])
+            metabolite_id, stamp = stored[accession]
+            datasets = stored_datasets.get(metabolite_id, [])
+            is_related = any(stored_dataset['name'] == dataset['name'] for stored_dataset in datasets)
 
-            new_meta_rel_dict = {
-                metabolite_column: metabolite_instance,
-                column: instance_dict[instance_object_dict[instance_dict_key]]
-            }
-            new_meta_rel = relation_table(**new_meta_rel_dict)
-            self.session.add(new_meta_rel)
+            if stamp == (metabolite.get('update_date'), metabolite.get('version')):
+                if not is_related:
+                    loader.add_datasets(metabolite_id, [dataset])
+                counts['unchanged'] += 1
+                continue
+
+            record['datasets'] = datasets if is_related else datasets + [dataset]
+            changed.append((metabolite_id, record))
+            if len(changed) >= DELETE_CHUNK_SIZE:
+                replace_changed()
+
+        replace_changed()
+
+        retired = [
+            metabolite_id
+            for accession, (metabolite_id, _) in stored.items()
+            if accession not in seen
+        ]
+        counts['retired'] = len(retired)
+
+        if delete_retired and retired:
+            log.info('deleting %d retired metabolites', len(retired))
+            loader.delete_metabolites(retired)
 
-        return instance_dict
+        loader.commit()
 
-    def _populate_diseases(
+        if disease_ontologies is not None:
+            self._map_diseases(disease_ontologies)
+
+        log.info(
+            'updated HMDB: %d inserted, %d updated, %d unchanged and %d retired metabolites',
+            counts['inserted'], counts['updated'], counts['unchanged'], counts['retired'],
+        )
+        return counts
+
+    def _load_worker(
             self,
-            element,
-            references_dict,
-            diseases_dict,
-            metabolite_instance,
-            disease_ontologies=None,
-            map_dis=True,
-    ):
-        """Populates the database with disease and related reference information.
-
-        :param element: Element object from the xml ElementTree
-        :param dict references_dict: Dictionary to keep track of which references are already in the database
-        :param dict diseases_dict: Dictionary to keep track of which diseases are already in the database
-        :param models.Metabolite metabolite_instance: Metabolite object to which the diseases and references are related
-        :param boolean map_dis: If True the HMDB disease names will be mapped to different ontologies.
-        :rtype: dict, dict
-        """
-        for disease_element in element:
-            disease_instance = Disease()
-
-            for disease_sub_element in disease_element:
-                dtag = self._get_tag(disease_sub_element.tag)
-
-                if dtag != "references":
-                    setattr(disease_instance, dtag, disease_sub_element.text)
-                    continue
-
-                if disease_instance.name not in diseases_dict:  # add disease instance if not already in table
-                    # map to different disease ontologies if map is True
-                    if map_dis:
-                        disease_lower = disease_instance.name.lower()  # for case insensitivity
-                        for ontology in disease_ontologies:
-                            if disease_lower not in disease_ontologies[ontology]:
-                                continue
-
-                            v = disease_ontologies[ontology][disease_lower]
-
-                            if ontology == DOID:
-                                setattr(disease_instance, 'dion', v)
-                            elif ontology == HP:
-                                setattr(disease_instance, 'hpo', v)
-                            elif ontology == MESHD:
-                                setattr(disease_instance, 'mesh_diseases', v)
-
-                    diseases_dict[disease_instance.name] = disease_instance
-                    self.session.add(disease_instance)
-
-                for reference_element in disease_sub_element:
-                    new_reference_object_dict = {}  # dict to check if reference is already presend in table
-
-                    for reference_sub_element in reference_element:  # construct new reference object
-                        reference_tag = self._get_tag(reference_sub_element.tag)
-                        new_reference_object_dict[reference_tag] = reference_sub_element.text
-
-                    # add if not already in reference table
-                    if new_reference_object_dict['reference_text'] not in references_dict:
-                        references_dict[new_reference_object_dict['reference_text']] = Reference(
-                            **new_reference_object_dict)
-                        self.session.add(references_dict[new_reference_object_dict['reference_text']])
-
-                    rel_meta_dis_ref = MetaboliteDiseaseReference(
-                        metabolite=metabolite_instance,
-                        disease=diseases_dict[disease_instance.name],
-                        reference=references_dict[new_reference_object_dict['reference_text']]
-                    )
-                    self.session.add(rel_meta_dis_ref)
-        return references_dict, diseases_dict
-
-    @staticmethod
-    def _disease_ontology_dict(ontology: str) -> Mapping[str, str]:
-        """Create a dictionary from the disease ontologies used for mapping HMDB disease names to those ontologies."""
-        doid_path = ONTOLOGY_NAMESPACES[ontology]
-        doid_ns = get_bel_resource(doid_path)
-        return {value.lower(): value for value in doid_ns['Values']}
-
-    def populate(self, source: Optional[str] = None, map_dis: bool = True, group_size: int = 500_000):
-        """Populate the database with the HMDB data.
+            path: str,
+            dataset: Mapping[str, str],
+            worker: int,
+            workers: int,
+            batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+            shard_size: int = DEFAULT_SHARD_SIZE,
+            engine: Optional[str] = None,
+            sections: Optional[frozenset] = None,
+    ) -> int:
+        """Load the shards of a worker from a local file with an :class:`bio2bel_hmdb.loader.UpsertLoader`."""
+        records = set_dataset(
+            iter_worker_records(path, worker=worker, workers=workers, shard_size=shard_size, engine=engine,
+                                sections=sections),
+            dataset,
+        )
+
+        loader = UpsertLoader(self.session, batch_size=batch_size)
+        for record in tqdm(records, desc='HMDB Metabolite (worker {}/{})'.format(worker + 1, workers)):
+            loader.add(record)
+        loader.commit()
 
-        :param source: Path to an .xml file. If None the whole HMDB will be downloaded and used for population.
-        :param map_dis: Should diseases be mapped?
+        return loader.record_count
+
+    @_invalidates_caches
+    def populate_worker(
+            self,
+            source: Optional[str] = None,
+            worker: int = 0,
+            workers: int = 1,
+            batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+            shard_size: int = DEFAULT_SHARD_SIZE,
+            engine: Optional[str] = None,
+            profile: Profile = None,
+    ) -> int:
+        """Load one part of the HMDB data while other workers load the other parts into the same database.
+
+        The source is split into shards with :func:`bio2bel_hmdb.parser.get_shards` and this worker loads every
+        ``workers``-th of them with an :class:`bio2bel_hmdb.loader.UpsertLoader`, so several processes or nodes can
+        populate one PostgreSQL database together. They must use the same source, shard size and number of workers.
+        The tables have to be created before the workers start. A worker that fails can not be resumed, since its
+        committed metabolites would be loaded again.
+
+        The diseases are not mapped, so :meth:`map_diseases` should be run once after all workers finished.
+
+        :param source: Path to an .xml file, or to a .zip or .gz archive of one, its URL or the name of a dataset from
+                       :data:`bio2bel_hmdb.constants.DATASET_URLS`. If None the whole HMDB will be downloaded and used.
+        :param worker: The index of this worker, from 0 to ``workers - 1``
+        :param workers: The number of workers
+        :param batch_size: The number of metabolites written in each transaction
+        :param shard_size: The approximate size in bytes of each shard
+        :param engine: The name of the XML parser engine from :data:`bio2bel_hmdb.engines.ENGINES`. Defaults to lxml if
+                       it is installed.
+        :param profile: The name of an ingest profile from :data:`bio2bel_hmdb.parser.PROFILES` or the sections to
+                        load. Defaults to all sections.
+        :return: The number of metabolites loaded by this worker
+        :raises ValueError: If the index of the worker is not below the number of workers, or the database can not
+                            skip conflicting rows
         """
-        # construct sets for disease ontologies for mapping hmdb diseases
-        if not map_dis:
-            disease_ontologies = None
-        else:
-            disease_ontologies = {
-                ontology: self._disease_ontology_dict(ontology)
-                for ontology in ONTOLOGIES
-            }
+        return self._load_worker(
+            ensure_source(source),
+            get_dataset(source),
+            worker=worker,
+            workers=workers,
+            batch_size=batch_size,
+            shard_size=shard_size,
+            engine=engine,
+            sections=get_sections(profile),
+        )
+
+    @_invalidates_caches
+    def populate_distributed(
+            self,
+            source: Optional[str] = None,
+            workers: Optional[int] = None,
+            map_dis: bool = True,
+            batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+            shard_size: int = DEFAULT_SHARD_SIZE,
+            engine: Optional[str] = None,
+            ontology_locations: OntologyLocations = None,
+            profile: Profile = None,
+    ) -> int:
+        """Populate the database with several local worker processes that each run :meth:`populate_worker`.
+
+        Every worker parses its own shards and writes them through its own connection, so the throughput grows with the
+        number of workers as long as the database keeps up. This needs a database that several processes can write
+        to, like PostgreSQL or an SQLite file, which serializes the transactions of the workers.
+
+        :param source: Path to an .xml file, or to a .zip or .gz archive of one, its URL or the name of a dataset from
+                       :data:`bio2bel_hmdb.constants.DATASET_URLS`. If None the whole HMDB will be downloaded and used.
+        :param workers: The number of worker processes. Defaults to the number of CPUs.
+        :param map_dis: Should diseases be mapped with :meth:`map_diseases` after loading?
+        :param batch_size: The number of metabolites written in each transaction
+        :param shard_size: The approximate size in bytes of each shard
+        :param engine: The name of the XML parser engine from :data:`bio2bel_hmdb.engines.ENGINES`. Defaults to lxml if
+                       it is installed.
+        :param ontology_locations: The URLs or paths of the namespaces of the disease ontologies, or a directory with
+                                   them. They are read from the cache of :mod:`bio2bel_hmdb.ontologies` if possible.
+        :param profile: The name of an ingest profile from :data:`bio2bel_hmdb.parser.PROFILES` or the sections to
+                        load. Defaults to all sections.
+        :return: The number of loaded metabolites
+        :raises ValueError: If the database is an in-memory SQLite database
+        """
+        if self.engine.dialect.name == 'sqlite' and self.engine.url.database in (None, '', ':memory:'):
+            raise ValueError('an in-memory SQLite database can not be shared between processes')
+
+        sections = get_sections(profile)
+        disease_ontologies = load_disease_ontologies(ontology_locations) if map_dis and 'diseases' in sections else None
+
+        # download and decompress once, instead of in each worker
+        path = _ensure_uncompressed(ensure_source(source))
+        dataset = get_dataset(source)
 
-        # construct xml tree
-        tree = get_data(source)
-        root = tree.getroot()
-
-        # dicts to check unique constraints for specific tables
-        biofluids_dict = {}
-        tissues_dict = {}
-        pathways_dict = {}
-        proteins_dict = {}
-        references_dict = {}
-        diseases_dict = {}
-        # biofunctions_dict = {}
-        cellular_locations_dict = {}
-
-        # iterate through xml tree
-        for i, elements in enumerate(tqdm(root, desc='HMDB Metabolite')):
-            # create metabolite dict used to feed in main metabolite table
-            metabolite = Metabolite()
-
-            for element in elements:
-                # delete namespace prefix
-                tag = self._get_tag(element.tag)
-
-                # handle wikipedia typo in xml tags
-                if tag == "wikipidia":
-                    log.warning("HMDB fixed the 'wikipidia' tag to 'wikipedia'. Change code.")
-                    tag = "wikipedia"
-
-                if tag == "secondary_accessions":
-                    self.session.add_all([
-                        SecondaryAccession(
-                            metabolite=metabolite,
-                            secondary_accession=secondary_accession_element.text
-                        )
-                        for secondary_accession_element in element
-                    ])
-
-                elif tag == "synonyms":
-                    synonyms = {
-                        synonym_element.text
-                        for synonym_element in element
-                    }
-                    self.session.add_all([
-                        MetaboliteSynonym(
-                            metabolite=metabolite,
-                            synonym=synonym,
-                        )
-                        for synonym in synonyms
-                    ])
-
-                elif tag == "taxonomy":  # will be delayed to later versions since not important for BEL
-                    continue
-
-                elif tag == "ontology":
-                    continue
-
-                elif tag == "cellular_locations":
-                    cellular_locations_dict = self._populate_with_1_layer_elements(
-                        element,
-                        metabolite,
-                        cellular_locations_dict,
-                        CellularLocation,
-                        MetaboliteCellularLocation,
-                        "cellular_location"
-                    )
-
-                elif tag == "experimental_properties":  # will be delayed to later versions since not important for BEL
-                    continue
-
-                elif tag == "predicted_properties":  # will be delayed to later versions since not important for BEL
-                    continue
-
-                elif tag == "spectra":  # will not be processed since the corresponding database is down
-                    continue
-
-                elif tag == "biospecimen_locations":
-                    biofluids_dict = self._populate_with_1_layer_elements(
-                        element,
-                        metabolite,
-                        biofluids_dict,
-                        Biofluid,
-                        MetaboliteBiofluid,
-                        'biofluid',
-                    )
-
-                elif tag == "tissue_locations":
-                    tissues_dict = self._populate_with_1_layer_elements(
-                        element,
-                        metabolite,
-                        tissues_dict,
-                        Tissue,
-                        MetaboliteTissue,
-                        'tissue',
-                    )
-
-                elif tag == "pathways":
-                    pathways_dict = self._populate_with_2_layer_elements(
-                        element,
-                        metabolite,
-                        pathways_dict,
-                        Pathway,
-                        MetabolitePathway,
-                        'pathway',
-                    )
-
-                elif tag == "normal_concentrations":  # will be delayed to later versions since not important for BEL
-                    continue
-
-                elif tag == "abnormal_concentrations":  # will be delayed to later versions since not important for BEL
-                    continue
-
-                elif tag == "diseases":
-                    references_dict, diseases_dict = self._populate_diseases(
-                        element,
-                        references_dict,
-                        diseases_dict,
-                        metabolite,
-                        disease_ontologies,
-                        map_dis=map_dis,
-                    )
-
-                elif tag == "general_references":
-                    references_dict = self._populate_with_2_layer_elements(
-                        element,
-                        metabolite,
-                        references_dict,
-                        Reference,
-                        MetaboliteReference,
-                        'reference',
-                        "reference_text",
-                    )
-
-                elif tag == "protein_associations":
-                    proteins_dict = self._populate_with_2_layer_elements(
-                        element,
-                        metabolite,
-                        proteins_dict,
-                        Protein,
-                        MetaboliteProtein,
-                        'protein',
-                    )
-
-                else:  # feed in main metabolite table
-                    setattr(metabolite, tag, element.text)
-
-            self.session.add(metabolite)
-
-            if (i + 1) % group_size:
-                log.warning('committing')
-                self.session.commit()
+        if workers is None:
+            workers = os.cpu_count()
 
+        self.create_all()
         self.session.commit()
 
-    def get_metabolite_by_accession(self, hmdb_metabolite_accession: str) -> Optional[Metabolite]:
+        log.info('populating from %s with %d workers', path, workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _load_worker, str(self.engine.url), path, dataset, worker, workers,
+                    batch_size=batch_size, shard_size=shard_size, engine=engine, sections=sections,
+                )
+                for worker in range(workers)
+            ]
+            count = sum(future.result() for future in futures)
+
+        if disease_ontologies is not None:
+            self._map_diseases(disease_ontologies)
+
+        return count
+
+    def create_indexes(self) -> List[str]:
+        """Add the indexes of the models that are missing from the database in place.
+
+        Databases that were populated by an older version of this package lack the indexes on the foreign keys of the
+        relation tables and on the lookup columns. Databases that were left by a fast load that failed before building
+        its indexes also lack the unique indexes in place of the unique constraints. They are created without reloading
+        the data.
+
+        :return: The names of the created indexes
+        """
+        self.session.commit()
+        return create_missing_indexes(self.engine)
+
+    def build_adjacency_index(self, path: Optional[str] = None) -> AdjacencyIndex:
+        """Read the relations of the metabolites to the proteins, diseases, pathways, tissues and biofluids into an
+        :class:`bio2bel_hmdb.adjacency.AdjacencyIndex`.
+
+        The enrichment functions of :mod:`bio2bel_hmdb.enrich` use the index instead of the database until the database
+        is changed by this manager.
+
+        :param path: If given, save the index to this file, so it can be loaded with :meth:`load_adjacency_index`
+        """
+        self.adjacency_index = AdjacencyIndex.from_session(self.session)
+        if path is not None:
+            self.adjacency_index.save(path)
+        return self.adjacency_index
+
+    def load_adjacency_index(self, path: str, mmap: bool = True) -> AdjacencyIndex:
+        """Load an adjacency index saved by :meth:`build_adjacency_index`, which the enrichment functions then use.
+
+        :param path: The path of the index
+        :param mmap: Should the file be memory-mapped instead of read into memory?
+        """
+        self.adjacency_index = AdjacencyIndex.load(path, mmap=mmap)
+        return self.adjacency_index
+
+    def get_checkpoint(self, source: str) -> Optional[Checkpoint]:
+        """Get the checkpoint of the population with the given source if it exists.
+
+        :param source: The path given to :meth:`populate` or the URL of the HMDB data if none was given
+        """
+        return self.session.query(Checkpoint).filter(Checkpoint.source == source).one_or_none()
+
+    def _get_by_keys(self, column, keys: Iterable[str], options=(), chunk_size: int = SELECT_CHUNK_SIZE) -> Dict:
+        """Get the instances of a model with the given values of a column with one query for each chunk of values.
+
+        :param column: A column of a model, like ``Metabolite.accession``
+        :param keys: The values of the column
+        :param options: Loader options, like for eagerly loading relationships
+        :param chunk_size: The maximum number of values in the ``IN`` clause of each query
+        :return: The instances with each value, in the order of the first occurrence of the values
+        """
+        keys = list(dict.fromkeys(keys))
+        instances = defaultdict(list)
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            query = self.session.query(column.class_).filter(column.in_(chunk)).options(*options)
+            for instance in query:
+                instances[getattr(instance, column.key)].append(instance)
+
+        return {
+            key: instances.get(key)
+            for key in keys
+        }
+
+    def _lookup(
+            self,
+            name: str,
+            column,
+            keys: Iterable[str],
+            get_result,
+            options=(),
+            chunk_size: int = SELECT_CHUNK_SIZE,
+    ) -> Dict:
+        """Get the results of the instances of a model with the given values of a column, using the lookup cache.
+
+        :param name: The name of the lookup from :data:`SNAPSHOT_PATHS`, which is part of the keys of the cache
+        :param column: A column of a model, like ``Metabolite.accession``
+        :param keys: The values of the column
+        :param get_result: A function that gets the result from the list of the instances with a value
+        :param options: Loader options, like for eagerly loading relationships
+        :param chunk_size: The maximum number of values in the ``IN`` clause of each query
+        :return: The result of each value, or None if there is no instance with it, in the order of the first
+                 occurrence of the values. If there is a lookup cache, the results are made of snapshots.
+        """
+        if self.lookup_cache is None:
+            return {
+                key: instances and get_result(instances)
+                for key, instances in self._get_by_keys(column, keys, options=options, chunk_size=chunk_size).items()
+            }
+
+        keys = list(dict.fromkeys(keys))
+        results = {}
+        missing = []
+        sentinel = object()
+
+        for key in keys:
+            result = self.lookup_cache.get((name, key), sentinel)
+            if result is sentinel:
+                missing.append(key)
+            else:
+                results[key] = result
+
+        # the instances are kept until the snapshots are made, so the relationships back to them are not loaded again
+        instances = self._get_by_keys(column, missing, options=options, chunk_size=chunk_size)
+        paths = SNAPSHOT_PATHS[name]
+
+        for key, key_instances in instances.items():
+            result = key_instances and get_result(key_instances)
+            if isinstance(result, list):
+                result = tuple(make_snapshot(instance, paths) for instance in result)
+            elif result is not None:
+                result = make_snapshot(result, paths)
+
+            self.lookup_cache.set((name, key), result)
+            results[key] = result
+
+        return {
+            key: results[key]
+            for key in keys
+        }
+
+    def get_metabolite_by_accession(
+            self,
+            hmdb_metabolite_accession: str,
+            strategy: str = 'selectin',
+    ) -> Optional[Metabolite]:
         """Query the constructed HMDB database and extract a metabolite object.
 
+        The relations to its proteins, diseases and references are loaded with it, in four queries with the default
+        strategy or in one with ``joined``.
+
         :param hmdb_metabolite_accession: HMDB metabolite identifier
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
 
         Example:
 
@@ -396,40 +865,191 @@ class Manager(AbstractManager):
         >>> manager = bio2bel_hmdb.Manager()
         >>> manager.get_metabolite_by_accession("HMDB00072")
         """
-        return self.session.query(Metabolite).filter(Metabolite.accession == hmdb_metabolite_accession).one_or_none()
+        metabolites = self.get_metabolites_by_accessions([hmdb_metabolite_accession], strategy=strategy)
+        return metabolites[hmdb_metabolite_accession]
 
-    def query_metabolite_associated_proteins(self, hmdb_metabolite_id: str) -> Optional[List[Protein]]:
+    def get_metabolites_by_accessions(
+            self,
+            hmdb_metabolite_accessions: Iterable[str],
+            chunk_size: int = SELECT_CHUNK_SIZE,
+            strategy: str = 'selectin',
+    ) -> Dict[str, Optional[Metabolite]]:
+        """Get the metabolites with many accessions, with their proteins, diseases and references.
+
+        With the default strategy, there are four queries for each chunk of accessions.
+
+        :param hmdb_metabolite_accessions: HMDB metabolite identifiers
+        :param chunk_size: The maximum number of accessions in each query
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :return: The metabolite with each accession, or None if it is not in the database
+
+        Example:
+
+        >>> import bio2bel_hmdb
+        >>> manager = bio2bel_hmdb.Manager()
+        >>> manager.get_metabolites_by_accessions(["HMDB00072", "HMDB00008"])
+        """
+        return self._lookup(
+            'metabolites',
+            Metabolite.accession,
+            hmdb_metabolite_accessions,
+            lambda metabolites: metabolites[0],
+            options=get_loader_options(METABOLITE_PATHS, strategy),
+            chunk_size=chunk_size,
+        )
+
+    def query_metabolite_associated_proteins(
+            self,
+            hmdb_metabolite_id: str,
+            strategy: str = 'selectin',
+    ) -> Optional[List[MetaboliteProtein]]:
         """Query the constructed HMDB database to get the metabolite associated protein relations for BEL enrichment
 
         :param hmdb_metabolite_id: HMDB metabolite identifier
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
         """
-        metabolite = self.get_metabolite_by_accession(hmdb_metabolite_id)
-        if metabolite is not None:
-            return metabolite.proteins
+        return self.query_metabolites_associated_proteins([hmdb_metabolite_id], strategy=strategy)[hmdb_metabolite_id]
 
-    def query_metabolite_associated_diseases(self, hmdb_metabolite_id: str) -> List[Disease]:
+    def query_metabolites_associated_proteins(
+            self,
+            hmdb_metabolite_ids: Iterable[str],
+            chunk_size: int = SELECT_CHUNK_SIZE,
+            strategy: str = 'selectin',
+    ) -> Dict[str, Optional[List[MetaboliteProtein]]]:
+        """Get the metabolite-protein relations of many metabolites.
+
+        The relations and their proteins are loaded together with each chunk of metabolites, so there are two queries
+        for each chunk with the default strategy.
+
+        :param hmdb_metabolite_ids: HMDB metabolite identifiers
+        :param chunk_size: The maximum number of accessions in each query
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :return: The relations of the metabolite with each accession, or None if it is not in the database
+        """
+        return self._lookup(
+            'metabolite_proteins',
+            Metabolite.accession,
+            hmdb_metabolite_ids,
+            lambda metabolites: metabolites[0].proteins,
+            options=get_loader_options(METABOLITE_PROTEIN_PATHS, strategy),
+            chunk_size=chunk_size,
+        )
+
+    def query_metabolite_associated_diseases(
+            self,
+            hmdb_metabolite_id: str,
+            strategy: str = 'selectin',
+    ) -> Optional[List[MetaboliteDiseaseReference]]:
         """Query the constructed HMDB database to get the metabolite associated disease relations for BEL enrichment
 
         :param hmdb_metabolite_id: HMDB metabolite identifier
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        """
+        return self.query_metabolites_associated_diseases([hmdb_metabolite_id], strategy=strategy)[hmdb_metabolite_id]
+
+    def query_metabolites_associated_diseases(
+            self,
+            hmdb_metabolite_ids: Iterable[str],
+            chunk_size: int = SELECT_CHUNK_SIZE,
+            strategy: str = 'selectin',
+    ) -> Dict[str, Optional[List[MetaboliteDiseaseReference]]]:
+        """Get the metabolite-disease relations of many metabolites.
+
+        The relations with their diseases and references are loaded together with each chunk of metabolites, so there
+        are two queries for each chunk with the default strategy.
+
+        :param hmdb_metabolite_ids: HMDB metabolite identifiers
+        :param chunk_size: The maximum number of accessions in each query
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :return: The relations of the metabolite with each accession, or None if it is not in the database
         """
-        metabolite = self.get_metabolite_by_accession(hmdb_metabolite_id)
-        return metabolite.diseases
+        return self._lookup(
+            'metabolite_diseases',
+            Metabolite.accession,
+            hmdb_metabolite_ids,
+            lambda metabolites: metabolites[0].diseases,
+            options=get_loader_options(METABOLITE_DISEASE_PATHS, strategy),
+            chunk_size=chunk_size,
+        )
 
-    def query_disease_associated_metabolites(self, disease_name: str) -> List[Metabolite]:
+    def query_disease_associated_metabolites(
+            self,
+            disease_name: str,
+            strategy: str = 'selectin',
+    ) -> Optional[List[MetaboliteDiseaseReference]]:
         """Query function that returns a list of metabolite-disease interactions, which are associated to a disease.
 
         :param disease_name: HMDB disease name
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        """
+        return self.query_diseases_associated_metabolites([disease_name], strategy=strategy)[disease_name]
+
+    def query_diseases_associated_metabolites(
+            self,
+            disease_names: Iterable[str],
+            chunk_size: int = SELECT_CHUNK_SIZE,
+            strategy: str = 'selectin',
+    ) -> Dict[str, Optional[List[MetaboliteDiseaseReference]]]:
+        """Get the metabolite-disease relations of many diseases.
+
+        The relations with their metabolites and references are loaded together with each chunk of diseases, so there
+        are two queries for each chunk with the default strategy.
+
+        :param disease_names: HMDB disease names
+        :param chunk_size: The maximum number of names in each query
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :return: The relations of the disease with each name, or None if it is not in the database
         """
-        return self.session.query(Disease).filter(Disease.name == disease_name).one_or_none().metabolites
+        return self._lookup(
+            'disease_metabolites',
+            Disease.name,
+            disease_names,
+            lambda diseases: diseases[0].metabolites,
+            options=get_loader_options(DISEASE_METABOLITE_PATHS, strategy),
+            chunk_size=chunk_size,
+        )
 
-    def query_protein_associated_metabolites(self, uniprot_id):
+    def query_protein_associated_metabolites(self, uniprot_id, strategy='selectin'):
         """Query function that returns a list of metabolite-disease interactions, which are associated to a disease.
 
         :param str uniprot_id: uniprot identifier of a protein for which the associated metabolite relations should be
                                 outputted
-        :rtype: list
+        :param str strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :rtype: Optional[list[MetaboliteProtein]]
         """
-        return self.session.query(Protein).filter(Protein.uniprot_id == uniprot_id).one_or_none().metabolites
+        return self.query_proteins_associated_metabolites([uniprot_id], strategy=strategy)[uniprot_id]
+
+    def query_proteins_associated_metabolites(
+            self,
+            uniprot_ids: Iterable[str],
+            chunk_size: int = SELECT_CHUNK_SIZE,
+            strategy: str = 'selectin',
+    ) -> Dict[str, Optional[List[MetaboliteProtein]]]:
+        """Get the metabolite-protein relations of many proteins.
+
+        The relations and their metabolites are loaded together with each chunk of proteins, so there are two queries
+        for each chunk with the default strategy.
+
+        :param uniprot_ids: UniProt identifiers
+        :param chunk_size: The maximum number of identifiers in each query
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relations
+        :return: The relations of the proteins with each identifier, or None if there is no such protein
+        """
+        def get_result(proteins):
+            return [
+                association
+                for protein in proteins
+                for association in protein.metabolites
+            ]
+
+        return self._lookup(
+            'protein_metabolites',
+            Protein.uniprot_id,
+            uniprot_ids,
+            get_result,
+            options=get_loader_options(PROTEIN_METABOLITE_PATHS, strategy),
+            chunk_size=chunk_size,
+        )
 
     def get_hmdb_accession(self):
         """Create a list of all HMDB metabolite identifiers present in the database.
@@ -453,19 +1073,35 @@ class Manager(AbstractManager):
 
         return [a for a, in accessions]
 
-    def _get_models(self, interaction_table):
+    def _get_models(self, interaction_table, paths=(), strategy='joined'):
         """Extracts all interactions from the many to many interaction table.
 
         :param type interaction_table: Relation table from the database model. (e.g. MetaboliteProteins)
+        :param paths: The relationships to load with the interactions
+        :param str strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relationships
         :rtype: query
         """
-        return self.session.query(interaction_table).all()
+        return self.session.query(interaction_table).options(*get_loader_options(paths, strategy)).all()
 
-    def get_metabolite_disease_interactions(self) -> List[MetaboliteDiseaseReference]:
-        return self._get_models(MetaboliteDiseaseReference)
+    def get_metabolite_disease_interactions(self, strategy: str = 'joined') -> List[MetaboliteDiseaseReference]:
+        """Get all metabolite-disease relations with their metabolites, diseases and references.
 
-    def get_metabolite_protein_interactions(self) -> List[MetaboliteProtein]:
-        return self._get_models(MetaboliteProtein)
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relationships. They are joined
+                         into a single query by default.
+        """
+        return self._get_models(MetaboliteDiseaseReference, METABOLITE_DISEASE_INTERACTION_PATHS, strategy)
+
+    def get_metabolite_protein_interactions(self, strategy: str = 'joined') -> List[MetaboliteProtein]:
+        """Get all metabolite-protein relations with their metabolites and proteins.
+
+        :param strategy: The strategy from :data:`LOADER_STRATEGIES` for loading the relationships. They are joined
+                         into a single query by default.
+        """
+        return self._get_models(MetaboliteProtein, METABOLITE_PROTEIN_INTERACTION_PATHS, strategy)
+
+    def count_datasets(self) -> int:
+        """Count the number of datasets with which the database was populated."""
+        return self._count_model(Dataset)
 
     def count_diseases(self) -> int:
         """Count the number of diseases in the database."""
@@ -517,3 +1153,13 @@ class Manager(AbstractManager):
             metabolites=self.count_metabolites(),
             tissues=self.count_tissues(),
         )
+
+
+def _load_worker(connection: str, path: str, dataset: Mapping[str, str], worker: int, workers: int, **kwargs) -> int:
+    """Load the shards of a worker in a worker process, with a manager of its own."""
+    manager = Manager(connection=connection)
+    try:
+        return manager._load_worker(path, dataset, worker, workers, **kwargs)
+    finally:
+        manager.session.close()
+        manager.engine.dispose()
@@ -4,9 +4,9 @@
 original HMDB data.
 """
 
-from sqlalchemy import Column, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, Column, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 
 from pybel.dsl import abundance, pathology, protein
 from .constants import MODULE_NAME
@@ -36,6 +36,27 @@ CELLULAR_LOCATION_TABLE_NAME = f'{MODULE_NAME}_cellularLocation'
 METABOLITE_CELLULAR_LOCATION_TABLE_NAME = f'{MODULE_NAME}_metabolite_cellularLocation'
 BIOFUNCTION_TABLE_NAME = f'{MODULE_NAME}_biofunction'
 METABOLITE_BIOFUNCTION_TABLE_NAME = f'{MODULE_NAME}_metabolite_biofunction'
+DATASET_TABLE_NAME = f'{MODULE_NAME}_dataset'
+METABOLITE_DATASET_TABLE_NAME = f'{MODULE_NAME}_metabolite_dataset'
+CHECKPOINT_TABLE_NAME = f'{MODULE_NAME}_checkpoint'
+
+
+def _get_relation_indexes(table_name: str, column: str, *columns: str):
+    """Get the indexes of a table that relates the metabolites to the rows of another table.
+
+    The first index starts with the metabolite, which serves loading the relations of metabolites and deleting them.
+    The second one starts with the other side, which serves the reverse lookups like the metabolites of a protein.
+    Both contain the other key, so joining to the other table does not need to read the relation rows.
+
+    :param table_name: The name of the relation table
+    :param column: The name of the foreign key column to the other table
+    :param columns: The names of further foreign key columns to include in the index that starts with the metabolite
+    """
+    name = column.rsplit('_', 1)[0]
+    return (
+        Index(f'ix_{table_name}_metabolite', 'metabolite_id', column, *columns),
+        Index(f'ix_{table_name}_{name}', column, 'metabolite_id'),
+    )
 
 
 class Metabolite(Base):
@@ -56,12 +77,12 @@ class Metabolite(Base):
     iupac_name = Column(Text, nullable=True, doc="IUPAC name of the metabolite")
     traditional_iupac = Column(Text, nullable=True, doc="")
     trivial = Column(String(255), nullable=True, doc="Trivial name of the metabolite")
-    cas_registry_number = Column(String(255), nullable=True, doc="Cas registry number of the metabolite")
+    cas_registry_number = Column(String(255), nullable=True, index=True, doc="Cas registry number of the metabolite")
     smiles = Column(Text, nullable=True, doc="Smiles representation of the metabolite")
     inchi = Column(Text, nullable=True, doc="InChi of the metabolite")
-    inchikey = Column(String(255), nullable=True, doc="InCHI key of the metabolite")
+    inchikey = Column(String(255), nullable=True, index=True, doc="InCHI key of the metabolite")
     state = Column(String(255), nullable=True, doc="Aggregate state of the metabolite")
-    drugbank_id = Column(String(255), nullable=True, doc="DrugBank identifier of the metabolite")
+    drugbank_id = Column(String(255), nullable=True, index=True, doc="DrugBank identifier of the metabolite")
     drugbank_metabolite_id = Column(String(255), nullable=True, doc="Drugbank metabolite ID of the metabolite")
     phenol_explorer_compound_id = Column(String(255), nullable=True,
                                          doc="Phenol explorer compound ID of the metabolite")
@@ -69,17 +90,17 @@ class Metabolite(Base):
                                            doc="Phenol explorer metabolite ID of the metabolite")
     foodb_id = Column(String(255), nullable=True, doc="FooDB ID of the metabolite")
     knapsack_id = Column(String(255), nullable=True, doc="Knapsack ID of the metabolite")
-    chemspider_id = Column(String(255), nullable=True, doc="Chemspider ID of the metabolite")
-    kegg_id = Column(String(255), nullable=True, doc="KEGG ID of the metabolite")
+    chemspider_id = Column(String(255), nullable=True, index=True, doc="Chemspider ID of the metabolite")
+    kegg_id = Column(String(255), nullable=True, index=True, doc="KEGG ID of the metabolite")
     biocyc_id = Column(String(255), nullable=True, doc="BioCyc ID of the metabolite")
     bigg_id = Column(String(255), nullable=True, doc="Bigg ID of the metabolite")
     wikipedia = Column(String(255), nullable=True, doc="Wikipedia name of the metabolite")
     nugowiki = Column(String(255), nullable=True, doc="NukoWiki ID of the metabolite")
     metagene = Column(String(255), nullable=True, doc="Metagene ID of the metabolite")
     metlin_id = Column(String(255), nullable=True, doc="Metlin ID of the metabolite")
-    pubchem_compound_id = Column(String(255), nullable=True, doc="PubChem compound ID of the metabolite")
+    pubchem_compound_id = Column(String(255), nullable=True, index=True, doc="PubChem compound ID of the metabolite")
     het_id = Column(String(255), nullable=True, doc="Het ID of the metabolite")
-    chebi_id = Column(String(255), nullable=True, doc="ChEBI identifier of the metabolite")
+    chebi_id = Column(String(255), nullable=True, index=True, doc="ChEBI identifier of the metabolite")
     synthesis_reference = Column(Text, nullable=True, doc="Synthesis reference citation of the metabolite")
 
     def __repr__(self):
@@ -104,7 +125,7 @@ class SecondaryAccession(Base):
     secondary_accession = Column(String(255), nullable=False, unique=True,
                                  doc="Other accession numbers for the metabolite")
 
-    metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
+    metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)), index=True)
     metabolite = relationship(Metabolite, backref="accessions")
 
 
@@ -117,7 +138,7 @@ class MetaboliteSynonym(Base):
 
     synonym = Column(String(255), nullable=False, unique=True, doc="Synonym for the metabolite")
 
-    metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
+    metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)), index=True)
     metabolite = relationship(Metabolite, backref="synonyms")
 
 
@@ -134,14 +155,15 @@ class MetaboliteBiofluid(Base):
     """Table representing the Metabolite and Biofluid relations."""
 
     __tablename__ = METABOLITE_BIOFLUID_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'biofluid_id')
 
     id = Column(Integer, primary_key=True)
 
     metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
-    metabolite = relationship(Metabolite, backref="biofluids")
+    metabolite = relationship(Metabolite, backref=backref("biofluids", order_by=id))
 
     biofluid_id = Column(Integer, ForeignKey("{}.id".format(BIOFLUID_TABLE_NAME)))
-    biofluid = relationship(Biofluid, backref="metabolites")
+    biofluid = relationship(Biofluid, backref=backref("metabolites", order_by=id))
 
 
 class Tissue(Base):
@@ -156,14 +178,15 @@ class Tissue(Base):
 class MetaboliteTissue(Base):
     """Table storing the different relations between tissues and metabolites"""
     __tablename__ = "metabolite_tissues"
+    __table_args__ = _get_relation_indexes(__tablename__, 'tissue_id')
 
     id = Column(Integer, primary_key=True)
 
     metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
-    metabolite = relationship(Metabolite, backref="tissues")
+    metabolite = relationship(Metabolite, backref=backref("tissues", order_by=id))
 
     tissue_id = Column(Integer, ForeignKey("{}.id".format(TISSUE_TABLE_NAME)))
-    tissue = relationship(Tissue, backref="metabolites")
+    tissue = relationship(Tissue, backref=backref("metabolites", order_by=id))
 
 
 class Pathway(Base):
@@ -183,14 +206,15 @@ class MetabolitePathway(Base):
     """Table storing the different relations between pathways and metabolites."""
 
     __tablename__ = METABOLITE_PATHWAY_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'pathway_id')
 
     id = Column(Integer, primary_key=True)
 
     metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
-    metabolite = relationship(Metabolite, backref="pathways")
+    metabolite = relationship(Metabolite, backref=backref("pathways", order_by=id))
 
     pathway_id = Column(Integer, ForeignKey("{}.id".format(PATHWAY_TABLE_NAME)))
-    pathway = relationship(Pathway, backref="metabolites")
+    pathway = relationship(Pathway, backref=backref("metabolites", order_by=id))
 
 
 class Protein(Base):
@@ -201,7 +225,7 @@ class Protein(Base):
     id = Column(Integer, primary_key=True)
     protein_accession = Column(String(255), nullable=False, unique=True, doc="HMDB accession number for the protein")
     name = Column(String(255), nullable=False)
-    uniprot_id = Column(String(255), nullable=True, doc="UniProt identifier of the protein")
+    uniprot_id = Column(String(255), nullable=True, index=True, doc="UniProt identifier of the protein")
     gene_name = Column(String(255), nullable=True, doc="Gene name of the protein coding gene")
     protein_type = Column(String(255), nullable=True, doc="Protein type like 'enzyme' etc.")
 
@@ -214,14 +238,15 @@ class MetaboliteProtein(Base):
     """Table representing the many to many relationship between metabolites and proteins."""
 
     __tablename__ = METABOLITE_PROTEIN_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'protein_id')
 
     id = Column(Integer, primary_key=True)
 
     metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
-    metabolite = relationship(Metabolite, backref="proteins")
+    metabolite = relationship(Metabolite, backref=backref("proteins", order_by=id))
 
     protein_id = Column(Integer, ForeignKey("{}.id".format(PROTEIN_TABLE_NAME)))
-    protein = relationship(Protein, backref="metabolites")
+    protein = relationship(Protein, backref=backref("metabolites", order_by=id))
 
 
 class Reference(Base):
@@ -242,6 +267,7 @@ class MetaboliteReference(Base):
     """Table representing the many to many relationship between metabolites and references."""
 
     __tablename__ = METABOLITE_REFERENCE_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'reference_id')
 
     id = Column(Integer, primary_key=True)
 
@@ -278,14 +304,17 @@ class MetaboliteDiseaseReference(Base):
     """Table storing the relations between disease and metabolite"""
 
     __tablename__ = METABOLITE_DISEASE_REFERENCE_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'disease_id', 'reference_id') + (
+        Index(f'ix_{__tablename__}_reference', 'reference_id'),
+    )
 
     id = Column(Integer, primary_key=True)
 
     metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
-    metabolite = relationship(Metabolite, backref="diseases")
+    metabolite = relationship(Metabolite, backref=backref("diseases", order_by=id))
 
     disease_id = Column(Integer, ForeignKey("{}.id".format(DISEASE_TABLE_NAME)))
-    disease = relationship(Disease, backref="metabolites")
+    disease = relationship(Disease, backref=backref("metabolites", order_by=id))
 
     reference_id = Column(Integer, ForeignKey("{}.id".format(REFERENCE_TABLE_NAME)))
     reference = relationship(Reference, backref="diseases")
@@ -307,6 +336,7 @@ class MetaboliteCellularLocation(Base):
     """Table storing the many to many relations between metabolites and cellular location GO annotations"""
 
     __tablename__ = METABOLITE_CELLULAR_LOCATION_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'cellular_location_id')
 
     id = Column(Integer, primary_key=True)
 
@@ -330,6 +360,7 @@ class MetaboliteBiofunction(Base):
     """Table storing the many to many relations between metabolites and cellular location GO annotations"""
 
     __tablename__ = METABOLITE_BIOFUNCTION_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'biofunctions_id')
 
     id = Column(Integer, primary_key=True)
 
@@ -340,6 +371,35 @@ class MetaboliteBiofunction(Base):
     biofunction = relationship(Biofunction, backref="metabolites")
 
 
+class Dataset(Base):
+    """Table storing the HMDB .xml files with which the database was populated, like the full set of metabolites or
+    the metabolites found in sweat."""
+
+    __tablename__ = DATASET_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False, unique=True, doc="Name of the dataset, like hmdb_metabolites")
+    source = Column(Text, nullable=True, doc="The URL or path from which the dataset was read")
+
+    def __repr__(self):
+        return f'<Dataset {self.name}>'
+
+
+class MetaboliteDataset(Base):
+    """Table storing the many to many relations between metabolites and the datasets in which they were found"""
+
+    __tablename__ = METABOLITE_DATASET_TABLE_NAME
+    __table_args__ = _get_relation_indexes(__tablename__, 'dataset_id')
+
+    id = Column(Integer, primary_key=True)
+
+    metabolite_id = Column(Integer, ForeignKey("{}.id".format(METABOLITE_TABLE_NAME)))
+    metabolite = relationship(Metabolite, backref="datasets")
+
+    dataset_id = Column(Integer, ForeignKey("{}.id".format(DATASET_TABLE_NAME)))
+    dataset = relationship(Dataset, backref="metabolites")
+
+
 class PropertyValues(Base):
     """Table storing the values of chemical properties.
 
@@ -376,3 +436,20 @@ class PropertySource(Base):
 
     id = Column(Integer, primary_key=True)
     source = Column(String(255), nullable=False, unique=True)
+
+
+class Checkpoint(Base):
+    """Table storing the progress of populating the database, so an interrupted population can be resumed."""
+
+    __tablename__ = CHECKPOINT_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(255), nullable=False, unique=True, doc="The source with which the database is populated")
+    accession = Column(String(255), nullable=False, doc="Accession of the last committed metabolite")
+    offset = Column(BigInteger, nullable=False,
+                    doc="Position in the uncompressed .xml file at or before the start of the last committed metabolite")
+    record_count = Column(Integer, nullable=False, doc="Number of committed metabolites")
+    high_water_marks = Column(Text, nullable=False, doc="JSON object with the next free primary key of each table")
+
+    def __repr__(self):
+        return f'<Checkpoint {self.source} at hmdb:{self.accession}>'
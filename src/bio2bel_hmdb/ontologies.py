@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""The disease ontologies are used to map the names of the HMDB diseases to the names in the BEL namespaces of DOID, HP
+and MeSH diseases.
+
+The dictionaries from the lowercase names to the names of each ontology are cached as JSON files together with the
+location of the namespace and the SHA-256 hash of its content, so the mapping works offline once the namespaces were
+fetched. The namespaces can also be read from local files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bel_resources import parse_bel_resource
+
+from .constants import DOID, HP, MESHD, ONTOLOGIES, ONTOLOGY_CACHE_DIR, ONTOLOGY_NAMESPACES
+
+__all__ = [
+    'get_ontology_locations',
+    'load_disease_ontologies',
+    'map_disease_names',
+    'ONTOLOGY_COLUMNS',
+]
+
+log = logging.getLogger(__name__)
+
+#: The seconds after which fetching a namespace is given up
+FETCH_TIMEOUT = 60
+
+#: The columns of the disease table in which the names from the disease ontologies are stored
+ONTOLOGY_COLUMNS = {
+    DOID: 'dion',
+    HP: 'hpo',
+    MESHD: 'mesh_diseases',
+}
+
+
+def _is_url(location):
+    """Check if a location is a URL.
+
+    :param str location: A URL or a file path
+    :rtype: bool
+    """
+    return location.startswith(('http://', 'https://'))
+
+
+def _get_hash(content):
+    """Get the SHA-256 hash of content.
+
+    :param bytes content: The content of a namespace
+    :rtype: str
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_ontology_locations(locations=None):
+    """Get the location of the namespace of each disease ontology.
+
+    :param locations: None for the URLs in :data:`bio2bel_hmdb.constants.ONTOLOGY_NAMESPACES`, a dictionary from some
+                      of the ontologies to URLs or file paths, or a directory with a namespace file for each ontology.
+                      The files in a directory are named like the file in the URL or after the ontology, like
+                      ``hp.belns``.
+    :type locations: Union[None,str,dict[str,str]]
+    :rtype: dict[str,str]
+    :raises ValueError: If there is no namespace for an ontology in the directory or an ontology is unknown
+    """
+    if locations is None:
+        return dict(ONTOLOGY_NAMESPACES)
+
+    if isinstance(locations, str):
+        directory = locations
+        locations = {}
+
+        for ontology in ONTOLOGIES:
+            names = (os.path.basename(ONTOLOGY_NAMESPACES[ontology]), '{}.belns'.format(ontology))
+            paths = [os.path.join(directory, name) for name in names]
+            path = next((path for path in paths if os.path.exists(path)), None)
+
+            if path is None:
+                raise ValueError('no namespace for {} in {}. Expected one of: {}'.format(
+                    ontology, directory, ', '.join(names),
+                ))
+
+            locations[ontology] = path
+
+        return locations
+
+    unknown = set(locations) - set(ONTOLOGIES)
+    if unknown:
+        raise ValueError('unknown ontologies: {}'.format(', '.join(sorted(unknown))))
+
+    return dict(locations)
+
+
+def _read_location(location):
+    """Get the content of a namespace.
+
+    :param str location: A URL or a file path
+    :rtype: bytes
+    """
+    if _is_url(location):
+        log.info('fetching %s', location)
+        response = requests.get(location, timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+
+    with open(os.path.expanduser(location), 'rb') as file:
+        return file.read()
+
+
+def _parse_names(content):
+    """Get the dictionary from the lowercase names in a namespace to the names.
+
+    :param bytes content: The content of a namespace
+    :rtype: dict[str,str]
+    """
+    lines = content.decode('utf-8', errors='ignore').splitlines()
+    return {value.lower(): value for value in parse_bel_resource(lines)['Values']}
+
+
+def _get_cache_path(directory, ontology):
+    """Get the path of the cache of an ontology.
+
+    :param str directory: The directory of the caches
+    :param str ontology: An ontology from :data:`bio2bel_hmdb.constants.ONTOLOGIES`
+    :rtype: str
+    """
+    return os.path.join(directory, '{}.json'.format(ontology))
+
+
+def _read_cache(path, location):
+    """Get the names of an ontology from its cache if it was made from the same location and content.
+
+    The content of a local file is hashed to check that it did not change since the cache was written. If the file is
+    missing, the cache is used anyway.
+
+    :param str path: The path of the cache
+    :param str location: The location of the namespace
+    :rtype: Optional[dict[str,str]]
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path) as file:
+        cache = json.load(file)
+
+    if cache['location'] != location:
+        return
+
+    if not _is_url(location) and os.path.exists(os.path.expanduser(location)):
+        with open(os.path.expanduser(location), 'rb') as file:
+            if _get_hash(file.read()) != cache['sha256']:
+                return
+
+    return cache['names']
+
+
+def _fetch(location, path):
+    """Parse the names of an ontology from its namespace and write them to its cache.
+
+    :param str location: The location of the namespace
+    :param str path: The path of the cache
+    :rtype: dict[str,str]
+    """
+    content = _read_location(location)
+    names = _parse_names(content)
+
+    temporary_path = path + '.part'
+    with open(temporary_path, 'w') as file:
+        json.dump({'location': location, 'sha256': _get_hash(content), 'names': names}, file)
+    os.replace(temporary_path, path)
+
+    return names
+
+
+def load_disease_ontologies(locations=None, cache_directory=None, force=False):
+    """Load the dictionaries from the lowercase names of the diseases in the ontologies to their names.
+
+    The dictionaries are read from their caches. The namespaces without a valid cache are fetched in parallel threads
+    and cached.
+
+    :param locations: The locations of the namespaces, see :func:`get_ontology_locations`
+    :type locations: Union[None,str,dict[str,str]]
+    :param Optional[str] cache_directory: The directory of the caches. Defaults to
+                                          :data:`bio2bel_hmdb.constants.ONTOLOGY_CACHE_DIR`.
+    :param bool force: Should the namespaces be fetched again even if they are cached?
+    :rtype: dict[str,dict[str,str]]
+    """
+    locations = get_ontology_locations(locations)
+    directory = cache_directory or ONTOLOGY_CACHE_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    disease_ontologies = {}
+    for ontology, location in locations.items():
+        if not force:
+            names = _read_cache(_get_cache_path(directory, ontology), location)
+            if names is not None:
+                disease_ontologies[ontology] = names
+
+    missing = [ontology for ontology in locations if ontology not in disease_ontologies]
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            futures = {
+                ontology: executor.submit(_fetch, locations[ontology], _get_cache_path(directory, ontology))
+                for ontology in missing
+            }
+            for ontology, future in futures.items():
+                disease_ontologies[ontology] = future.result()
+
+    return disease_ontologies
+
+
+def map_disease_names(names, disease_ontologies):
+    """Map disease names to their names in each of the disease ontologies, ignoring the case.
+
+    :param list[str] names: The names of the diseases
+    :param dict[str,dict[str,str]] disease_ontologies: The dictionaries from :func:`load_disease_ontologies`
+    :return: The names in each ontology, or None for the diseases that are not in the ontology, in the order of the
+             given names
+    :rtype: dict[str,list[Optional[str]]]
+    """
+    lowercase_names = [name.lower() for name in names]
+
+    return {
+        ontology: [ontology_names.get(name) for name in lowercase_names]
+        for ontology, ontology_names in disease_ontologies.items()
+    }
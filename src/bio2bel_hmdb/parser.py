@@ -1,59 +1,1352 @@
 # -*- coding: utf-8 -*-
 
+import gzip
+import hashlib
+import itertools
+import json
 import logging
 import os
-import xml.etree.ElementTree as ET
-from urllib.request import urlretrieve
+import queue
+import re
+import shutil
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from zipfile import ZipFile
 
+import requests
 import time
 
-from .constants import DATA_DIR, DATA_FILE_UNZIPPED, DATA_PATH, DATA_URL
+from .constants import (
+    DATA_DIR, DATA_FILE_UNZIPPED, DATA_PATH, DATA_URL, DATASET_PATHS, DATASET_URLS, HMDB_DATASET, HMDB_NAMESPACE,
+)
+from .engines import get_engine
 
 log = logging.getLogger(__name__)
 
+#: Magic numbers used to recognize compressed sources
+ZIP_MAGIC = b'PK\x03\x04'
+GZIP_MAGIC = b'\x1f\x8b'
 
-def download_data(force_download=False):
-    """Downloads the data
+#: The start tag of the metabolite elements, used to split the file into shards for parallel parsing
+METABOLITE_START_TAG = b'<metabolite>'
+#: The end tag of the metabolite elements, used to cut them out of the file when parsing a subset
+METABOLITE_END_TAG = b'</metabolite>'
+#: Finds the accession of a metabolite in its raw bytes, which is the first accession before the secondary ones
+ACCESSION_PATTERN = re.compile(rb'<accession>\s*([^<\s]+)\s*</accession>')
+#: Finds the tag of the root element in the header of the file
+ROOT_TAG_PATTERN = re.compile(rb'<([^\s>?!/]+)[^>]*>\s*$')
+#: The number of bytes read at once when searching for a metabolite start tag
+SEARCH_BLOCK_SIZE = 1 << 16
+#: The default approximate size in bytes of a shard for parallel parsing
+DEFAULT_SHARD_SIZE = 1 << 24
+#: The default number of records passed at once from the parser thread to the writer
+DEFAULT_PIPELINE_BATCH_SIZE = 500
+#: The default number of batches of records that the parser thread can be ahead of the writer
+DEFAULT_QUEUE_DEPTH = 8
+#: The number of bytes written or hashed at once when downloading the data
+DOWNLOAD_BLOCK_SIZE = 1 << 20
+#: The seconds without data from the server after which a download is given up
+DOWNLOAD_TIMEOUT = 60
 
-    :param bool force_download: If true, overwrites a previously cached file
+
+def get_sha256(path):
+    """Get the SHA-256 hash of the content of a file.
+
+    :param str path: The path to a file
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(DOWNLOAD_BLOCK_SIZE), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def _get_metadata_path(path):
+    """Get the path of the metadata of a download, which is stored next to it.
+
+    :param str path: The path of the downloaded file
     :rtype: str
     """
-    if os.path.exists(DATA_PATH) and not force_download:
-        log.info('using cached data at %s', DATA_PATH)
+    return path + '.json'
+
+
+def _read_metadata(path):
+    """Read the metadata of a download.
+
+    :param str path: The path of the downloaded file
+    :return: The URL, the ``ETag`` and ``Last-Modified`` headers, the size and the SHA-256 hash, or None if there is no
+             metadata
+    :rtype: Optional[dict]
+    """
+    metadata_path = _get_metadata_path(path)
+    if not os.path.exists(metadata_path):
+        return
+
+    with open(metadata_path) as file:
+        return json.load(file)
+
+
+def _write_metadata(path, metadata):
+    """Write the metadata of a download next to it.
+
+    :param str path: The path of the downloaded file
+    :param dict metadata: The metadata
+    """
+    with open(_get_metadata_path(path), 'w') as file:
+        json.dump(metadata, file)
+
+
+def check_data(path=DATA_PATH):
+    """Check that a downloaded file has the size and checksum recorded when it was downloaded.
+
+    :param str path: The path of the downloaded file
+    :return: True if the file is intact, False if it is truncated or corrupt, and None if nothing was recorded
+    :rtype: Optional[bool]
+    """
+    metadata = _read_metadata(path)
+    if metadata is None:
+        return
+
+    return os.path.getsize(path) == metadata['size'] and get_sha256(path) == metadata['sha256']
+
+
+def _get_validator(metadata):
+    """Get the validator of a version of a file for an ``If-Range`` header.
+
+    :param Optional[dict] metadata: The headers of the response that started the download
+    :rtype: Optional[str]
+    """
+    if metadata is None:
+        return
+
+    return metadata.get('etag') or metadata.get('last_modified')
+
+
+def download_data(force_download=False, url=DATA_URL, path=DATA_PATH):
+    """Download the data, continuing a partial download and skipping it if the file did not change.
+
+    The ``ETag`` and ``Last-Modified`` headers, the size and the SHA-256 hash of the download are stored in a JSON file
+    next to it. A cached file is checked against them before it is used and downloaded again if it is corrupt. With
+    ``force_download``, the server is asked for the file only if it changed. The file is downloaded to a ``.part`` file
+    first, which is continued with a range request if the download is interrupted.
+
+    :param bool force_download: If true, overwrites a previously cached file unless it is the same on the server
+    :param str url: The URL of the file
+    :param str path: The path of the downloaded file
+    :rtype: str
+    :raises IOError: If the download is incomplete. The partial file is kept to continue later.
+    """
+    headers = {}
+
+    if os.path.exists(path):
+        intact = check_data(path)
+        metadata = _read_metadata(path)
+
+        if intact is False:
+            log.warning('%s is corrupt. Downloading it again', path)
+
+        elif not force_download:
+            log.info('using cached data at %s', path)
+            return path
+
+        elif metadata is not None and metadata['url'] == url:
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+
+    partial_path = path + '.part'
+    partial_metadata = _read_metadata(partial_path) if os.path.exists(partial_path) else None
+
+    if partial_metadata is not None and partial_metadata['url'] == url and not headers:
+        headers['Range'] = 'bytes={}-'.format(os.path.getsize(partial_path))
+        validator = _get_validator(partial_metadata)
+        if validator:
+            headers['If-Range'] = validator
+
+    log.info('downloading %s to %s', url, path)
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            log.info('%s did not change', url)
+            return path
+
+        restart = response.status_code == 416  # the partial file is complete or longer than the file
+        if not restart:
+            response.raise_for_status()
+            metadata = _receive(response, url, partial_path, partial_metadata)
+
+    if restart:
+        log.info('discarding the partial download of %s', url)
+        os.remove(partial_path)
+        os.remove(_get_metadata_path(partial_path))
+        return download_data(force_download=force_download, url=url, path=path)
+
+    _write_metadata(path, metadata)
+    os.replace(partial_path, path)
+    os.remove(_get_metadata_path(partial_path))
+
+    return path
+
+
+def _receive(response, url, partial_path, partial_metadata):
+    """Write the content of a response to the partial file, appending it if the response is a range.
+
+    :param requests.Response response: A successful streamed response
+    :param str url: The URL of the file
+    :param str partial_path: The path of the partial file
+    :param Optional[dict] partial_metadata: The metadata of the partial file
+    :return: The metadata of the complete file
+    :rtype: dict
+    :raises IOError: If the download is incomplete
+    """
+    if response.status_code == 206:
+        log.info('continuing the download after %d bytes', os.path.getsize(partial_path))
+        mode = 'ab'
+        size = int(response.headers['Content-Range'].rsplit('/', 1)[1])
+        metadata = partial_metadata
     else:
-        log.info('downloading %s to %s', DATA_URL, DATA_PATH)
-        urlretrieve(DATA_URL, DATA_PATH)
+        mode = 'wb'
+        size = response.headers.get('Content-Length')
+        size = int(size) if size is not None else None
+        metadata = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        _write_metadata(partial_path, metadata)
 
-    return DATA_PATH
+    try:
+        with open(partial_path, mode) as file:
+            for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+                file.write(block)
+    except requests.exceptions.RequestException as e:
+        raise IOError('the download of {} was interrupted. Download again to continue'.format(url)) from e
+
+    received = os.path.getsize(partial_path)
+    if size is not None and received != size:
+        raise IOError('received {} of {} bytes of {}. Download again to continue'.format(received, size, url))
+
+    metadata['size'] = received
+    metadata['sha256'] = get_sha256(partial_path)
+    return metadata
 
 
 def _ensure_data(force_download=False):
-    if not os.path.exists(DATA_FILE_UNZIPPED):
-        data_path = download_data(force_download=force_download)
+    """Get the path to the HMDB data, downloading the zip archive if necessary.
+
+    The archive is not extracted since :func:`open_data` streams the .xml member directly out of it. A previously
+    extracted file is still used if it exists.
+
+    :param bool force_download: If true, overwrites a previously cached file
+    :rtype: str
+    """
+    if os.path.exists(DATA_FILE_UNZIPPED) and not force_download:
+        return DATA_FILE_UNZIPPED
+
+    return download_data(force_download=force_download)
+
+
+def _is_url(source):
+    """Check if a source is a URL.
+
+    :param str source: A URL or a file path
+    :rtype: bool
+    """
+    return source.startswith(('http://', 'https://'))
+
+
+def ensure_source(source=None, force_download=False):
+    """Get the path to a source, downloading it if necessary.
+
+    :param Optional[str] source: The path to a .xml file or to a compressed one, the URL of one, or the name of a
+                                 dataset from :data:`bio2bel_hmdb.constants.DATASET_URLS`. If None the full HMDB
+                                 metabolite .xml will be downloaded. The files of the datasets are downloaded to their
+                                 paths from :data:`bio2bel_hmdb.constants.DATASET_PATHS`, and the ones of other URLs to
+                                 the data directory.
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :rtype: str
+    """
+    url = DATASET_URLS.get(source, source)
+
+    if not url or url == DATA_URL:
+        return _ensure_data(force_download=force_download)
+
+    if _is_url(url):
+        path = DATASET_PATHS.get(url) or os.path.join(DATA_DIR, url.rsplit('/', 1)[-1])
+        return download_data(force_download=force_download, url=url, path=path)
 
-        log.info('extracting %s to %s', data_path, DATA_FILE_UNZIPPED)
-        with ZipFile(data_path) as f:
-            f.extract(member='hmdb_metabolites.xml', path=DATA_DIR)
+    return source
 
-        assert os.path.exists(DATA_FILE_UNZIPPED)  # should correspond to this file
 
-    return DATA_FILE_UNZIPPED
+def get_dataset(source=None):
+    """Get the dataset of a source, which is named after its file without the extensions.
 
+    :param Optional[str] source: A source like for :func:`ensure_source`
+    :return: The values of a :class:`bio2bel_hmdb.models.Dataset`
+    :rtype: dict[str,str]
+    """
+    if not source:
+        return {'name': HMDB_DATASET, 'source': DATA_URL}
+
+    if source in DATASET_URLS:
+        return {'name': source, 'source': DATASET_URLS[source]}
+
+    name = os.path.basename(source.rstrip('/'))
+    while True:
+        name, extension = os.path.splitext(name)
+        if extension.lower() not in ('.xml', '.zip', '.gz'):
+            name += extension
+            break
+
+    return {'name': name, 'source': source}
+
+
+def _get_zip_member(zip_file):
+    """Get the name of the .xml member of an HMDB zip archive.
+
+    :param zipfile.ZipFile zip_file: An open zip archive
+    :rtype: str
+    """
+    names = [
+        name
+        for name in zip_file.namelist()
+        if name.endswith('.xml')
+    ]
+
+    if len(names) == 1:
+        return names[0]
+
+    # prefer the member named after the archive, like hmdb_metabolites.xml in hmdb_metabolites.zip
+    expected_name = os.path.splitext(os.path.basename(zip_file.filename))[0] + '.xml'
+    if expected_name in names:
+        return expected_name
 
-def get_data(source=None, force_download=False):
+    raise ValueError('could not find a unique .xml file in {}'.format(zip_file.filename))
+
+
+def open_data(source):
+    """Open an HMDB .xml file for binary reading.
+
+    The source can also be a .zip archive containing the .xml file or a gzipped .xml file, in which case it is
+    decompressed on the fly instead of being extracted to disk first. The compression is detected from the content of
+    the file, not from its extension.
+
+    :param str source: Path to a .xml, .zip or .gz file
+    :rtype: file
+    """
+    with open(source, 'rb') as file:
+        magic = file.read(len(ZIP_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        log.info('streaming from gzipped file %s', source)
+        return gzip.open(source, 'rb')
+
+    if magic == ZIP_MAGIC:
+        with ZipFile(source) as zip_file:  # the member stays readable after the archive is closed
+            member = _get_zip_member(zip_file)
+            log.info('streaming %s from zip archive %s', member, source)
+            return zip_file.open(member)
+
+    return open(source, 'rb')
+
+
+def get_data(source=None, force_download=False, engine=None):
     """Parse .xml file into an ElementTree
 
-    :param Optional[str] source: String representing the filename of a .xml file. If None the full HMDB metabolite .xml
-                                 will be downloaded and parsed into a tree.
+    The tree is not written to the record cache, which is made from the streamed records by
+    :func:`bio2bel_hmdb.cache.cache_records` instead.
+
+    :param Optional[str] source: String representing the filename of a .xml file. Zip archives and gzipped files are
+                                 decompressed on the fly. If None the full HMDB metabolite .xml will be downloaded and
+                                 parsed into a tree.
     :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
     """
     if not source:
         source = _ensure_data(force_download=force_download)
 
     t = time.time()
     log.info('parsing %s', source)
-    tree = ET.parse(source)
+    with open_data(source) as file:
+        tree = get_engine(engine).parse(file)
     log.info('done parsing after %.2f seconds', time.time() - t)
 
     return tree
+
+
+class _CountingReader(object):
+    """Wraps a binary file and keeps track of the position before and after the last two reads."""
+
+    def __init__(self, file, position=0):
+        """
+        :param file: A file opened for binary reading
+        :param int position: The current position of the file
+        """
+        self.file = file
+        self.position = position
+        self.last_position = position
+        self.previous_position = position
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.previous_position = self.last_position
+        self.last_position = self.position
+        self.position += len(data)
+        return data
+
+
+class _PrefixedReader(object):
+    """Reads a prefix before the content of a file, without ever mixing both in the same read."""
+
+    def __init__(self, prefix, file):
+        """
+        :param bytes prefix: The content read before the file
+        :param file: A file opened for binary reading
+        """
+        self.prefix = prefix
+        self.file = file
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.file.read(size)
+
+        if size < 0:
+            size = len(self.prefix)
+
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+
+def _read_header(file):
+    """Read the content of an HMDB .xml file before its first metabolite, like the declaration of the root element.
+
+    :param file: A seekable file opened for binary reading
+    :rtype: bytes
+    """
+    start = _find_metabolite(file, 0, sys.maxsize)
+    file.seek(0)
+    return file.read(start)
+
+
+def iter_metabolite_offsets(source=None, offset=0, force_download=False, engine=None, skip_tags=frozenset()):
+    """Iterate over the metabolite elements of an HMDB .xml file together with their positions in the file.
+
+    The position of a metabolite is a byte offset in the uncompressed file at or before the start of its element, so
+    starting again at the position with ``offset`` yields the same metabolite again, possibly after a few preceding
+    ones. Compressed sources are decompressed up to the offset without being parsed. Since the engines can hold back
+    an incomplete start tag until the following read, the position before the previous read is used.
+
+    :param Optional[str] source: String representing the filename of a .xml file. Zip archives and gzipped files are
+                                 decompressed on the fly. If None the full HMDB metabolite .xml will be downloaded and
+                                 streamed.
+    :param int offset: The position in the uncompressed file from which to start at the next metabolite
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
+    :param frozenset[str] skip_tags: The tags of the children of the metabolites that are cleared as soon as they are
+                                     parsed, like from :func:`get_skip_tags`
+    :rtype: iter[tuple[int,xml.etree.ElementTree.Element]]
+    """
+    if not source:
+        source = _ensure_data(force_download=force_download)
+
+    engine = get_engine(engine)
+
+    log.info('streaming %s with the %s engine', source, engine.name)
+    with open_data(source) as file:
+        if offset:
+            header = _read_header(file)
+            start = _find_metabolite(file, offset, sys.maxsize)
+            log.info('skipping to byte %d', start)
+            file.seek(start)
+            reader = _CountingReader(file, start)
+            events = engine.iter_metabolite_events(_PrefixedReader(header, reader), skip_tags=skip_tags)
+        else:
+            reader = _CountingReader(file)
+            events = engine.iter_metabolite_events(reader, skip_tags=skip_tags)
+
+        element_offset = None
+        for event, element in events:
+            if event == 'start':
+                # the events are generated after each read, so the metabolite starts in one of the last two reads
+                element_offset = reader.previous_position
+            else:
+                yield element_offset, element
+
+
+def iter_metabolites(source=None, force_download=False, engine=None):
+    """Iterate over the metabolite elements of an HMDB .xml file without building the whole tree in memory.
+
+    Each metabolite element is yielded once it has been completely parsed and is cleared from the tree as soon as the
+    consumer asks for the next one, so the memory usage stays flat regardless of the size of the file.
+
+    :param Optional[str] source: String representing the filename of a .xml file. Zip archives and gzipped files are
+                                 decompressed on the fly. If None the full HMDB metabolite .xml will be downloaded and
+                                 streamed.
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
+    :rtype: iter[xml.etree.ElementTree.Element]
+    """
+    for _, element in iter_metabolite_offsets(source, force_download=force_download, engine=engine):
+        yield element
+
+
+def _get_tag(element_tag):
+    """Delete the XML namespace prefix when calling element.tag
+
+    :param str element_tag: tag attribute of an XML element
+    :rtype: str
+    """
+    return element_tag.split("}")[1]
+
+
+#: The local names of the tags that were seen so far, keyed by their fully qualified tags
+_local_names = {}
+
+
+def _get_local_name(element_tag):
+    """Get the interned tag of an element without its namespace, splitting each distinct tag only once.
+
+    :param str element_tag: tag attribute of an XML element
+    :rtype: str
+    """
+    local_name = _local_names.get(element_tag)
+    if local_name is None:
+        local_name = _local_names[element_tag] = sys.intern(element_tag.rpartition('}')[2])
+    return local_name
+
+
+def _get_texts(element):
+    """Get the texts of the children of an element, like the biofluids in "biospecimen_locations".
+
+    :param xml.etree.ElementTree.Element element: the parent XML element
+    :rtype: list[str]
+    """
+    return [
+        sub_element.text
+        for sub_element in element
+    ]
+
+
+def _get_dicts(element):
+    """Get the children of an element as dictionaries from the tags of their children to their texts.
+
+    :param xml.etree.ElementTree.Element element: the parent XML element. E.g. "pathways" where the children would have
+                                                  the tag "pathway".
+    :rtype: list[dict[str,str]]
+    """
+    return [
+        {
+            _get_local_name(sub_element.tag): sub_element.text
+            for sub_element in instance_element
+        }
+        for instance_element in element
+    ]
+
+
+def _parse_disease(element):
+    """Convert a disease element into a dictionary, which has its references under the "references" key.
+
+    :param xml.etree.ElementTree.Element element: a disease element
+    :rtype: dict
+    """
+    disease = {}
+
+    for sub_element in element:
+        tag = _get_local_name(sub_element.tag)
+
+        if tag == "references":
+            disease[tag] = _get_dicts(sub_element)
+        else:
+            disease[tag] = sub_element.text
+
+    return disease
+
+
+#: The handlers of the sections of a metabolite element, keyed by their fully qualified tags. Elements without a
+#: handler are columns of the :class:`bio2bel_hmdb.models.Metabolite` table.
+SECTION_HANDLERS = {}
+#: The names of the sections of the records that are filled by the handlers, keyed by the tags of the elements
+SECTION_NAMES = {}
+
+#: The sections of the records, which are loaded into the tables related to the metabolites
+SECTIONS = (
+    'secondary_accessions',
+    'synonyms',
+    'cellular_locations',
+    'biofluids',
+    'tissues',
+    'pathways',
+    'diseases',
+    'references',
+    'proteins',
+)
+
+#: The ingest profiles, which are named selections of :data:`SECTIONS`. The metabolites and their datasets are always
+#: loaded. The rows that each profile writes for the three metabolites in ``tests/test_data.xml`` scale roughly with the
+#: number of metabolites, which helps to size a database:
+#:
+#: - ``minimal``: only the metabolite table, 7 rows (3 metabolites, 1 dataset and 3 dataset relations)
+#: - ``bel-core``: the proteins and the diseases with their references, which are used for the BEL enrichment and
+#:   namespaces, 40 rows (33 more than ``minimal``: 3 diseases with 9 relations, 8 references, 6 proteins with 7
+#:   relations)
+#: - ``full``: all sections, 127 rows (87 more than ``bel-core``: 1 secondary accession, 9 synonyms, 18 tissues with 19
+#:   relations, 17 pathways with 17 relations, 3 more references with 3 relations)
+PROFILES = {
+    'minimal': frozenset(),
+    'bel-core': frozenset({'proteins', 'diseases'}),
+    'full': frozenset(SECTIONS),
+}
+
+
+def register_section(*tags, section=None):
+    """Register a function as the handler of the sections of a metabolite element with the given tags.
+
+    The handler is called with the record and the element of the section. It is registered under the tags qualified
+    with the HMDB namespace as well as without a namespace.
+
+    :param str tags: The tags of the sections without their namespace
+    :param Optional[str] section: The section of the records from :data:`SECTIONS` which the handler fills, if the
+                                  section can be left out with :func:`get_sections`
+    """
+    def register(handler):
+        for tag in tags:
+            for qualified_tag in ('{{{}}}{}'.format(HMDB_NAMESPACE, tag), tag):
+                qualified_tag = sys.intern(qualified_tag)
+                SECTION_HANDLERS[qualified_tag] = handler
+                if section is not None:
+                    SECTION_NAMES[qualified_tag] = section
+        return handler
+
+    return register
+
+
+def get_sections(profile=None):
+    """Get the sections of the records to parse.
+
+    :param profile: The name of a profile from :data:`PROFILES`, some sections from :data:`SECTIONS`, or None for all
+                    sections
+    :type profile: Union[None,str,iter[str]]
+    :rtype: frozenset[str]
+    :raises ValueError: If the profile or a section is unknown
+    """
+    if profile is None:
+        return PROFILES['full']
+
+    if isinstance(profile, str):
+        sections = PROFILES.get(profile)
+        if sections is None:
+            raise ValueError('unknown profile {}. Use one of: {}'.format(profile, ', '.join(PROFILES)))
+        return sections
+
+    sections = frozenset(profile)
+    unknown = sections.difference(SECTIONS)
+    if unknown:
+        raise ValueError('unknown sections: {}'.format(', '.join(sorted(unknown))))
+
+    return sections
+
+
+def get_skip_tags(sections=None):
+    """Get the tags of the elements of a metabolite that are not parsed, either because they are always ignored or
+    because their section is not selected.
+
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :rtype: frozenset[str]
+    """
+    sections = PROFILES['full'] if sections is None else sections
+
+    return frozenset(
+        tag
+        for tag, handler in SECTION_HANDLERS.items()
+        if handler is _skip_section or (tag in SECTION_NAMES and SECTION_NAMES[tag] not in sections)
+    )
+
+
+@register_section(
+    "taxonomy",  # will be delayed to later versions since not important for BEL
+    "ontology",
+    "experimental_properties",  # will be delayed to later versions since not important for BEL
+    "predicted_properties",  # will be delayed to later versions since not important for BEL
+    "spectra",  # will not be processed since the corresponding database is down
+    "normal_concentrations",  # will be delayed to later versions since not important for BEL
+    "abnormal_concentrations",  # will be delayed to later versions since not important for BEL
+)
+def _skip_section(record, element):
+    """Ignore a section."""
+
+
+@register_section("wikipidia")
+def _parse_wikipidia(record, element):
+    """Handle the wikipedia typo in the xml tags."""
+    log.warning("HMDB fixed the 'wikipidia' tag to 'wikipedia'. Change code.")
+    record['metabolite']['wikipedia'] = element.text
+
+
+@register_section("secondary_accessions", section="secondary_accessions")
+def _parse_secondary_accessions(record, element):
+    """Store the secondary accessions."""
+    record['secondary_accessions'] = _get_texts(element)
+
+
+@register_section("synonyms", section="synonyms")
+def _parse_synonyms(record, element):
+    """Store the synonyms."""
+    record['synonyms'] = list(dict.fromkeys(_get_texts(element)))  # remove duplicates but keep order
+
+
+@register_section("cellular_locations", section="cellular_locations")
+def _parse_cellular_locations(record, element):
+    """Store the cellular locations."""
+    record['cellular_locations'] = _get_texts(element)
+
+
+@register_section("biospecimen_locations", section="biofluids")
+def _parse_biospecimen_locations(record, element):
+    """Store the biospecimen locations as the biofluids."""
+    record['biofluids'] = _get_texts(element)
+
+
+@register_section("tissue_locations", section="tissues")
+def _parse_tissue_locations(record, element):
+    """Store the tissue locations as the tissues."""
+    record['tissues'] = _get_texts(element)
+
+
+@register_section("pathways", section="pathways")
+def _parse_pathways(record, element):
+    """Store the pathways."""
+    record['pathways'] = _get_dicts(element)
+
+
+@register_section("diseases", section="diseases")
+def _parse_diseases(record, element):
+    """Store the diseases with their references."""
+    record['diseases'] = [
+        _parse_disease(disease_element)
+        for disease_element in element
+    ]
+
+
+@register_section("general_references", section="references")
+def _parse_general_references(record, element):
+    """Store the general references as the references."""
+    record['references'] = _get_dicts(element)
+
+
+@register_section("protein_associations", section="proteins")
+def _parse_protein_associations(record, element):
+    """Store the protein associations as the proteins."""
+    record['proteins'] = _get_dicts(element)
+
+
+#: The handlers of the sections for each selection of sections, see :func:`_get_section_handlers`
+_section_handlers = {}
+
+
+def _get_section_handlers(sections=None):
+    """Get the handlers of the sections, with the handlers of the sections that are not selected replaced by one that
+    ignores them.
+
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :rtype: dict
+    """
+    if sections is None:
+        return SECTION_HANDLERS
+
+    handlers = _section_handlers.get(sections)
+
+    if handlers is None:
+        skip_tags = get_skip_tags(sections)
+        handlers = _section_handlers[sections] = {
+            tag: _skip_section if tag in skip_tags else handler
+            for tag, handler in SECTION_HANDLERS.items()
+        }
+
+    return handlers
+
+
+def parse_metabolite(element, sections=None):
+    """Convert a metabolite element into a record made only of dictionaries, lists and strings.
+
+    The record can be pickled, so it can be sent between processes. It has the following keys:
+
+    - ``metabolite``: the columns of the :class:`bio2bel_hmdb.models.Metabolite` table
+    - ``secondary_accessions``, ``synonyms``, ``cellular_locations``, ``biofluids`` and ``tissues``: lists of strings
+    - ``pathways``, ``proteins`` and ``references``: lists of dictionaries with the columns of the respective tables
+    - ``diseases``: a list of dictionaries with the columns of the disease table and their ``references``
+
+    The sections are dispatched to their handlers in :data:`SECTION_HANDLERS` by their fully qualified tags. The
+    sections that are not selected are left out of the record.
+
+    :param xml.etree.ElementTree.Element element: a metabolite element
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :rtype: dict
+    """
+    metabolite = {}
+    record = {'metabolite': metabolite}
+    get_handler = _get_section_handlers(sections).get
+
+    for sub_element in element:
+        handler = get_handler(sub_element.tag)
+
+        if handler is None:  # feed in main metabolite table
+            metabolite[_get_local_name(sub_element.tag)] = sub_element.text
+        else:
+            handler(record, sub_element)
+
+    return record
+
+
+def get_accession_filter(accessions=None, sample=None):
+    """Get a function that tells if the metabolite with an accession belongs to a subset.
+
+    It has to be called once for each metabolite in the order of the file, since the sample counts the metabolites.
+
+    :param Optional[iter[str]] accessions: If given, only the metabolites with these accessions are in the subset
+    :param Optional[int] sample: If given, only every n-th metabolite is in the subset, starting with the first one.
+                                 If accessions are given too, every n-th of their metabolites.
+    :return: None if there is no filter
+    :rtype: Optional[Callable[[str],bool]]
+    :raises ValueError: If the sample is not positive
+    """
+    if accessions is None and sample is None:
+        return
+
+    if sample is not None and sample < 1:
+        raise ValueError('the sample has to be positive, not {}'.format(sample))
+
+    accessions = None if accessions is None else frozenset(accessions)
+    counter = itertools.count()
+
+    def accept(accession):
+        """Check if the metabolite with the accession is in the subset."""
+        if accessions is not None and accession not in accessions:
+            return False
+
+        return sample is None or next(counter) % sample == 0
+
+    return accept
+
+
+def select_accessions(records, accessions=None, sample=None):
+    """Only keep the records of a subset of the metabolites, like from a record cache.
+
+    :param iter[dict] records: The records
+    :param Optional[iter[str]] accessions: If given, only keep the records of the metabolites with these accessions
+    :param Optional[int] sample: If given, only keep every n-th record
+    :rtype: iter[dict]
+    """
+    accept = get_accession_filter(accessions, sample)
+
+    for record in records:
+        if accept is None or accept(record['metabolite'].get('accession')):
+            yield record
+
+
+def iter_metabolite_chunks(file, position=0, block_size=DEFAULT_SHARD_SIZE):
+    """Iterate over the metabolite elements in an HMDB .xml file as bytes, without parsing them.
+
+    :param file: A file opened for binary reading, positioned before a metabolite start tag
+    :param int position: The position of the file in the uncompressed .xml file
+    :param int block_size: The number of bytes read at once
+    :return: The position, the accession and the content of each metabolite element
+    :rtype: iter[tuple[int,Optional[str],bytes]]
+    """
+    data = b''
+    for block in iter(lambda: file.read(block_size), b''):
+        data += block
+        index = 0
+
+        while True:
+            start = data.find(METABOLITE_START_TAG, index)
+            if start == -1:  # keep a start tag that could be cut off by the end of the block
+                index = max(index, len(data) - len(METABOLITE_START_TAG) + 1)
+                break
+
+            end = data.find(METABOLITE_END_TAG, start)
+            if end == -1:
+                index = start
+                break
+
+            end += len(METABOLITE_END_TAG)
+            match = ACCESSION_PATTERN.search(data, start, end)
+            yield position + start, match and match.group(1).decode('utf-8'), data[start:end]
+            index = end
+
+        position += index
+        data = data[index:]
+
+
+def _get_footer(header):
+    """Get the end tag of the root element that is opened in the header of an HMDB .xml file.
+
+    :param bytes header: The content of the file before the first metabolite
+    :rtype: bytes
+    """
+    match = ROOT_TAG_PATTERN.search(header)
+    if match is None:
+        raise ValueError('could not find the root element in {!r}'.format(header[-100:]))
+
+    return b'</' + match.group(1) + b'>'
+
+
+def _parse_chunks(chunks, header, footer, engine, sections=None):
+    """Parse metabolite elements from :func:`iter_metabolite_chunks` into records.
+
+    :param list[tuple[int,bytes]] chunks: The positions and the contents of the metabolite elements
+    :param bytes header: The content of the file before the first metabolite
+    :param bytes footer: The end tag of the root element
+    :param engine: A parser engine
+    :param Optional[frozenset[str]] sections: The sections to parse
+    :rtype: list[dict]
+    """
+    root = engine.fromstring(header + b''.join(data for _, data in chunks) + footer)
+
+    records = []
+    for (position, _), element in zip(chunks, root):
+        record = parse_metabolite(element, sections=sections)
+        record['offset'] = position
+        records.append(record)
+
+    return records
+
+
+def _iter_subset_records(source, offset, engine, sections, accessions, sample, batch_size=DEFAULT_PIPELINE_BATCH_SIZE):
+    """Iterate over the records of a subset of the metabolites in an HMDB .xml file.
+
+    The metabolite elements are cut out of the raw bytes and only the ones with accessions in the subset are parsed, in
+    batches. Reading through the other metabolites is much faster than parsing them. The reading stops once all the
+    given accessions were found.
+
+    :param str source: Path to a .xml file or to a compressed one
+    :param int offset: The position in the uncompressed file from which to start at the next metabolite
+    :param engine: A parser engine
+    :param Optional[frozenset[str]] sections: The sections to parse
+    :param Optional[iter[str]] accessions: If given, only parse the metabolites with these accessions
+    :param Optional[int] sample: If given, only parse every n-th metabolite
+    :param int batch_size: The number of metabolites parsed at once
+    :rtype: iter[dict]
+    """
+    accept = get_accession_filter(accessions, sample)
+    remaining = None if accessions is None else set(accessions)
+
+    with open_data(source) as file:
+        header = _read_header(file)
+        footer = _get_footer(header)
+
+        start = _find_metabolite(file, offset or len(header), sys.maxsize)
+        file.seek(start)
+
+        chunks = []
+        for position, accession, data in iter_metabolite_chunks(file, start):
+            if not accept(accession):
+                continue
+
+            chunks.append((position, data))
+
+            if remaining is not None:
+                remaining.discard(accession)
+                if not remaining:
+                    log.info('found all the given accessions')
+                    break
+
+            if len(chunks) >= batch_size:
+                yield from _parse_chunks(chunks, header, footer, engine, sections=sections)
+                chunks = []
+
+        if chunks:
+            yield from _parse_chunks(chunks, header, footer, engine, sections=sections)
+
+
+def iter_records(source=None, offset=0, force_download=False, engine=None, sections=None, accessions=None, sample=None):
+    """Iterate over the records of the metabolites in an HMDB .xml file.
+
+    Each record has its position from :func:`iter_metabolite_offsets` under the ``offset`` key. The elements of the
+    sections that are not selected are never converted, and the standard library engine clears them as soon as they
+    are parsed.
+
+    The subset of the metabolites given by ``accessions`` and ``sample`` is selected by reading the accession of each
+    metabolite element from the raw bytes, so the other metabolites are never parsed. The reading stops once all the
+    given accessions were found.
+
+    :param Optional[str] source: String representing the filename of a .xml file. Zip archives and gzipped files are
+                                 decompressed on the fly. If None the full HMDB metabolite .xml will be downloaded and
+                                 streamed.
+    :param int offset: The position in the uncompressed file from which to start at the next metabolite
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :param Optional[iter[str]] accessions: If given, only parse the metabolites with these accessions
+    :param Optional[int] sample: If given, only parse every n-th metabolite
+    :rtype: iter[dict]
+    """
+    if accessions is None and sample is None:
+        metabolites = iter_metabolite_offsets(
+            source,
+            offset=offset,
+            force_download=force_download,
+            engine=engine,
+            skip_tags=get_skip_tags(sections),
+        )
+        for element_offset, element in metabolites:
+            record = parse_metabolite(element, sections=sections)
+            record['offset'] = element_offset
+            yield record
+
+        return
+
+    if not source:
+        source = _ensure_data(force_download=force_download)
+
+    yield from _iter_subset_records(source, offset, get_engine(engine), sections, accessions, sample)
+
+
+def skip_through(records, accession):
+    """Skip the records up to and including the one with the given accession.
+
+    :param iter[dict] records: The records
+    :param str accession: The accession of the last record to skip
+    :rtype: iter[dict]
+    :raises ValueError: If there is no record with the accession
+    """
+    records = iter(records)
+
+    for record in records:
+        if record['metabolite'].get('accession') == accession:
+            break
+    else:
+        raise ValueError('could not find {}'.format(accession))
+
+    yield from records
+
+
+def select_sections(records, sections):
+    """Remove the sections that are not selected from records, like the complete ones from a record cache.
+
+    :param iter[dict] records: The records
+    :param frozenset[str] sections: The sections to keep, from :func:`get_sections`
+    :rtype: iter[dict]
+    """
+    removed = set(SECTIONS).difference(sections)
+
+    for record in records:
+        for section in removed:
+            record.pop(section, None)
+        yield record
+
+
+def set_dataset(records, dataset):
+    """Add the dataset from which they were read to records under the ``datasets`` key.
+
+    :param iter[dict] records: The records
+    :param dict[str,str] dataset: The dataset from :func:`get_dataset`
+    :rtype: iter[dict]
+    """
+    for record in records:
+        record['datasets'] = [dataset]
+        yield record
+
+
+def _ensure_uncompressed(source):
+    """Get the path to an uncompressed version of the source, decompressing it next to the source if necessary.
+
+    :param str source: Path to a .xml, .zip or .gz file
+    :rtype: str
+    """
+    with open(source, 'rb') as file:
+        magic = file.read(len(ZIP_MAGIC))
+
+    if magic != ZIP_MAGIC and not magic.startswith(GZIP_MAGIC):
+        return source
+
+    path = os.path.splitext(source)[0]
+    if not path.endswith('.xml'):
+        path += '.xml'
+
+    if not os.path.exists(path):
+        log.info('decompressing %s to %s', source, path)
+        with open_data(source) as input_file, open(path, 'wb') as output_file:
+            shutil.copyfileobj(input_file, output_file)
+
+    return path
+
+
+def _find_metabolite(file, offset, stop):
+    """Find the position of the first metabolite start tag at or after the given offset.
+
+    :param file: A file opened for binary reading
+    :param int offset: The position from which to search
+    :param int stop: The position at which to stop searching
+    :return: The position of the start tag or the stop position if there are no more metabolites
+    :rtype: int
+    """
+    file.seek(offset)
+    overlap = b''
+    while offset < stop:
+        block = file.read(SEARCH_BLOCK_SIZE)
+        if not block:
+            break
+
+        data = overlap + block
+        index = data.find(METABOLITE_START_TAG)
+        if index != -1:
+            return min(offset - len(overlap) + index, stop)
+
+        overlap = data[-len(METABOLITE_START_TAG):]
+        offset += len(block)
+
+    return stop
+
+
+def get_shards(path, shard_size=DEFAULT_SHARD_SIZE, offset=0):
+    """Split an HMDB .xml file into byte ranges that each contain only complete metabolite elements.
+
+    Since text content can not contain unescaped angle brackets, every occurrence of ``<metabolite>`` is the start of a
+    metabolite element.
+
+    :param str path: Path to an uncompressed HMDB .xml file
+    :param int shard_size: The approximate size of each byte range
+    :param int offset: The position from which to start at the next metabolite
+    :return: The header before the first metabolite, the footer after the last metabolite, and the byte ranges
+    :rtype: tuple[bytes,bytes,list[tuple[int,int]]]
+    """
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as file:
+        # the closing tag of the root element ends the last shard
+        file.seek(max(0, size - SEARCH_BLOCK_SIZE))
+        tail = file.read()
+        stop = size - len(tail) + tail.rfind(b'</')
+        footer = tail[tail.rfind(b'</'):]
+
+        header = _read_header(file)
+        start = _find_metabolite(file, offset, stop)
+
+        shards = []
+        while start < stop:
+            end = _find_metabolite(file, start + shard_size, stop)
+            shards.append((start, end))
+            start = end
+
+    return header, footer, shards
+
+
+def _parse_shard(path, header, footer, start, end, engine=None, sections=None):
+    """Parse the metabolites in the given byte range of an HMDB .xml file.
+
+    :param str path: Path to an uncompressed HMDB .xml file
+    :param bytes header: The content of the file before the first metabolite
+    :param bytes footer: The content of the file after the last metabolite
+    :param int start: The position of the start tag of the first metabolite in the shard
+    :param int end: The position after the end tag of the last metabolite in the shard
+    :param Optional[str] engine: The name of a parser engine
+    :param Optional[frozenset[str]] sections: The sections to parse
+    :rtype: list[dict]
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    root = get_engine(engine).fromstring(header + data + footer)
+
+    records = []
+    index = 0
+    for element in root:
+        index = data.find(METABOLITE_START_TAG, index)
+        record = parse_metabolite(element, sections=sections)
+        record['offset'] = start + index
+        records.append(record)
+        index += 1
+
+    return records
+
+
+def iter_records_parallel(
+        source=None,
+        processes=None,
+        shard_size=DEFAULT_SHARD_SIZE,
+        offset=0,
+        force_download=False,
+        engine=None,
+        sections=None,
+):
+    """Iterate over the records of the metabolites in an HMDB .xml file, parsing them in several processes.
+
+    The file is split into byte ranges aligned on the metabolite elements with :func:`get_shards`, which are parsed in
+    a :class:`concurrent.futures.ProcessPoolExecutor`. The records are yielded in the same order as in the file. Only a
+    bounded number of shards is in flight at once, so the memory usage does not grow with the size of the file.
+
+    :param Optional[str] source: String representing the filename of a .xml file. Compressed files are decompressed
+                                 next to the original first, since the shards need random access. If None the full
+                                 HMDB metabolite .xml will be downloaded.
+    :param Optional[int] processes: The number of worker processes. Defaults to the number of CPUs.
+    :param int shard_size: The approximate size in bytes of the part of the file parsed at once by a worker
+    :param int offset: The position in the uncompressed file from which to start at the next metabolite
+    :param bool force_download: Should the data be re-downloaded? Defaults to False.
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :rtype: iter[dict]
+    """
+    if not source:
+        source = _ensure_data(force_download=force_download)
+
+    engine = get_engine(engine).name  # each worker builds its own engine from the name
+    path = _ensure_uncompressed(source)
+    header, footer, shards = get_shards(path, shard_size=shard_size, offset=offset)
+
+    if processes is None:
+        processes = os.cpu_count()
+
+    log.info('parsing %d shards of %s with %d processes', len(shards), path, processes)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = deque()
+        shards = iter(shards)
+
+        for start, end in itertools.islice(shards, 2 * processes):
+            futures.append(executor.submit(_parse_shard, path, header, footer, start, end, engine, sections))
+
+        while futures:
+            records = futures.popleft().result()
+
+            for start, end in itertools.islice(shards, 1):  # keep the pool busy
+                futures.append(executor.submit(_parse_shard, path, header, footer, start, end, engine, sections))
+
+            yield from records
+
+
+def iter_worker_records(source, worker=0, workers=1, shard_size=DEFAULT_SHARD_SIZE, engine=None, sections=None):
+    """Iterate over the records in the part of an HMDB .xml file that belongs to one of several workers.
+
+    The file is split into byte ranges with :func:`get_shards` and the worker takes every ``workers``-th of them,
+    starting with the one at its index, so the workers get about the same amount of data without coordinating.
+
+    :param str source: Path to a .xml file. Compressed files are decompressed next to the original first.
+    :param int worker: The index of the worker, from 0 to ``workers - 1``
+    :param int workers: The number of workers
+    :param int shard_size: The approximate size in bytes of each byte range
+    :param engine: The name of a parser engine from :data:`bio2bel_hmdb.engines.ENGINES` or an engine. Defaults to
+                   lxml if it is installed.
+    :param Optional[frozenset[str]] sections: The sections to parse, from :func:`get_sections`. Defaults to all.
+    :rtype: iter[dict]
+    :raises ValueError: If the index of the worker is not below the number of workers
+    """
+    if not 0 <= worker < workers:
+        raise ValueError('worker {} is not one of {} workers'.format(worker, workers))
+
+    path = _ensure_uncompressed(source)
+    header, footer, shards = get_shards(path, shard_size=shard_size)
+
+    for start, end in shards[worker::workers]:
+        yield from _parse_shard(path, header, footer, start, end, engine=engine, sections=sections)
+
+
+def _produce_batches(records, batches, batch_size, stopped):
+    """Put batches of records into a queue until the records are exhausted or the consumer stops.
+
+    The last item put into the queue is None or the exception raised while producing the records.
+
+    :param iter[dict] records: The records
+    :param queue.Queue batches: A bounded queue
+    :param int batch_size: The number of records in a batch
+    :param threading.Event stopped: Set by the consumer when it does not want more records
+    """
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return
+
+    try:
+        records = iter(records)
+        while not stopped.is_set():
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            put(batch)
+
+    except Exception as e:
+        put(e)
+    else:
+        put(None)
+
+
+def iter_pipelined(records, batch_size=DEFAULT_PIPELINE_BATCH_SIZE, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """Produce the records in a separate thread, so parsing overlaps with the work done on the records by the caller.
+
+    The records are passed in batches through a queue that holds at most ``queue_depth`` batches, so the parser blocks
+    when it is too far ahead of the consumer. An exception raised while parsing is raised again in the consumer.
+
+    :param iter[dict] records: The records, like from :func:`iter_records`
+    :param int batch_size: The number of records passed at once
+    :param int queue_depth: The maximum number of batches waiting in the queue
+    :rtype: iter[dict]
+    """
+    batches = queue.Queue(maxsize=queue_depth)
+    stopped = threading.Event()
+
+    thread = threading.Thread(
+        target=_produce_batches,
+        args=(records, batches, batch_size, stopped),
+        name='hmdb-parser',
+        daemon=True,
+    )
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+
+            if batch is None:
+                break
+
+            if isinstance(batch, Exception):
+                raise batch
+
+            yield from batch
+
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def iter_interleaved(record_iterables):
+    """Take turns getting a record from each of several iterables until all of them are exhausted.
+
+    If the iterables produce their records in separate threads, like with :func:`iter_pipelined`, this keeps all of
+    them parsing at once instead of one after the other.
+
+    :param iter[iter[dict]] record_iterables: The records of several sources
+    :rtype: iter[dict]
+    """
+    iterators = deque(iter(records) for records in record_iterables)
+
+    try:
+        while iterators:
+            iterator = iterators.popleft()
+
+            try:
+                record = next(iterator)
+            except StopIteration:
+                continue
+
+            iterators.append(iterator)
+            yield record
+
+    finally:  # stops the threads of the iterables that were not exhausted
+        for iterator in iterators:
+            if hasattr(iterator, 'close'):
+                iterator.close()
@@ -1,9 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from pybel.resources.definitions import get_bel_resource, write_namespace
+from pybel.resources.definitions import write_namespace
 
 from pybel.constants import NAMESPACE_DOMAIN_CHEMICAL, NAMESPACE_DOMAIN_OTHER
-from .constants import ONTOLOGY_NAMESPACES
 from .manager import Manager
 
 
@@ -60,52 +59,3 @@ def write_hmdb_disease_ns(file=None, values=None, connection=None):
         functions='O',
         file=file
     )
-
-
-def construct_hmdb_disease_mapping(connection=None):
-    """
-    This function is depricated. The mappings are already in the disease table in the database.
-    Function constructs a mapping of hmdb disease names to actually useful ontologies.
-
-    :param str connection: Connection string to connect manager to a database. Can also directly be a manager.
-    :return: 1. Dictionary with the mappings from HMDB to the other ontologies. Consists of 3 dictionaries, one for each ontology. In those dictionaries the keys are the HMDB terms and they map to the corresponding ontology terms.
-        2. Number of HMDB diseases that could not be mapped to any of the other ontologies
-    :rtype: dict, int
-    """
-
-    def check_ns(doid_path, terms):
-        """
-        download and extract values from an BEL namespace and create a mapping from the terms to the BEL namespaces,
-        if the terms occur in the namespace.
-
-        :param str doid_path: the URL the namespace which should be checked
-        :param terms: a list of terms which should be searched for in the namespace
-        and that will be mapped to the namespace
-        :rtype doid_mapping: dict
-        :rtype hmdb_diseases: list
-        """
-        doid_ns = get_bel_resource(doid_path)
-        doid_values = {value.lower(): value for value in doid_ns['Values']}
-        doid_mapping = {}
-        i = 0
-        while i < len(terms):
-            d_lower = terms[i].lower()
-            if d_lower in doid_values:
-                doid_mapping[terms.pop(i)] = doid_values[d_lower]
-                i -= 1
-            i += 1
-        return doid_mapping, terms
-
-    m = Manager.ensure(connection)
-    hmdb_diseases = m.get_hmdb_diseases()
-
-    mapping = {}
-    for ontology, url in ONTOLOGY_NAMESPACES.items():
-        # check if disease name exists in the ontology
-        mapping[ontology], hmdb_diseases = check_ns(url, hmdb_diseases)
-
-        if not hmdb_diseases:
-            break
-    unmapped = len(hmdb_diseases)
-
-    return mapping, unmapped
@@ -9,6 +9,7 @@ from bio2bel_hmdb.manager import Manager
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 text_xml_path = os.path.join(dir_path, 'test_data.xml')
+text_xml_path2 = os.path.join(dir_path, 'test_data2.xml')
 
 
 class DatabaseMixin(unittest.TestCase):
@@ -31,3 +32,30 @@ class DatabaseMixin(unittest.TestCase):
         cls.manager.session.close()
         os.close(cls.fd)
         os.remove(cls.path)
+
+
+def make_temporary_manager(test_case, **kwargs):
+    """Create a manager of an empty temporary database, which is closed and deleted after the test even if it fails.
+
+    :param unittest.TestCase test_case: The test that uses the database
+    :param kwargs: Keyword arguments for the manager
+    :rtype: Manager
+    """
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    test_case.addCleanup(os.remove, path)
+
+    manager = Manager('sqlite:///' + path, **kwargs)
+    test_case.addCleanup(manager.session.close)
+    manager.create_all()
+
+    return manager
+
+
+class TemporaryDatabaseMixin(unittest.TestCase):
+    """Create an empty database for each test."""
+
+    def setUp(self):
+        """Create a manager of an empty temporary database"""
+        self.manager = make_temporary_manager(self)
+        self.connection = self.manager.connection
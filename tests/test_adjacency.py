@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import numpy as np
+from pybel import BELGraph
+from pybel.dsl import Abundance, Pathology, Protein as ProteinNode
+
+from bio2bel_hmdb.adjacency import NODES, RELATIONS, AdjacencyIndex
+from bio2bel_hmdb.enrich import (
+    enrich_diseases_metabolites, enrich_metabolites_diseases, enrich_metabolites_proteins, enrich_proteins_metabolites,
+)
+from bio2bel_hmdb.lookup_cache import Snapshot
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Metabolite, MetaboliteProtein, Protein
+from tests.constants import DatabaseMixin, TemporaryDatabaseMixin, text_xml_path
+
+
+def _get_key(instance, node_type):
+    return getattr(instance, NODES[node_type][1])
+
+
+class TestAdjacencyIndex(DatabaseMixin):
+    """Tests for the CSR arrays of the relations of the metabolites."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = AdjacencyIndex.from_session(cls.manager.session)
+
+    def test_neighbors(self):
+        """Test that the neighbors of each metabolite are the ones of its relationships, in the same order."""
+        for relation, (_, node_type, _) in RELATIONS.items():
+            for metabolite in self.manager.session.query(Metabolite):
+                self.assertEqual(
+                    [
+                        _get_key(getattr(association, node_type), node_type)
+                        for association in sorted(getattr(metabolite, relation), key=lambda association: association.id)
+                    ],
+                    self.index.get_neighbors(relation, metabolite.accession),
+                    msg=relation,
+                )
+
+        self.assertIsNone(self.index.get_neighbors('proteins', 'HMDB99999'))
+        self.assertIn('P50440', self.index.get_neighbors('proteins', 'HMDB00008'))
+
+    def test_reverse_neighbors(self):
+        """Test that the metabolites of each other node are the ones of its relationship, in the same order."""
+        for relation, (model, node_type, _) in RELATIONS.items():
+            node_model = NODES[node_type][0]
+            for node in self.manager.session.query(node_model):
+                key = _get_key(node, node_type)
+                if key is None:
+                    continue
+
+                self.assertEqual(
+                    [
+                        association.metabolite.accession
+                        for other in self.manager.session.query(node_model).order_by(node_model.id)
+                        if _get_key(other, node_type) == key
+                        for association in sorted(
+                            self.manager.session.query(model).filter(getattr(model, node_type) == other),
+                            key=lambda association: association.id,
+                        )
+                    ],
+                    self.index.get_neighbors(relation, key, reverse=True),
+                    msg=relation,
+                )
+
+        self.assertEqual(['HMDB00064', 'HMDB00064', 'HMDB00072', 'HMDB00072'],
+                         self.index.get_neighbors('diseases', 'Lung Cancer', reverse=True))
+
+    def test_queries(self):
+        """Test that the queries give snapshots with the same values as the ones of the manager."""
+        interactions = self.index.query_metabolites_associated_diseases(['HMDB00072', 'HMDB99999'])
+        self.assertIsNone(interactions['HMDB99999'])
+        self.assertTrue(all(isinstance(interaction, Snapshot) for interaction in interactions['HMDB00072']))
+        self.assertEqual(
+            [
+                (interaction.id, interaction.disease.name, interaction.disease.omim_id, interaction.reference.pubmed_id)
+                for interaction in self.manager.query_metabolite_associated_diseases('HMDB00072')
+            ],
+            [
+                (interaction.id, interaction.disease.name, interaction.disease.omim_id, interaction.reference.pubmed_id)
+                for interaction in interactions['HMDB00072']
+            ],
+        )
+
+        self.assertEqual(
+            [
+                (interaction.id, interaction.metabolite.serialize_to_bel(), interaction.protein.protein_type)
+                for interaction in self.manager.query_protein_associated_metabolites('P50440')
+            ],
+            [
+                (interaction.id, interaction.metabolite.serialize_to_bel(), interaction.protein.protein_type)
+                for interaction in self.index.query_proteins_associated_metabolites(['P50440'])['P50440']
+            ],
+        )
+
+    def test_save_load(self):
+        """Test that a saved index is loaded with the same arrays, memory-mapped or not."""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.index.save(path)
+            for mmap in (True, False):
+                index = AdjacencyIndex.load(path, mmap=mmap)
+                self.assertEqual(sorted(self.index.arrays), sorted(index.arrays))
+                for name, array in self.index.arrays.items():
+                    self.assertEqual(array.dtype, index.arrays[name].dtype, msg=name)
+                    self.assertTrue(np.array_equal(array, index.arrays[name]), msg=name)
+                self.assertEqual(
+                    self.index.get_neighbors('proteins', 'P50440', reverse=True),
+                    index.get_neighbors('proteins', 'P50440', reverse=True),
+                )
+        finally:
+            os.remove(path)
+
+        self.assertRaises(ValueError, AdjacencyIndex.load, text_xml_path)
+
+    def test_enrich(self):
+        """Test that enriching with the index gives the same graph as enriching with the database."""
+        graphs = []
+        for build in (False, True):
+            manager = Manager(self.connection)
+            if build:
+                manager.build_adjacency_index()
+
+            graph = BELGraph()
+            for accession in ('HMDB00008', 'HMDB00064', 'HMDB00072', 'HMDB99999'):
+                graph.add_node_from_data(Abundance('HMDB', accession))
+            graph.add_node_from_data(ProteinNode('UP', 'P50440'))
+            graph.add_node_from_data(Pathology('HMDB_D', 'Lung Cancer'))
+
+            enrich_metabolites_proteins(graph, manager)
+            enrich_metabolites_diseases(graph, manager)
+            enrich_proteins_metabolites(graph, manager)
+            enrich_diseases_metabolites(graph, manager)
+            graphs.append(sorted(graph.edges(data=True), key=str))
+            manager.session.close()
+
+        self.assertTrue(graphs[0])
+        self.assertEqual(graphs[0], graphs[1])
+
+
+class TestAdjacencyIndexOrder(TemporaryDatabaseMixin):
+    """Tests for the order of the neighbors in both directions."""
+
+    def test_relation_order(self):
+        """Test that the neighbors are in the order of the relation rows, not of the positions of the nodes."""
+        protein = Protein(uniprot_id='P00001', protein_accession='HMDBP00001', name='', protein_type='')
+        for accession in ('HMDB00002', 'HMDB00001'):
+            metabolite = Metabolite(accession=accession, version='1', creation_date='', update_date='',
+                                    chemical_formula='')
+            self.manager.session.add(MetaboliteProtein(metabolite=metabolite, protein=protein))
+        self.manager.session.commit()
+
+        index = self.manager.build_adjacency_index()
+        self.assertEqual(
+            [interaction.metabolite.accession for interaction in protein.metabolites],
+            index.get_neighbors('proteins', 'P00001', reverse=True),
+        )
+        self.assertEqual(['HMDB00002', 'HMDB00001'], index.get_neighbors('proteins', 'P00001', reverse=True))
+        self.assertEqual(
+            [interaction.id for interaction in protein.metabolites],
+            [interaction.id for interaction in index.query_proteins_associated_metabolites(['P00001'])['P00001']],
+        )
+
+
+class TestAdjacencyIndexInvalidation(TemporaryDatabaseMixin):
+    """Tests for dropping the adjacency index of the manager when the database changes."""
+
+    def test_populate(self):
+        """Test that an index of the empty database is dropped by populating it."""
+        index = self.manager.build_adjacency_index()
+        self.assertIsNone(index.get_neighbors('proteins', 'HMDB00008'))
+
+        self.manager.populate(text_xml_path, map_dis=False)
+        self.assertIsNone(self.manager.adjacency_index)
+        self.assertIn('P50440', self.manager.build_adjacency_index().get_neighbors('proteins', 'HMDB00008'))
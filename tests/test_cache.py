@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bio2bel_hmdb.cache import (
+    cache_records, get_record_cache_path, get_source_hash, iter_cached_records, write_records,
+)
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.parser import iter_records
+from tests.constants import text_xml_path
+
+
+class TestRecordCache(unittest.TestCase):
+    """Tests for caching the parsed records."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Test that the cached records are the parsed ones."""
+        path = cache_records(text_xml_path, directory=self.directory)
+
+        self.assertEqual(get_record_cache_path(text_xml_path, directory=self.directory), path)
+        self.assertEqual(list(iter_records(text_xml_path)), list(iter_cached_records(path)))
+
+    def test_key(self):
+        """Test that the cache is keyed by the content of the source."""
+        source = os.path.join(self.directory, 'hmdb_metabolites.xml')
+        shutil.copyfile(text_xml_path, source)
+        path = get_record_cache_path(source, directory=self.directory)
+
+        self.assertEqual(get_record_cache_path(text_xml_path, directory=self.directory), path)
+
+        with open(source, 'a') as file:
+            file.write('\n')
+
+        self.assertNotEqual(get_record_cache_path(source, directory=self.directory), path)
+
+    def test_hash_once(self):
+        """Test that the hash of a source is only computed again once it changes."""
+        source = os.path.join(self.directory, 'hmdb_metabolites.xml')
+        shutil.copyfile(text_xml_path, source)
+        source_hash = get_source_hash(source, directory=self.directory)
+
+        with mock.patch('bio2bel_hmdb.cache.get_sha256', side_effect=AssertionError('read the source')):
+            self.assertEqual(source_hash, get_source_hash(source, directory=self.directory))
+
+        with open(source, 'a') as file:
+            file.write('\n')
+
+        with mock.patch('bio2bel_hmdb.cache.get_sha256', return_value='changed') as get_sha256:
+            self.assertEqual('changed', get_source_hash(source, directory=self.directory))
+        get_sha256.assert_called_once_with(source)
+
+    def test_download_hash(self):
+        """Test that the hash stored with a download is used instead of reading the source."""
+        source = os.path.join(self.directory, 'hmdb_metabolites.xml')
+        shutil.copyfile(text_xml_path, source)
+        with open(source + '.json', 'w') as file:
+            json.dump({'url': 'http://example.com', 'size': os.path.getsize(source), 'sha256': 'downloaded'}, file)
+
+        with mock.patch('bio2bel_hmdb.cache.get_sha256', side_effect=AssertionError('read the source')):
+            self.assertEqual('downloaded', get_source_hash(source, directory=self.directory))
+            self.assertEqual(
+                os.path.join(self.directory, 'records-downloaded.bin'),
+                get_record_cache_path(source, directory=self.directory),
+            )
+
+    def test_interrupted(self):
+        """Test that no cache is left behind when the records are not all consumed."""
+        path = get_record_cache_path(text_xml_path, directory=self.directory)
+
+        records = write_records(iter_records(text_xml_path), path)
+        next(records)
+        records.close()
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_truncated(self):
+        """Test that a truncated cache is detected."""
+        path = cache_records(text_xml_path, directory=self.directory)
+        with open(path, 'r+b') as file:
+            file.truncate(os.path.getsize(path) - 1)
+
+        self.assertRaises(ValueError, list, iter_cached_records(path))
+
+    def test_populate(self):
+        """Test that a population writes the cache and the following ones read it instead of parsing."""
+        fd, path = tempfile.mkstemp()
+        manager = Manager('sqlite:///' + path)
+        manager.create_all()
+
+        manager.populate(text_xml_path, map_dis=False, cache=True, cache_directory=self.directory)
+        self.assertTrue(os.path.exists(get_record_cache_path(text_xml_path, directory=self.directory)))
+        summary = manager.summarize()
+
+        manager.drop_all()
+        manager.create_all()
+
+        with mock.patch('bio2bel_hmdb.manager.iter_records', side_effect=AssertionError('parsed the .xml file')):
+            manager.populate(text_xml_path, map_dis=False, cache=True, cache_directory=self.directory)
+
+        self.assertEqual(summary, manager.summarize())
+
+        manager.session.close()
+        os.close(fd)
+        os.remove(path)
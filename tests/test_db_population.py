@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
 import tempfile
 import unittest
 from collections import defaultdict
+from xml.etree.ElementTree import ParseError
 
+from bio2bel_hmdb.engines import etree
+from bio2bel_hmdb.loader import get_loader
 from bio2bel_hmdb.manager import Manager
 from bio2bel_hmdb.models import Metabolite
-from tests.constants import DatabaseMixin, text_xml_path
+from bio2bel_hmdb.parser import get_dataset, iter_records, set_dataset
+from tests.constants import DatabaseMixin, TemporaryDatabaseMixin, make_temporary_manager, text_xml_path
+
+
+def _get_associations(manager):
+    return {
+        metabolite.accession: (
+            metabolite.name,
+            sorted(synonym.synonym for synonym in metabolite.synonyms),
+            sorted(interaction.protein.protein_accession for interaction in metabolite.proteins),
+            sorted(interaction.tissue.tissue for interaction in metabolite.tissues),
+            sorted(
+                (interaction.disease.name, interaction.reference.reference_text)
+                for interaction in metabolite.diseases
+            ),
+        )
+        for metabolite in manager.session.query(Metabolite)
+    }
 
 
 class TestBuildDB(DatabaseMixin):
@@ -158,3 +179,324 @@ class TestDiseaseMapping(unittest.TestCase):
 
         for entry in lc_entries.values():
             self.assertEqual("lung cancer", entry.disease.dion)
+
+
+class TestParallelPopulation(DatabaseMixin):
+    """Tests for populating the database with records parsed in several processes."""
+
+    def test_populate_parallel(self):
+        """Test that parsing in several processes gives the same database."""
+        manager = make_temporary_manager(self)
+        manager.populate(text_xml_path, map_dis=False, processes=2)
+
+        self.assertEqual(self.manager.summarize(), manager.summarize())
+        self.assertEqual(self.manager.get_hmdb_accession(), manager.get_hmdb_accession())
+
+
+class TestPipelinedPopulation(DatabaseMixin):
+    """Tests for populating the database while parsing in a separate thread."""
+
+    def test_populate_pipelined(self):
+        """Test that parsing in a separate thread gives the same database."""
+        manager = make_temporary_manager(self)
+        manager.populate(text_xml_path, map_dis=False, queue_depth=1)
+
+        self.assertEqual(self.manager.summarize(), manager.summarize())
+        self.assertEqual(self.manager.get_hmdb_accession(), manager.get_hmdb_accession())
+
+
+class TestEnginePopulation(DatabaseMixin):
+    """Tests for populating the database with each of the parser engines."""
+
+    def _test_engine(self, engine):
+        manager = make_temporary_manager(self)
+        manager.populate(text_xml_path, map_dis=False, engine=engine)
+
+        self.assertEqual(self.manager.summarize(), manager.summarize())
+        self.assertEqual(_get_associations(self.manager), _get_associations(manager))
+
+    def test_populate_stdlib(self):
+        """Test populating with the engine of the standard library."""
+        self._test_engine('stdlib')
+
+    @unittest.skipIf(etree is None, 'lxml is not installed')
+    def test_populate_lxml(self):
+        """Test populating with the lxml engine."""
+        self._test_engine('lxml')
+
+
+class TestProfilePopulation(DatabaseMixin):
+    """Tests for populating the database with an ingest profile."""
+
+    def test_populate_bel_core(self):
+        """Test that only the proteins and the diseases are loaded with the metabolites."""
+        manager = make_temporary_manager(self)
+        manager.populate(text_xml_path, map_dis=False, profile='bel-core')
+
+        summary = self.manager.summarize()
+        summary.update(tissues=0, references=8)
+        self.assertEqual(summary, manager.summarize())
+
+        metabolite = manager.get_metabolite_by_accession('HMDB00072')
+        self.assertEqual([], metabolite.synonyms)
+        self.assertEqual([], metabolite.pathways)
+        self.assertEqual(
+            [interaction.protein.protein_accession for interaction in self.manager.get_metabolite_by_accession(
+                'HMDB00072').proteins],
+            [interaction.protein.protein_accession for interaction in metabolite.proteins],
+        )
+
+
+class TestSubsetPopulation(TemporaryDatabaseMixin):
+    """Tests for populating the database with a subset of the metabolites."""
+
+    def test_populate_accessions(self):
+        """Test loading the metabolites with the given accessions."""
+        self.manager.populate(text_xml_path, map_dis=False, accessions=['HMDB00072', 'HMDB00008'])
+        self.assertEqual(['HMDB00008', 'HMDB00072'], self.manager.get_hmdb_accession())
+        associations = _get_associations(self.manager)
+
+        self.manager.drop_all()
+        self.manager.create_all()
+        self.manager.populate(text_xml_path, map_dis=False)
+
+        expected = _get_associations(self.manager)
+        del expected['HMDB00064']
+        self.assertEqual(expected, associations)
+
+    def test_populate_limit(self):
+        """Test loading the first metabolites."""
+        self.manager.populate(text_xml_path, map_dis=False, limit=2)
+        self.assertEqual(['HMDB00008', 'HMDB00064'], self.manager.get_hmdb_accession())
+
+    def test_populate_sample(self):
+        """Test loading every n-th metabolite, in parallel too."""
+        self.manager.populate(text_xml_path, map_dis=False, sample=2)
+        self.assertEqual(['HMDB00008', 'HMDB00072'], self.manager.get_hmdb_accession())
+
+        self.manager.drop_all()
+        self.manager.create_all()
+
+        self.manager.populate(text_xml_path, map_dis=False, sample=2, processes=1)
+        self.assertEqual(['HMDB00008', 'HMDB00072'], self.manager.get_hmdb_accession())
+
+
+class TestDistributedPopulation(DatabaseMixin):
+    """Tests for populating the database with several workers that each load a part of the shards."""
+
+    def setUp(self):
+        self.worker_manager = make_temporary_manager(self)
+
+    def test_populate_distributed(self):
+        """Test that worker processes with one metabolite per shard give the same database."""
+        count = self.worker_manager.populate_distributed(text_xml_path, workers=2, map_dis=False, shard_size=1)
+
+        self.assertEqual(3, count)
+        self.assertEqual(self.manager.summarize(), self.worker_manager.summarize())
+        self.assertEqual(_get_associations(self.manager), _get_associations(self.worker_manager))
+        self.assertEqual(1, self.worker_manager.count_datasets())
+
+    def test_populate_worker(self):
+        """Test that the workers load disjoint parts that add up to all metabolites."""
+        counts = [
+            self.worker_manager.populate_worker(text_xml_path, worker=worker, workers=3, shard_size=1)
+            for worker in range(3)
+        ]
+
+        self.assertEqual([1, 1, 1], counts)
+        self.assertEqual(_get_associations(self.manager), _get_associations(self.worker_manager))
+        self.assertRaises(ValueError, self.worker_manager.populate_worker, text_xml_path, worker=3, workers=3)
+
+
+class TestResume(TemporaryDatabaseMixin):
+    """Tests for resuming an interrupted population."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'hmdb_metabolites.xml')
+
+    def test_resume(self):
+        """Test that a population that failed in the third metabolite continues after the second one."""
+        with open(text_xml_path) as file:
+            content = file.read()
+
+        # cut the file in the middle of the last metabolite
+        with open(self.source, 'w') as file:
+            file.write(content[:content.index('<accession>HMDB00072')])
+
+        # load like populate does, since its wrapper from bio2bel hides the error
+        loader = get_loader(self.manager.session, group_size=1, checkpoint_source=self.source)
+        records = set_dataset(iter_records(self.source, engine='stdlib'), get_dataset(self.source))
+        with self.assertRaises(ParseError):
+            for record in records:
+                loader.add(record)
+
+        self.assertEqual(2, loader.commit_count)
+        self.assertEqual(['HMDB00008', 'HMDB00064'], self.manager.get_hmdb_accession())
+
+        checkpoint = self.manager.get_checkpoint(self.source)
+        self.assertIsNotNone(checkpoint)
+        self.assertEqual('HMDB00064', checkpoint.accession)
+        self.assertEqual(2, checkpoint.record_count)
+
+        with open(self.source, 'w') as file:
+            file.write(content)
+
+        self.manager.populate(self.source, map_dis=False, resume=True)
+        self.assertEqual(['HMDB00008', 'HMDB00064', 'HMDB00072'], self.manager.get_hmdb_accession())
+        self.assertEqual(6, self.manager.count_proteins())
+        self.assertEqual(11, self.manager.count_references())
+        self.assertEqual(3, self.manager.count_diseases())
+
+        checkpoint = self.manager.get_checkpoint(self.source)
+        self.assertEqual('HMDB00072', checkpoint.accession)
+        self.assertEqual(3, checkpoint.record_count)
+
+
+class TestUpdate(TemporaryDatabaseMixin):
+    """Tests for updating a populated database with a new release."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'hmdb_metabolites.xml')
+
+        with open(text_xml_path) as file:
+            self.content = file.read()
+
+    def _write_source(self, content):
+        with open(self.source, 'w') as file:
+            file.write(content)
+
+    def _remove_metabolite(self, content, accession):
+        start = content.rindex('<metabolite>', 0, content.index('<accession>{}'.format(accession)))
+        end = content.index('</metabolite>', start) + len('</metabolite>\n')
+        return content[:start] + content[end:]
+
+    def test_update(self):
+        """Test that an update inserts new metabolites, rewrites changed ones and deletes retired ones."""
+        self._write_source(self._remove_metabolite(self.content, 'HMDB00072'))
+        self.manager.populate(self.source, map_dis=False)
+        self.assertEqual(['HMDB00008', 'HMDB00064'], self.manager.get_hmdb_accession())
+
+        content = self._remove_metabolite(self.content, 'HMDB00008')
+        content = content.replace('<update_date>2017-07-19 16:32:14 UTC</update_date>',
+                                  '<update_date>2018-01-01 00:00:00 UTC</update_date>')
+        content = content.replace('<name>Creatine</name>', '<name>Creatine (updated)</name>')
+        self._write_source(content)
+
+        counts = self.manager.update(self.source, map_dis=False, delete_retired=True)
+        self.assertEqual({'inserted': 1, 'updated': 1, 'unchanged': 0, 'retired': 1}, counts)
+        self.assertEqual(['HMDB00064', 'HMDB00072'], self.manager.get_hmdb_accession())
+        self.assertEqual('Creatine (updated)', self.manager.get_metabolite_by_accession('HMDB00064').name)
+
+        expected_manager = make_temporary_manager(self)
+        expected_manager.populate(self.source, map_dis=False)
+        self.assertEqual(_get_associations(expected_manager), _get_associations(self.manager))
+
+        counts = self.manager.update(self.source, map_dis=False)
+        self.assertEqual({'inserted': 0, 'updated': 0, 'unchanged': 2, 'retired': 0}, counts)
+
+    def test_update_keep_retired(self):
+        """Test that retired metabolites are kept by default."""
+        self.manager.populate(text_xml_path, map_dis=False)
+
+        self._write_source(self._remove_metabolite(self.content, 'HMDB00008'))
+        counts = self.manager.update(self.source, map_dis=False)
+
+        self.assertEqual({'inserted': 0, 'updated': 0, 'unchanged': 2, 'retired': 1}, counts)
+        self.assertEqual(['HMDB00008', 'HMDB00064', 'HMDB00072'], self.manager.get_hmdb_accession())
+
+
+class TestMultipleSources(TemporaryDatabaseMixin):
+    """Tests for populating the database from several sources at once."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'sweat_metabolites.xml')
+
+        with open(text_xml_path) as file:
+            content = file.read()
+
+        start = content.rindex('<metabolite>', 0, content.index('<accession>HMDB00008'))
+        end = content.index('</metabolite>', start) + len('</metabolite>\n')
+        with open(self.source, 'w') as file:
+            file.write(content[:start] + content[end:])
+
+    def _get_datasets(self):
+        return {
+            metabolite.accession: sorted(relation.dataset.name for relation in metabolite.datasets)
+            for metabolite in self.manager.session.query(Metabolite)
+        }
+
+    def test_populate_sources(self):
+        """Test that the metabolites of several sources are loaded once and related to each of their datasets."""
+        self.manager.populate([text_xml_path, self.source], map_dis=False)
+
+        self.assertEqual(['HMDB00008', 'HMDB00064', 'HMDB00072'], self.manager.get_hmdb_accession())
+        self.assertEqual(2, self.manager.count_datasets())
+        self.assertEqual(
+            {
+                'HMDB00008': ['test_data'],
+                'HMDB00064': ['sweat_metabolites', 'test_data'],
+                'HMDB00072': ['sweat_metabolites', 'test_data'],
+            },
+            self._get_datasets(),
+        )
+
+        expected_manager = make_temporary_manager(self)
+        expected_manager.populate(text_xml_path, map_dis=False)
+        self.assertEqual(_get_associations(expected_manager), _get_associations(self.manager))
+
+    def test_populate_single_source(self):
+        """Test that the metabolites of a single source are related to its dataset."""
+        self.manager.populate(self.source, map_dis=False)
+
+        self.assertEqual({'HMDB00064': ['sweat_metabolites'], 'HMDB00072': ['sweat_metabolites']}, self._get_datasets())
+
+    def test_update_keeps_other_datasets(self):
+        """Test that an update keeps the datasets of the other sources and relates all metabolites to its own."""
+        self.manager.populate([text_xml_path, self.source], map_dis=False)
+
+        with open(text_xml_path) as file:
+            content = file.read()
+        release = os.path.join(self.directory, 'hmdb_release.xml')
+        with open(release, 'w') as file:
+            file.write(content.replace(
+                '<update_date>2017-07-19 16:32:14 UTC</update_date>',
+                '<update_date>2018-01-01 00:00:00 UTC</update_date>',
+            ))
+
+        counts = self.manager.update(release, map_dis=False)
+
+        self.assertEqual(1, counts['updated'])
+        self.assertEqual(
+            {
+                'HMDB00008': ['hmdb_release', 'test_data'],
+                'HMDB00064': ['hmdb_release', 'sweat_metabolites', 'test_data'],
+                'HMDB00072': ['hmdb_release', 'sweat_metabolites', 'test_data'],
+            },
+            self._get_datasets(),
+        )
+
+    def test_update_keeps_datasets(self):
+        """Test that the rewritten metabolites of an update are related to the dataset again."""
+        self.manager.populate(self.source, map_dis=False)
+
+        with open(self.source) as file:
+            content = file.read()
+        with open(self.source, 'w') as file:
+            file.write(content.replace(
+                '<update_date>2017-07-19 16:32:14 UTC</update_date>',
+                '<update_date>2018-01-01 00:00:00 UTC</update_date>',
+            ))
+
+        counts = self.manager.update(self.source, map_dis=False)
+
+        self.assertEqual(1, counts['updated'])
+        self.assertEqual({'HMDB00064': ['sweat_metabolites'], 'HMDB00072': ['sweat_metabolites']}, self._get_datasets())
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from bio2bel_hmdb import parser
+from bio2bel_hmdb.parser import check_data, download_data, get_sha256
+
+CONTENT = bytes(range(256)) * 400
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the content of the server with ETag, conditional and range requests."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        etag = '"{}"'.format(server.version)
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        if 'Range' in self.headers and self.headers.get('If-Range', etag) == etag:
+            start = int(self.headers['Range'][len('bytes='):-1])
+
+        if start >= len(server.content):
+            self.send_response(416)
+            self.end_headers()
+            return
+
+        self.send_response(206 if start else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(server.content) - start))
+        if start:
+            size = len(server.content)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, size - 1, size))
+        self.end_headers()
+
+        body = server.content[start:]
+        if server.truncate:
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownload(unittest.TestCase):
+    """Tests for downloading the data from a local server."""
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.content = CONTENT
+        self.server.version = 1
+        self.server.truncate = False
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.url = 'http://127.0.0.1:{}/hmdb_metabolites.zip'.format(self.server.server_port)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'hmdb_metabolites.zip')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _download(self, **kwargs):
+        return download_data(url=self.url, path=self.path, **kwargs)
+
+    def _read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def test_download(self):
+        """Test that the download records its checksum and is not repeated."""
+        self.assertEqual(self.path, self._download())
+        self.assertEqual(CONTENT, self._read())
+        self.assertTrue(check_data(self.path))
+
+        with open(self.path + '.json') as file:
+            metadata = json.load(file)
+        self.assertEqual(get_sha256(self.path), metadata['sha256'])
+        self.assertEqual('"1"', metadata['etag'])
+
+        self._download()
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_conditional(self):
+        """Test that a forced download only transfers the file if it changed."""
+        self._download()
+        self._download(force_download=True)
+
+        self.assertEqual('"1"', self.server.requests[-1]['If-None-Match'])
+        self.assertEqual(CONTENT, self._read())
+
+        self.server.content = CONTENT[::-1]
+        self.server.version = 2
+        self._download(force_download=True)
+
+        self.assertEqual(CONTENT[::-1], self._read())
+
+    def test_resume(self):
+        """Test that an interrupted download is continued with a range request."""
+        self.server.truncate = True
+        with mock.patch.object(parser, 'DOWNLOAD_BLOCK_SIZE', 1024):
+            self.assertRaises(IOError, self._download)
+        self.assertFalse(os.path.exists(self.path))
+
+        received = os.path.getsize(self.path + '.part')
+        self.assertLess(0, received)
+
+        self.server.truncate = False
+        self._download()
+
+        self.assertEqual('bytes={}-'.format(received), self.server.requests[-1]['Range'])
+        self.assertEqual('"1"', self.server.requests[-1]['If-Range'])
+        self.assertEqual(CONTENT, self._read())
+        self.assertTrue(check_data(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_resume_changed(self):
+        """Test that a partial download of an outdated version is started again."""
+        self.server.truncate = True
+        with mock.patch.object(parser, 'DOWNLOAD_BLOCK_SIZE', 1024):
+            self.assertRaises(IOError, self._download)
+
+        self.server.truncate = False
+        self.server.content = CONTENT[::-1]
+        self.server.version = 2
+        self._download()
+
+        self.assertEqual(CONTENT[::-1], self._read())
+
+    def test_corrupt(self):
+        """Test that a corrupt file is detected and downloaded again."""
+        self._download()
+
+        with open(self.path, 'r+b') as file:
+            file.truncate(len(CONTENT) - 1)
+        self.assertFalse(check_data(self.path))
+
+        self._download()
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(CONTENT, self._read())
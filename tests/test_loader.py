@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import unittest
+
+from sqlalchemy import MetaData
+from sqlalchemy.exc import IntegrityError
+
+from bio2bel_hmdb.loader import (
+    COPY_NULL, TABLES, Loader, PostgresLoader, UpsertLoader, _strip_constraints, format_copy_rows, get_loader,
+    get_missing_indexes, sqlite_fast_load,
+)
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Base, Metabolite, MetaboliteSynonym, Tissue
+from bio2bel_hmdb.parser import iter_records, iter_worker_records
+from tests.constants import TemporaryDatabaseMixin, text_xml_path
+
+POSTGRES_CONNECTION = os.environ.get('BIO2BEL_HMDB_TEST_POSTGRES')
+
+
+class TestLoader(TemporaryDatabaseMixin):
+    """Tests for the bulk insert loader."""
+
+    def _load(self, **kwargs):
+        loader = Loader(self.manager.session, **kwargs)
+        for record in iter_records(text_xml_path):
+            loader.add(record)
+        loader.commit()
+        return loader
+
+    def test_commit_every_record(self):
+        """Test that the transaction is committed after every group of records and once at the end."""
+        loader = self._load(group_size=2)
+        self.assertEqual(2, loader.commit_count)
+        self.assertEqual(3, loader.record_count)
+        self.assertEqual(3, self.manager.count_metabolites())
+
+    def test_commit_by_size(self):
+        """Test that the transaction is committed once enough data is written."""
+        loader = self._load(group_megabytes=0)
+        self.assertEqual(4, loader.commit_count)
+        self.assertEqual(3, self.manager.count_metabolites())
+
+    def test_continue_ids(self):
+        """Test that a new loader continues the primary keys after the existing rows."""
+        self._load()
+        loader = Loader(self.manager.session)
+        self.assertEqual(4, loader.next_ids[Metabolite.__table__])
+
+
+class TestUpsertLoader(TemporaryDatabaseMixin):
+    """Tests for loading with several loaders that share the values of the shared tables through the database."""
+
+    def test_shared_values(self):
+        """Test that a loader reuses the values that another loader inserted first."""
+        other_manager = Manager(self.connection)
+        loaders = [UpsertLoader(self.manager.session), UpsertLoader(other_manager.session)]
+
+        for worker, loader in enumerate(loaders):
+            for record in iter_worker_records(text_xml_path, worker=worker, workers=2, shard_size=1):
+                loader.add(record)
+        for loader in loaders:
+            loader.commit()
+
+        self.assertEqual([2, 1], [loader.record_count for loader in loaders])
+        self.assertEqual(3, self.manager.count_metabolites())
+        self.assertEqual(11, self.manager.count_references())
+        self.assertEqual(6, self.manager.count_proteins())
+        self.assertEqual(3, self.manager.count_diseases())
+
+        tissue_ids = dict(self.manager.session.query(Tissue.tissue, Tissue.id))
+        for loader in loaders:
+            self.assertLessEqual(loader.ids[Tissue.__table__].items(), tissue_ids.items())
+
+        other_manager.session.close()
+
+    def test_batches(self):
+        """Test that the buffered records are committed every batch."""
+        loader = UpsertLoader(self.manager.session, batch_size=2)
+        for record in iter_records(text_xml_path):
+            loader.add(record)
+        self.assertEqual(1, loader.commit_count)
+        self.assertEqual(2, self.manager.count_metabolites())
+
+        loader.commit()
+        self.assertEqual(3, self.manager.count_metabolites())
+
+
+class TestSqliteFastLoad(TemporaryDatabaseMixin):
+    """Tests for bulk loading into SQLite with deferred indexes."""
+
+    def test_fast_load(self):
+        """Test that fast loading gives the same database with unique indexes instead of constraints."""
+        self.manager.populate(text_xml_path, map_dis=False, fast_load=True)
+
+        self.assertEqual(3, self.manager.count_metabolites())
+        self.assertEqual(11, self.manager.count_references())
+        self.assertEqual(6, self.manager.count_proteins())
+
+        index_names = {
+            name
+            for name, in self.manager.engine.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+        self.assertIn('uq_hmdb_metaboliteSynonym_synonym', index_names)
+        self.assertIn('uq_hmdb_reference_reference_text', index_names)
+        self.assertIn('ix_hmdb_metabolite_protein_protein', index_names)
+
+        synonym = self.manager.session.query(MetaboliteSynonym).first()
+        self.manager.session.add(MetaboliteSynonym(synonym=synonym.synonym))
+        self.assertRaises(IntegrityError, self.manager.session.commit)
+        self.manager.session.rollback()
+
+        synchronous = self.manager.engine.execute('PRAGMA synchronous').scalar()
+        self.assertEqual(2, synchronous)  # FULL is the default
+
+    def test_failed_load(self):
+        """Test that the unique indexes are built and the pragmas are restored if the load fails."""
+        with self.assertRaises(RuntimeError):
+            with sqlite_fast_load(self.manager.engine) as session:
+                loader = Loader(session)
+                loader.add(next(iter_records(text_xml_path)))
+                loader.commit()
+                raise RuntimeError('truncated file')
+
+        self.assertEqual(1, self.manager.count_metabolites())
+        self.assertEqual([], get_missing_indexes(self.manager.engine))
+
+        synonym = self.manager.session.query(MetaboliteSynonym).first()
+        self.manager.session.add(MetaboliteSynonym(synonym=synonym.synonym))
+        self.assertRaises(IntegrityError, self.manager.session.commit)
+        self.manager.session.rollback()
+
+        synchronous = self.manager.engine.execute('PRAGMA synchronous').scalar()
+        self.assertEqual(2, synchronous)
+
+
+class TestIndexes(TemporaryDatabaseMixin):
+    """Tests for adding the indexes to a database created without them."""
+
+    def setUp(self):
+        super().setUp()
+        self.manager.populate(text_xml_path, map_dis=False)
+
+        self.indexes = [
+            index
+            for table in Base.metadata.sorted_tables
+            for index in table.indexes
+        ]
+        for index in self.indexes:
+            index.drop(self.manager.engine)
+
+    def test_create_indexes(self):
+        """Test that the missing indexes are created once and the data is kept."""
+        self.assertEqual(len(self.indexes), len(get_missing_indexes(self.manager.engine)))
+
+        names = self.manager.create_indexes()
+        self.assertEqual(sorted(index.name for index in self.indexes), sorted(names))
+        self.assertEqual([], get_missing_indexes(self.manager.engine))
+        self.assertEqual([], self.manager.create_indexes())
+
+        self.assertEqual(3, self.manager.count_metabolites())
+        interactions = self.manager.query_protein_associated_metabolites('P50440')
+        self.assertIn('HMDB00008', {interaction.metabolite.accession for interaction in interactions})
+
+    def test_unique_indexes(self):
+        """Test that the unique indexes are created for the tables that were recreated without their unique
+        constraints, like by a fast load that failed before building them.
+        """
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            table.tometadata(metadata)
+        _strip_constraints(metadata)
+
+        tables = [metadata.tables[table.name] for table in TABLES]
+        metadata.drop_all(self.manager.engine, tables=tables)
+        metadata.create_all(self.manager.engine, tables=tables)
+        self.manager.populate(text_xml_path, map_dis=False)
+
+        names = {index.name for index in get_missing_indexes(self.manager.engine)}
+        self.assertIn('uq_hmdb_metaboliteSynonym_synonym', names)
+        self.assertIn('uq_hmdb_reference_reference_text', names)
+        self.assertNotIn('uq_hmdb_biofunction_biofunction', names)  # not recreated
+
+        self.assertEqual(sorted(names), sorted(self.manager.create_indexes()))
+        self.assertEqual([], get_missing_indexes(self.manager.engine))
+
+        synonym = self.manager.session.query(MetaboliteSynonym).first()
+        self.manager.session.add(MetaboliteSynonym(synonym=synonym.synonym))
+        self.assertRaises(IntegrityError, self.manager.session.commit)
+        self.manager.session.rollback()
+
+    def test_fast_load(self):
+        """Test that fast loading into a populated database without the indexes creates the ones of its tables."""
+        with sqlite_fast_load(self.manager.engine):
+            pass
+
+        missing_tables = {index.table for index in get_missing_indexes(self.manager.engine)}
+        self.assertTrue(missing_tables)
+        self.assertFalse(missing_tables.intersection(TABLES))
+
+
+def _parse_copy_value(value):
+    """Parse a value in the text format of PostgreSQL's COPY."""
+    if value == COPY_NULL:
+        return None
+    return re.sub(r'\\(.)', lambda match: {'t': '\t', 'n': '\n', 'r': '\r'}.get(match.group(1), match.group(1)), value)
+
+
+class SqliteCopyLoader(PostgresLoader):
+    """A stand-in for the COPY loader that reads the formatted rows back and inserts them into SQLite."""
+
+    def _copy(self, table, file):
+        rows = [
+            [_parse_copy_value(value) for value in line.rstrip('\n').split('\t')]
+            for line in file
+        ]
+        Loader._write(self, table, rows)
+
+    def _reset_sequences(self):
+        pass
+
+
+class TestCopyLoader(TemporaryDatabaseMixin):
+    """Tests for loading with PostgreSQL's COPY."""
+
+    def test_format_copy_rows(self):
+        """Test escaping values and writing NULL."""
+        lines = list(format_copy_rows([(1, 'a\tb', None), (2, 'c\\d\ne', '')]))
+        self.assertEqual(['1\ta\\tb\t\\N\n', '2\tc\\\\d\\ne\t\n'], lines)
+        self.assertEqual('c\\d\ne', _parse_copy_value(lines[1].split('\t')[1]))
+
+    def test_get_loader(self):
+        """Test that the generic loader is used for SQLite."""
+        self.assertIs(Loader, type(get_loader(self.manager.session)))
+
+    def test_copy_stand_in(self):
+        """Test that the rows formatted for COPY give the same database."""
+        loader = SqliteCopyLoader(self.manager.session)
+        for record in iter_records(text_xml_path):
+            loader.add(record)
+        loader.commit()
+
+        self.assertEqual(3, self.manager.count_metabolites())
+        self.assertEqual(11, self.manager.count_references())
+        self.assertEqual(3, self.manager.count_diseases())
+
+        metabolite = self.manager.get_metabolite_by_accession('HMDB00008')
+        self.assertEqual('AFENDNXGAFYKQO-UHFFFAOYSA-N', metabolite.inchikey)
+        self.assertIsNone(metabolite.drugbank_id)
+
+
+@unittest.skipUnless(POSTGRES_CONNECTION, 'set BIO2BEL_HMDB_TEST_POSTGRES to a PostgreSQL connection string')
+class TestPostgresLoader(unittest.TestCase):
+    """Tests for loading into a local PostgreSQL database with COPY."""
+
+    def setUp(self):
+        self.manager = Manager(POSTGRES_CONNECTION)
+        self.manager.drop_all()
+        self.manager.create_all()
+
+    def tearDown(self):
+        self.manager.session.close()
+        self.manager.drop_all()
+
+    def test_populate(self):
+        """Test populating with COPY and inserting a row with the sequences afterwards."""
+        self.assertIsInstance(get_loader(self.manager.session), PostgresLoader)
+
+        self.manager.populate(text_xml_path, map_dis=False)
+        self.assertEqual(3, self.manager.count_metabolites())
+        self.assertEqual(11, self.manager.count_references())
+
+        self.manager.session.add(Metabolite(
+            accession='HMDB99999',
+            version='1',
+            creation_date='',
+            update_date='',
+            chemical_formula='',
+        ))
+        self.manager.session.commit()
+        self.assertEqual(4, self.manager.count_metabolites())
+
+
+@unittest.skipUnless(POSTGRES_CONNECTION, 'set BIO2BEL_HMDB_TEST_POSTGRES to a PostgreSQL connection string')
+class TestPostgresUpsertLoader(unittest.TestCase):
+    """Tests for loading into a local PostgreSQL database with several worker processes."""
+
+    def setUp(self):
+        self.manager = Manager(POSTGRES_CONNECTION)
+        self.manager.drop_all()
+        self.manager.create_all()
+
+    def tearDown(self):
+        self.manager.session.close()
+        self.manager.drop_all()
+
+    def test_populate_distributed(self):
+        """Test populating with a worker process for each metabolite and inserting a row afterwards."""
+        self.assertEqual(3, self.manager.populate_distributed(text_xml_path, workers=3, map_dis=False, shard_size=1))
+        self.assertEqual(3, self.manager.count_metabolites())
+        self.assertEqual(11, self.manager.count_references())
+        self.assertEqual(3, self.manager.count_diseases())
+
+        self.manager.session.add(Tissue(tissue='Spleen (new)'))
+        self.manager.session.commit()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pybel import BELGraph
+from pybel.dsl import Abundance
+
+from bio2bel_hmdb.enrich import enrich_metabolites_diseases, enrich_metabolites_proteins
+from bio2bel_hmdb.lookup_cache import CacheInfo, LookupCache, Snapshot, make_snapshot
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Metabolite
+from tests.constants import DatabaseMixin, make_temporary_manager, text_xml_path, text_xml_path2
+from tests.test_queries import count_statements
+
+
+class FakeTimer(object):
+    """A clock that only moves when it is told to."""
+
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestLookupCache(unittest.TestCase):
+    """Tests for the eviction and the counters of the lookup cache."""
+
+    def test_lru(self):
+        """Test that the least recently used entry is evicted once the cache is full."""
+        cache = LookupCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(CacheInfo(hits=3, misses=1, maxsize=2, currsize=2), cache.info())
+
+    def test_ttl(self):
+        """Test that entries expire after the time to live."""
+        timer = FakeTimer()
+        cache = LookupCache(maxsize=10, ttl=5, timer=timer)
+        cache.set('a', 1)
+
+        timer.time = 4.9
+        self.assertEqual(1, cache.get('a'))
+        timer.time = 5
+        self.assertEqual('expired', cache.get('a', 'expired'))
+        self.assertEqual(0, len(cache))
+
+    def test_clear(self):
+        """Test that clearing removes the entries but keeps the counters until they are reset."""
+        cache = LookupCache()
+        cache.set('a', None)
+        self.assertIsNone(cache.get('a', 'missing'))
+        cache.clear()
+
+        self.assertEqual('missing', cache.get('a', 'missing'))
+        self.assertEqual((1, 1), cache.info()[:2])
+        cache.reset_info()
+        self.assertEqual((0, 0), cache.info()[:2])
+
+    def test_invalid(self):
+        """Test that the size and the time to live must be positive."""
+        self.assertRaises(ValueError, LookupCache, maxsize=0)
+        self.assertRaises(ValueError, LookupCache, ttl=0)
+
+
+class TestSnapshot(DatabaseMixin):
+    """Tests for the immutable copies of the instances of the models."""
+
+    def test_snapshot(self):
+        """Test that a snapshot has the values and the methods of the instance, but not its other relationships."""
+        metabolite = self.manager.session.query(Metabolite).filter(Metabolite.accession == 'HMDB00072').one()
+        snapshot = make_snapshot(metabolite, [('proteins', 'protein')])
+
+        self.assertIsInstance(snapshot, Snapshot)
+        self.assertEqual(metabolite.name, snapshot.name)
+        self.assertEqual(metabolite.serialize_to_bel(), snapshot.serialize_to_bel())
+        self.assertEqual(repr(metabolite), repr(snapshot))
+        self.assertIsInstance(snapshot.proteins, tuple)
+        self.assertEqual(
+            sorted(interaction.protein.uniprot_id for interaction in metabolite.proteins),
+            sorted(interaction.protein.uniprot_id for interaction in snapshot.proteins),
+        )
+
+        self.assertRaises(AttributeError, getattr, snapshot, 'diseases')
+        self.assertRaises(AttributeError, getattr, snapshot.proteins[0], 'metabolite')
+        with self.assertRaises(AttributeError):
+            snapshot.name = 'changed'
+
+        self.assertEqual(make_snapshot(metabolite), snapshot)
+        self.assertEqual(1, len({make_snapshot(metabolite), snapshot}))
+
+
+class TestManagerLookupCache(unittest.TestCase):
+    """Tests for the lookup cache of the manager."""
+
+    def setUp(self):
+        self.manager = make_temporary_manager(self, lookup_cache_size=100)
+        self.manager.populate(text_xml_path, map_dis=False)
+        self.uncached_manager = Manager(self.manager.connection)
+        self.addCleanup(self.uncached_manager.session.close)
+
+    def test_hits(self):
+        """Test that repeated lookups are answered from the cache, including the ones of missing keys."""
+        accessions = ['HMDB00072', 'HMDB99999']
+        self.manager.query_metabolites_associated_proteins(accessions)
+
+        with count_statements(self.manager.engine) as statements:
+            interactions = self.manager.query_metabolites_associated_proteins(accessions)
+            self.manager.query_metabolite_associated_proteins('HMDB00072')
+
+        self.assertEqual([], statements)
+        self.assertIsNone(interactions['HMDB99999'])
+        self.assertEqual(CacheInfo(hits=3, misses=2, maxsize=100, currsize=2), self.manager.get_lookup_cache_info())
+
+        with count_statements(self.manager.engine) as statements:
+            self.manager.query_metabolites_associated_proteins(['HMDB00072', 'HMDB00008'])
+        self.assertEqual(2, len(statements))  # only the missing accession is looked up
+
+    def test_snapshots(self):
+        """Test that the results are snapshots with the same values as the instances."""
+        metabolite = self.manager.get_metabolite_by_accession('HMDB00072')
+        self.assertIsInstance(metabolite, Snapshot)
+        self.assertIs(metabolite, self.manager.get_metabolites_by_accessions(['HMDB00072'])['HMDB00072'])
+        self.assertIsNone(self.uncached_manager.get_lookup_cache_info())
+
+        instance = self.uncached_manager.get_metabolite_by_accession('HMDB00072')
+        self.assertEqual(
+            sorted((interaction.disease.name, interaction.reference.pubmed_id) for interaction in instance.diseases),
+            sorted((interaction.disease.name, interaction.reference.pubmed_id) for interaction in metabolite.diseases),
+        )
+        self.assertEqual(
+            {interaction.metabolite.accession for interaction in instance.references},
+            {interaction.metabolite.accession for interaction in metabolite.references},
+        )
+
+        interactions = self.manager.query_protein_associated_metabolites('P50440')
+        self.assertIsInstance(interactions, tuple)
+        self.assertEqual(
+            sorted(interaction.metabolite.accession for interaction in interactions),
+            sorted(interaction.metabolite.accession for interaction in
+                   self.uncached_manager.query_protein_associated_metabolites('P50440')),
+        )
+
+    def test_enrich(self):
+        """Test that enriching with snapshots gives the same graph as enriching with the instances."""
+        graphs = []
+        for manager in (self.manager, self.uncached_manager, self.manager):
+            graph = BELGraph()
+            for accession in ('HMDB00008', 'HMDB00064', 'HMDB00072'):
+                graph.add_node_from_data(Abundance('HMDB', accession))
+
+            enrich_metabolites_proteins(graph, manager)
+            enrich_metabolites_diseases(graph, manager)
+            graphs.append(sorted(graph.edges(data=True), key=str))
+
+        self.assertTrue(graphs[0])
+        self.assertEqual(graphs[1], graphs[0])
+        self.assertEqual(graphs[1], graphs[2])
+
+    def test_invalidate(self):
+        """Test that populating and dropping the database clear the cache."""
+        self.manager.get_metabolites_by_accessions(['HMDB00072', 'HMDB0000001'])
+        self.assertEqual(2, self.manager.get_lookup_cache_info().currsize)
+
+        self.manager.populate(text_xml_path2, map_dis=False)
+        self.assertEqual(0, self.manager.get_lookup_cache_info().currsize)
+        self.assertIsNotNone(self.manager.get_metabolite_by_accession('HMDB0000001'))
+
+        self.manager.drop_all()
+        self.assertEqual(0, self.manager.get_lookup_cache_info().currsize)
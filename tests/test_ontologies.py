@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+from unittest import mock
+
+from bio2bel_hmdb import ontologies
+from bio2bel_hmdb.constants import DOID, HP, MESHD, ONTOLOGY_NAMESPACES
+from bio2bel_hmdb.manager import Manager
+from bio2bel_hmdb.models import Disease
+from bio2bel_hmdb.ontologies import get_ontology_locations, load_disease_ontologies
+from tests.constants import text_xml_path
+
+NAMESPACE_TEMPLATE = """[Namespace]
+Keyword={keyword}
+
+[Processing]
+DelimiterString=|
+
+[Values]
+{values}
+"""
+
+NAMESPACE_VALUES = {
+    DOID: ['lung cancer', 'schizophrenia'],
+    HP: ['Schizophrenia', 'Cirrhosis'],
+    MESHD: ['Lung Neoplasms'],
+}
+
+
+def _write_namespace(path, ontology, values=None):
+    with open(path, 'w') as file:
+        file.write(NAMESPACE_TEMPLATE.format(
+            keyword=ontology,
+            values='\n'.join('{}|O'.format(value) for value in values or NAMESPACE_VALUES[ontology]),
+        ))
+
+
+class TestOntologyCache(unittest.TestCase):
+    """Tests for loading the disease ontologies from local files and caches."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = tempfile.mkdtemp()
+
+        for ontology in NAMESPACE_VALUES:
+            _write_namespace(os.path.join(self.directory, '{}.belns'.format(ontology)), ontology)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.cache_directory)
+
+    def test_locations(self):
+        """Test finding the namespaces in a directory."""
+        self.assertEqual(ONTOLOGY_NAMESPACES, get_ontology_locations())
+        self.assertEqual(
+            {ontology: os.path.join(self.directory, '{}.belns'.format(ontology)) for ontology in NAMESPACE_VALUES},
+            get_ontology_locations(self.directory),
+        )
+        self.assertRaises(ValueError, get_ontology_locations, self.cache_directory)
+        self.assertRaises(ValueError, get_ontology_locations, {'go': 'go.belns'})
+
+    def test_directory(self):
+        """Test loading the namespaces from a directory."""
+        disease_ontologies = load_disease_ontologies(self.directory, cache_directory=self.cache_directory)
+
+        self.assertEqual({'lung cancer': 'lung cancer', 'schizophrenia': 'schizophrenia'}, disease_ontologies[DOID])
+        self.assertEqual({'schizophrenia': 'Schizophrenia', 'cirrhosis': 'Cirrhosis'}, disease_ontologies[HP])
+        self.assertEqual({'lung neoplasms': 'Lung Neoplasms'}, disease_ontologies[MESHD])
+
+    def test_changed_file(self):
+        """Test that the cache of a local file is not used after the file changed."""
+        path = os.path.join(self.directory, '{}.belns'.format(HP))
+        load_disease_ontologies({HP: path}, cache_directory=self.cache_directory)
+
+        _write_namespace(path, HP, ['Cirrhosis'])
+        disease_ontologies = load_disease_ontologies({HP: path}, cache_directory=self.cache_directory)
+
+        self.assertEqual({'cirrhosis': 'Cirrhosis'}, disease_ontologies[HP])
+
+    def test_offline(self):
+        """Test that the cached namespaces of URLs are not fetched again."""
+        contents = {}
+        for ontology, url in ONTOLOGY_NAMESPACES.items():
+            with open(os.path.join(self.directory, '{}.belns'.format(ontology)), 'rb') as file:
+                contents[url] = file.read()
+
+        with mock.patch.object(ontologies, '_read_location', side_effect=contents.__getitem__) as read_location:
+            expected = load_disease_ontologies(cache_directory=self.cache_directory)
+            self.assertEqual(3, read_location.call_count)
+
+        with mock.patch.object(ontologies, '_read_location', side_effect=AssertionError('fetched a namespace')):
+            self.assertEqual(expected, load_disease_ontologies(cache_directory=self.cache_directory))
+
+
+class TestOfflineDiseaseMapping(unittest.TestCase):
+    """Tests for mapping the diseases with the namespaces in a directory."""
+
+    def setUp(self):
+        self.fd, self.path = tempfile.mkstemp()
+        self.manager = Manager('sqlite:///' + self.path)
+        self.manager.create_all()
+
+        self.directory = tempfile.mkdtemp()
+        for ontology in NAMESPACE_VALUES:
+            _write_namespace(os.path.join(self.directory, '{}.belns'.format(ontology)), ontology)
+
+    def tearDown(self):
+        self.manager.session.close()
+        os.close(self.fd)
+        os.remove(self.path)
+        shutil.rmtree(self.directory)
+
+    def test_disease_mapping(self):
+        """Test that the diseases are mapped with the local namespaces."""
+        cache_directory = os.path.join(self.directory, 'cache')
+        with mock.patch.object(ontologies, 'ONTOLOGY_CACHE_DIR', cache_directory):
+            self.manager.populate(text_xml_path, ontology_locations=self.directory)
+
+        self.assertEqual(3, len(os.listdir(cache_directory)))
+
+        metabolite = self.manager.get_metabolite_by_accession("HMDB00072")
+        self.assertIsNotNone(metabolite)
+
+        diseases = defaultdict(set)
+        for disease_reference in metabolite.diseases:
+            disease = disease_reference.disease
+            diseases[disease.name].add((disease.dion, disease.hpo, disease.mesh_diseases))
+
+        self.assertEqual({('schizophrenia', 'Schizophrenia', None)}, diseases['Schizophrenia'])
+        self.assertEqual({('lung cancer', None, None)}, diseases['Lung Cancer'])
+
+    def _get_mapping(self, name):
+        disease = self.manager.session.query(Disease).filter(Disease.name == name).one()
+        return disease.dion, disease.hpo, disease.mesh_diseases
+
+    def test_map_diseases(self):
+        """Test mapping the diseases after loading and again with a new version of an ontology."""
+        self.manager.populate(text_xml_path, map_dis=False)
+        self.assertEqual((None, None, None), self._get_mapping('Schizophrenia'))
+
+        cache_directory = os.path.join(self.directory, 'cache')
+        with mock.patch.object(ontologies, 'ONTOLOGY_CACHE_DIR', cache_directory):
+            counts = self.manager.map_diseases(self.directory)
+
+            self.assertEqual({DOID: 2, HP: 2, MESHD: 0}, counts)
+            self.assertEqual(('schizophrenia', 'Schizophrenia', None), self._get_mapping('Schizophrenia'))
+            self.assertEqual((None, 'Cirrhosis', None), self._get_mapping('Cirrhosis'))
+
+            _write_namespace(os.path.join(self.directory, '{}.belns'.format(HP)), HP, ['Cirrhosis'])
+            counts = self.manager.map_diseases(self.directory)
+
+        self.assertEqual({DOID: 2, HP: 1, MESHD: 0}, counts)
+        self.assertEqual(('schizophrenia', None, None), self._get_mapping('Schizophrenia'))
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import xml.etree.ElementTree as ET
+from unittest import mock
+from zipfile import ZipFile
+
+from bio2bel_hmdb.constants import DATA_DIR, SWEAT_PATH, SWEAT_URL
+from bio2bel_hmdb.engines import etree, get_engine
+from bio2bel_hmdb.parser import (
+    PROFILES, SECTION_HANDLERS, ensure_source, get_accession_filter, get_data, get_dataset, get_sections, get_shards,
+    get_skip_tags, iter_interleaved, iter_metabolite_chunks, iter_metabolite_offsets, iter_metabolites, iter_pipelined,
+    iter_records, iter_records_parallel, parse_metabolite, register_section, select_accessions, select_sections,
+    skip_through,
+)
+from tests.constants import text_xml_path, text_xml_path2
+
+HMDB_NAMESPACE = '{http://www.hmdb.ca}'
+
+expected_accessions = ['HMDB00008', 'HMDB00064', 'HMDB00072']
+
+
+def _get_accessions(elements):
+    return [
+        element.find(HMDB_NAMESPACE + 'accession').text
+        for element in elements
+    ]
+
+
+def _assert_offsets(test_case, path, engine=None):
+    records = list(iter_records(path, engine=engine))
+
+    with open(text_xml_path, 'rb') as file:
+        content = file.read()
+
+    starts = [
+        content.find(('<accession>' + accession).encode()) for accession in expected_accessions
+    ]
+    for record, start in zip(records, starts):
+        test_case.assertLessEqual(record['offset'], start)
+
+    for i, record in enumerate(records):
+        resumed = skip_through(iter_records(path, offset=record['offset'], engine=engine), expected_accessions[i])
+        test_case.assertEqual(expected_accessions[i + 1:], [r['metabolite']['accession'] for r in resumed])
+
+
+def _without_offsets(records):
+    return [
+        {key: value for key, value in record.items() if key != 'offset'}
+        for record in records
+    ]
+
+
+class TestParser(unittest.TestCase):
+    """Tests for parsing the HMDB .xml files."""
+
+    def test_get_data(self):
+        """Test parsing the whole tree."""
+        self.assertEqual(expected_accessions, _get_accessions(get_data(text_xml_path).getroot()))
+
+    def test_iter_metabolites(self):
+        """Test that streaming yields the same metabolites as parsing the whole tree."""
+        self.assertEqual(expected_accessions, _get_accessions(iter_metabolites(text_xml_path)))
+
+
+class TestSectionDispatch(unittest.TestCase):
+    """Tests for dispatching the sections of a metabolite element to their handlers."""
+
+    metabolite_xml = (
+        '<metabolite{}>'
+        '<accession>HMDB00008</accession>'
+        '<wikipidia>2-Hydroxybutyric acid</wikipidia>'
+        '<synonyms><synonym>a</synonym><synonym>b</synonym><synonym>a</synonym></synonyms>'
+        '<spectra><spectrum><type>Specdb::MsMs</type></spectrum></spectra>'
+        '<pathways><pathway><name>Propanoate Metabolism</name><smpdb_id /></pathway></pathways>'
+        '</metabolite>'
+    )
+
+    expected_record = {
+        'metabolite': {'accession': 'HMDB00008', 'wikipedia': '2-Hydroxybutyric acid'},
+        'synonyms': ['a', 'b'],
+        'pathways': [{'name': 'Propanoate Metabolism', 'smpdb_id': None}],
+    }
+
+    def test_qualified_tags(self):
+        """Test parsing a metabolite element in the HMDB namespace."""
+        element = ET.fromstring(self.metabolite_xml.format(' xmlns="http://www.hmdb.ca"'))
+        self.assertEqual(self.expected_record, parse_metabolite(element))
+
+    def test_unqualified_tags(self):
+        """Test parsing a metabolite element without a namespace."""
+        element = ET.fromstring(self.metabolite_xml.format(''))
+        self.assertEqual(self.expected_record, parse_metabolite(element))
+
+    def test_register_section(self):
+        """Test that a registered handler is called for its section."""
+        @register_section('spectra')
+        def parse_spectra(record, element):
+            record['spectra'] = [spectrum[0].text for spectrum in element]
+
+        try:
+            element = ET.fromstring(self.metabolite_xml.format(''))
+            self.assertEqual(['Specdb::MsMs'], parse_metabolite(element)['spectra'])
+        finally:
+            skip = SECTION_HANDLERS['taxonomy']
+            SECTION_HANDLERS['spectra'] = SECTION_HANDLERS[HMDB_NAMESPACE + 'spectra'] = skip
+
+
+class TestProfiles(unittest.TestCase):
+    """Tests for parsing only some sections of the metabolites."""
+
+    def test_get_sections(self):
+        """Test getting the sections of a profile."""
+        self.assertEqual(PROFILES['full'], get_sections())
+        self.assertEqual({'proteins', 'diseases'}, get_sections('bel-core'))
+        self.assertEqual({'synonyms'}, get_sections(['synonyms']))
+        self.assertRaises(ValueError, get_sections, 'unknown')
+        self.assertRaises(ValueError, get_sections, ['synonyms', 'spectra'])
+
+    def test_skip_tags(self):
+        """Test that the tags of the sections that are not selected are skipped."""
+        skip_tags = get_skip_tags(get_sections('bel-core'))
+
+        self.assertIn(HMDB_NAMESPACE + 'synonyms', skip_tags)
+        self.assertIn(HMDB_NAMESPACE + 'spectra', skip_tags)
+        self.assertNotIn(HMDB_NAMESPACE + 'protein_associations', skip_tags)
+        self.assertNotIn(HMDB_NAMESPACE + 'wikipidia', skip_tags)
+
+    def _assert_sections(self, engine):
+        sections = get_sections('bel-core')
+        expected = list(select_sections(iter_records(text_xml_path, engine=engine), sections))
+
+        records = list(iter_records(text_xml_path, engine=engine, sections=sections))
+
+        self.assertEqual(expected, records)
+        self.assertTrue(all(set(record) <= {'metabolite', 'offset', 'proteins', 'diseases'} for record in records))
+
+        parallel_records = list(iter_records_parallel(text_xml_path, processes=1, engine=engine, sections=sections))
+        for record in expected + parallel_records:  # the serial offsets are only lower bounds
+            del record['offset']
+        self.assertEqual(expected, parallel_records)
+
+    def test_stdlib(self):
+        """Test that only the selected sections are parsed with the standard library engine."""
+        self._assert_sections('stdlib')
+
+    @unittest.skipIf(etree is None, 'lxml is not installed')
+    def test_lxml(self):
+        """Test that only the selected sections are parsed with the lxml engine."""
+        self._assert_sections('lxml')
+
+    def test_cleared(self):
+        """Test that the standard library engine clears the skipped elements before the metabolites are yielded."""
+        skip_tags = get_skip_tags(get_sections('minimal'))
+
+        for _, element in iter_metabolite_offsets(text_xml_path, engine='stdlib', skip_tags=skip_tags):
+            skipped = [sub_element for sub_element in element if sub_element.tag in skip_tags]
+            self.assertTrue(skipped)
+            self.assertFalse(any(len(sub_element) for sub_element in skipped))
+
+
+class TestSubset(unittest.TestCase):
+    """Tests for parsing a subset of the metabolites."""
+
+    def test_accession_filter(self):
+        """Test selecting accessions and samples."""
+        self.assertIsNone(get_accession_filter())
+        self.assertRaises(ValueError, get_accession_filter, sample=0)
+
+        accept = get_accession_filter(accessions=['a', 'b', 'c'], sample=2)
+        self.assertEqual([True, False, False, True], [accept(accession) for accession in 'adbc'])
+
+    def _iter_records(self, **kwargs):
+        """Iterate over the records without their offsets, which are only lower bounds while streaming."""
+        for record in iter_records(text_xml_path, **kwargs):
+            del record['offset']
+            yield record
+
+    def _assert_subset(self, engine):
+        records = list(self._iter_records(engine=engine))
+
+        self.assertEqual([records[1]], list(self._iter_records(engine=engine, accessions=['HMDB00064', 'HMDB00461'])))
+        self.assertEqual([records[0], records[2]], list(self._iter_records(engine=engine, sample=2)))
+        self.assertEqual(
+            list(select_accessions(records, accessions=['HMDB00008', 'HMDB00072'], sample=2)),
+            list(self._iter_records(engine=engine, accessions=['HMDB00008', 'HMDB00072'], sample=2)),
+        )
+
+    def test_chunks(self):
+        """Test that the metabolites are cut out of the file independently of the size of the blocks."""
+        with open(text_xml_path, 'rb') as file:
+            chunks = list(iter_metabolite_chunks(file))
+            self.assertEqual(expected_accessions, [accession for _, accession, _ in chunks])
+
+            file.seek(0)
+            self.assertEqual(chunks, list(iter_metabolite_chunks(file, block_size=7)))
+
+    def test_offsets(self):
+        """Test that the offsets of the subset are the positions of the metabolites."""
+        with open(text_xml_path, 'rb') as file:
+            content = file.read()
+
+        for record in iter_records(text_xml_path, sample=1):
+            self.assertTrue(content.startswith(b'<metabolite>', record['offset']))
+
+    def test_stdlib(self):
+        """Test that the standard library engine only yields the subset."""
+        self._assert_subset('stdlib')
+
+    @unittest.skipIf(etree is None, 'lxml is not installed')
+    def test_lxml(self):
+        """Test that the lxml engine only yields the subset."""
+        self._assert_subset('lxml')
+
+    def test_cleared(self):
+        """Test that the metabolites that are not in the subset are never converted."""
+        with mock.patch('bio2bel_hmdb.parser.parse_metabolite', wraps=parse_metabolite) as parse:
+            records = list(iter_records(text_xml_path, accessions=['HMDB00064']))
+
+        self.assertEqual(1, len(records))
+        self.assertEqual(1, parse.call_count)
+
+    def test_stop(self):
+        """Test that the parsing stops once all the accessions were found."""
+        accessions = []
+
+        def accept(accession):
+            accessions.append(accession)
+            return True
+
+        with mock.patch('bio2bel_hmdb.parser.get_accession_filter', return_value=accept):
+            records = list(iter_records(text_xml_path, accessions=['HMDB00008']))
+
+        self.assertEqual(['HMDB00008'], [record['metabolite']['accession'] for record in records])
+        self.assertEqual(['HMDB00008'], accessions)
+
+
+class TestCompressedSources(unittest.TestCase):
+    """Tests for reading compressed HMDB files without extracting them."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_zip(self):
+        """Test streaming the .xml member out of a zip archive."""
+        path = os.path.join(self.directory, 'hmdb_metabolites.zip')
+        with ZipFile(path, 'w') as zip_file:
+            zip_file.write(text_xml_path, arcname='hmdb_metabolites.xml')
+
+        self.assertEqual(expected_accessions, _get_accessions(iter_metabolites(path)))
+        self.assertEqual(expected_accessions, _get_accessions(get_data(path).getroot()))
+
+    def test_gzip(self):
+        """Test streaming a gzipped .xml file."""
+        path = os.path.join(self.directory, 'hmdb_metabolites.xml.gz')
+        with open(text_xml_path, 'rb') as source, gzip.open(path, 'wb') as file:
+            shutil.copyfileobj(source, file)
+
+        self.assertEqual(expected_accessions, _get_accessions(iter_metabolites(path)))
+        self.assertEqual(expected_accessions, _get_accessions(get_data(path).getroot()))
+
+
+class TestParallelParser(unittest.TestCase):
+    """Tests for parsing the HMDB .xml files in several processes."""
+
+    def test_shards(self):
+        """Test that the shards cover all metabolites and start at metabolite start tags."""
+        header, footer, shards = get_shards(text_xml_path, shard_size=1000)
+
+        self.assertTrue(header.rstrip().endswith(b'<hmdb xmlns="http://www.hmdb.ca">'))
+        self.assertEqual(b'</hmdb>', footer.strip())
+        self.assertEqual(3, len(shards))
+
+        with open(text_xml_path, 'rb') as file:
+            for start, end in shards:
+                file.seek(start)
+                self.assertTrue(file.read(end - start).startswith(b'<metabolite>'))
+
+    def test_iter_records_parallel(self):
+        """Test that parsing in several processes gives the same records in the same order."""
+        records = list(iter_records(text_xml_path))
+        self.assertEqual(expected_accessions, [record['metabolite']['accession'] for record in records])
+
+        parallel_records = list(iter_records_parallel(text_xml_path, processes=2, shard_size=1000))
+        self.assertEqual(_without_offsets(records), _without_offsets(parallel_records))
+
+        with open(text_xml_path, 'rb') as file:
+            content = file.read()
+
+        for record in parallel_records:  # the offsets of the parallel parser are exact
+            self.assertEqual(b'<metabolite>', content[record['offset']:record['offset'] + len(b'<metabolite>')])
+
+
+class TestPipeline(unittest.TestCase):
+    """Tests for parsing in a separate thread."""
+
+    def test_iter_pipelined(self):
+        """Test that the records are passed through the queue in order."""
+        records = list(iter_records(text_xml_path))
+        self.assertEqual(records, list(iter_pipelined(iter_records(text_xml_path), batch_size=2, queue_depth=1)))
+
+    def test_exception(self):
+        """Test that an exception in the parser thread is raised in the consumer."""
+
+        def fail():
+            yield from range(3)
+            raise ValueError
+
+        pipeline = iter_pipelined(fail(), batch_size=1)
+        self.assertEqual([0, 1, 2], list(itertools.islice(pipeline, 3)))
+        self.assertRaises(ValueError, list, pipeline)
+
+    def test_stop(self):
+        """Test that the parser thread stops when the consumer stops early."""
+        pipeline = iter_pipelined(itertools.count(), batch_size=10, queue_depth=1)
+        self.assertEqual(0, next(pipeline))
+        pipeline.close()
+        self.assertFalse(any(thread.name == 'hmdb-parser' for thread in threading.enumerate()))
+
+
+class TestSources(unittest.TestCase):
+    """Tests for reading several sources."""
+
+    def test_get_dataset(self):
+        """Test naming the datasets of the sources."""
+        self.assertEqual('hmdb_metabolites', get_dataset()['name'])
+        self.assertEqual('sweat_metabolites', get_dataset('sweat_metabolites')['name'])
+        self.assertEqual({'name': 'sweat_metabolites', 'source': '/data/sweat_metabolites.xml.gz'},
+                         get_dataset('/data/sweat_metabolites.xml.gz'))
+        self.assertEqual('csf_metabolites', get_dataset('http://www.hmdb.ca/downloads/csf_metabolites.zip')['name'])
+
+    def test_ensure_source(self):
+        """Test that the sweat dataset is downloaded to its path, and the files of other URLs to the data directory."""
+        with mock.patch('bio2bel_hmdb.parser.download_data', side_effect=lambda **kwargs: kwargs['path']):
+            self.assertEqual(SWEAT_PATH, ensure_source('sweat_metabolites'))
+            self.assertEqual(SWEAT_PATH, ensure_source(SWEAT_URL))
+            self.assertEqual(os.path.join(DATA_DIR, 'csf_metabolites.zip'),
+                             ensure_source('http://www.hmdb.ca/downloads/csf_metabolites.zip'))
+
+        self.assertEqual(text_xml_path, ensure_source(text_xml_path))
+
+    def test_iter_interleaved(self):
+        """Test that the iterables take turns until all of them are exhausted."""
+        self.assertEqual([0, 'a', 1, 'b', 2, 'c', 'd'], list(iter_interleaved([range(3), 'abcd'])))
+
+    def test_stop(self):
+        """Test that the parser threads stop when the consumer stops early."""
+        records = iter_interleaved(
+            iter_pipelined(itertools.count(), batch_size=10, queue_depth=1)
+            for _ in range(2)
+        )
+        self.assertEqual([0, 0], list(itertools.islice(records, 2)))
+        records.close()
+        self.assertFalse(any(thread.name == 'hmdb-parser' for thread in threading.enumerate()))
+
+
+class TestOffsets(unittest.TestCase):
+    """Tests for starting to parse in the middle of a file."""
+
+    def _test_offsets(self, path):
+        _assert_offsets(self, path)
+
+    def test_offsets(self):
+        """Test that starting at the offset of a record continues at or before that record."""
+        self._test_offsets(text_xml_path)
+
+    def test_offsets_gzip(self):
+        """Test that the offsets are positions in the uncompressed file."""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'hmdb_metabolites.xml.gz')
+        with open(text_xml_path, 'rb') as source, gzip.open(path, 'wb') as file:
+            shutil.copyfileobj(source, file)
+
+        self._test_offsets(path)
+        shutil.rmtree(directory)
+
+    def test_skip_through_missing(self):
+        """Test that skipping to a missing accession fails."""
+        self.assertRaises(ValueError, list, skip_through(iter_records(text_xml_path), 'HMDB99999'))
+
+
+class TestEngines(unittest.TestCase):
+    """Tests for parsing with each of the parser engines."""
+
+    def test_get_engine(self):
+        """Test choosing the engines."""
+        self.assertEqual('stdlib' if etree is None else 'lxml', get_engine().name)
+        self.assertEqual('stdlib', get_engine('stdlib').name)
+        engine = get_engine('stdlib')
+        self.assertIs(engine, get_engine(engine))
+        self.assertRaises(ValueError, get_engine, 'sax')
+
+    def _test_engine(self, engine):
+        for path in (text_xml_path, text_xml_path2):
+            records = _without_offsets(iter_records(path, engine='stdlib'))
+            self.assertEqual(records, _without_offsets(iter_records(path, engine=engine)))
+            self.assertEqual(records, _without_offsets(iter_records_parallel(path, processes=2, engine=engine)))
+
+        self.assertEqual(expected_accessions, _get_accessions(get_data(text_xml_path, engine=engine).getroot()))
+        self.assertEqual(expected_accessions, _get_accessions(iter_metabolites(text_xml_path, engine=engine)))
+
+    def test_stdlib(self):
+        """Test the engine of the standard library."""
+        self._test_engine('stdlib')
+        _assert_offsets(self, text_xml_path, engine='stdlib')
+
+    @unittest.skipIf(etree is None, 'lxml is not installed')
+    def test_lxml(self):
+        """Test that the lxml engine gives the same records as the engine of the standard library."""
+        self._test_engine('lxml')
+        _assert_offsets(self, text_xml_path, engine='lxml')
+
+    @unittest.skipIf(etree is None, 'lxml is not installed')
+    def test_lxml_clears_siblings(self):
+        """Test that the lxml engine removes the metabolites that were consumed from the tree."""
+        elements = list(iter_metabolites(text_xml_path, engine='lxml'))
+        for element in elements[:-1]:
+            self.assertIsNone(element.getparent())
+            self.assertEqual(0, len(element))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import io
+from contextlib import contextmanager, redirect_stdout
+
+from pybel import BELGraph
+from pybel.dsl import Abundance
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from bio2bel_hmdb.enrich import enrich_metabolites_diseases, enrich_metabolites_proteins
+from bio2bel_hmdb.models import MetaboliteDiseaseReference
+from bio2bel_hmdb.to_bel import write_metabolites_diseases_bel, write_metabolites_proteins_bel
+from tests.constants import DatabaseMixin
+
+ACCESSIONS = ['HMDB00072', 'HMDB00008', 'HMDB99999', 'HMDB00064', 'HMDB00072']
+
+
+@contextmanager
+def count_statements(engine):
+    """Count the SQL statements that are executed with an engine."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class TestBatchQueries(DatabaseMixin):
+    """Tests for looking up many keys at once."""
+
+    def setUp(self):
+        self.manager.session.expunge_all()  # nothing is loaded from the identity map
+
+    def test_metabolites(self):
+        """Test that the metabolites are keyed by accession in the order of the accessions."""
+        with count_statements(self.manager.engine) as statements:
+            metabolites = self.manager.get_metabolites_by_accessions(ACCESSIONS, chunk_size=2)
+
+        self.assertEqual(8, len(statements))  # the metabolites, proteins, diseases and references of each chunk
+        self.assertEqual(['HMDB00072', 'HMDB00008', 'HMDB99999', 'HMDB00064'], list(metabolites))
+        self.assertIsNone(metabolites['HMDB99999'])
+        self.assertIs(self.manager.get_metabolite_by_accession('HMDB00008'), metabolites['HMDB00008'])
+
+    def test_metabolites_proteins(self):
+        """Test that the proteins are loaded with two queries for each chunk of metabolites."""
+        with count_statements(self.manager.engine) as statements:
+            interactions = self.manager.query_metabolites_associated_proteins(ACCESSIONS, chunk_size=2)
+            proteins = {
+                accession: sorted(interaction.protein.protein_accession for interaction in accession_interactions)
+                for accession, accession_interactions in interactions.items()
+                if accession_interactions is not None
+            }
+
+        self.assertEqual(4, len(statements))
+        self.assertIsNone(interactions['HMDB99999'])
+        self.assertIn('P50440', {interaction.protein.uniprot_id for interaction in interactions['HMDB00008']})
+        for accession in ('HMDB00008', 'HMDB00064', 'HMDB00072'):
+            metabolite = self.manager.get_metabolite_by_accession(accession)
+            self.assertEqual(
+                sorted(interaction.protein.protein_accession for interaction in metabolite.proteins),
+                proteins[accession],
+            )
+
+    def test_metabolites_diseases(self):
+        """Test that the diseases and their references are loaded with the relations."""
+        with count_statements(self.manager.engine) as statements:
+            interactions = self.manager.query_metabolites_associated_diseases(ACCESSIONS)
+            diseases = {
+                (interaction.disease.name, interaction.reference.pubmed_id)
+                for interaction in interactions['HMDB00072']
+            }
+
+        self.assertEqual(2, len(statements))
+        self.assertIsNone(interactions['HMDB99999'])
+        self.assertIn('Schizophrenia', {name for name, _ in diseases})
+        self.assertIsNone(self.manager.query_metabolite_associated_diseases('HMDB99999'))
+
+    def test_proteins_metabolites(self):
+        """Test that the metabolites of proteins are loaded with the relations."""
+        with count_statements(self.manager.engine) as statements:
+            interactions = self.manager.query_proteins_associated_metabolites(['P50440', 'P99999'])
+            accessions = {interaction.metabolite.accession for interaction in interactions['P50440']}
+
+        self.assertEqual(2, len(statements))
+        self.assertIn('HMDB00008', accessions)
+        self.assertEqual(accessions, {
+            interaction.metabolite.accession
+            for interaction in self.manager.query_protein_associated_metabolites('P50440')
+        })
+        self.assertIsNone(interactions['P99999'])
+
+    def test_diseases_metabolites(self):
+        """Test that the metabolites of diseases are loaded with the relations."""
+        with count_statements(self.manager.engine) as statements:
+            interactions = self.manager.query_diseases_associated_metabolites(['Lung Cancer', 'Unknown'])
+            accessions = {interaction.metabolite.accession for interaction in interactions['Lung Cancer']}
+
+        self.assertEqual(2, len(statements))
+        self.assertIn('HMDB00064', accessions)
+        self.assertEqual(accessions, {
+            interaction.metabolite.accession
+            for interaction in self.manager.session.query(MetaboliteDiseaseReference)
+            if interaction.disease.name == 'Lung Cancer'
+        })
+        self.assertIsNone(interactions['Unknown'])
+
+
+def _traverse(metabolite):
+    """Access the proteins, diseases and references of a metabolite like the enrichment and the BEL export."""
+    return (
+        sorted(interaction.protein.protein_accession for interaction in metabolite.proteins),
+        sorted((interaction.disease.name, interaction.reference.reference_text) for interaction in metabolite.diseases),
+        sorted(interaction.reference.reference_text for interaction in metabolite.references),
+    )
+
+
+class TestLoaderStrategies(DatabaseMixin):
+    """Tests that lock in the number of SQL statements of the query methods and of their callers."""
+
+    def setUp(self):
+        self.manager.session.expunge_all()
+
+    def _count_traversal(self, strategy):
+        with count_statements(self.manager.engine) as statements:
+            metabolite = self.manager.get_metabolite_by_accession('HMDB00072', strategy=strategy)
+            relations = _traverse(metabolite)
+
+        self.manager.session.expunge_all()
+        return len(statements), relations, metabolite
+
+    def test_selectin(self):
+        """Test that a metabolite with its proteins, diseases and references takes four statements by default."""
+        count, relations, _ = self._count_traversal('selectin')
+        self.assertEqual(4, count)
+        self.assertTrue(all(relations))
+
+    def test_joined(self):
+        """Test that joining the relations gives the same result in a single statement."""
+        count, relations, _ = self._count_traversal('joined')
+        self.assertEqual(1, count)
+        self.assertEqual(self._count_traversal('selectin')[1], relations)
+
+    def test_raise(self):
+        """Test that the relations are loaded but any other lazy load raises."""
+        count, relations, metabolite = self._count_traversal('raise')
+        self.assertEqual(4, count)
+        self.assertEqual(self._count_traversal('selectin')[1], relations)
+
+        self.manager.session.add(metabolite)
+        with self.assertRaises(InvalidRequestError):
+            metabolite.synonyms
+        with self.assertRaises(InvalidRequestError):
+            metabolite.proteins[0].protein.metabolites
+
+    def test_unknown_strategy(self):
+        """Test that an unknown strategy is rejected."""
+        self.assertRaises(ValueError, self.manager.get_metabolite_by_accession, 'HMDB00072', strategy='lazy')
+
+    def test_enrich(self):
+        """Test that the enrichment takes a fixed number of statements for any number of metabolites."""
+        graph = BELGraph()
+        for accession in ('HMDB00008', 'HMDB00064', 'HMDB00072'):
+            graph.add_node_from_data(Abundance('HMDB', accession))
+
+        with count_statements(self.manager.engine) as statements:
+            enrich_metabolites_proteins(graph, self.manager)
+            enrich_metabolites_diseases(graph, self.manager)
+
+        self.assertEqual(4, len(statements))
+
+    def test_bel_export(self):
+        """Test that exporting all relations as BEL takes a single statement each."""
+        file = io.StringIO()
+
+        with count_statements(self.manager.engine) as statements, redirect_stdout(io.StringIO()):
+            write_metabolites_proteins_bel(self.manager, file=file)
+        self.assertEqual(1, len(statements))
+
+        with count_statements(self.manager.engine) as statements, redirect_stdout(io.StringIO()):
+            write_metabolites_diseases_bel(self.manager, file=file)
+        self.assertEqual(1, len(statements))